@@ -0,0 +1,275 @@
+"""التحكم في القبول أمام مسار التحليل: حد للتحليلات الجارية، وطابور بمسارين للأولوية.
+
+بلا حد يبدأ كل طلب استدعاءات النماذج فوراً، وفي الذروة يبطؤ الجميع معاً حتى
+تنتهي مهلهم. هنا يعمل limit تحليلاً في وقت واحد، وما زاد ينتظر دوره في مسار
+"interactive" (الواجهة، يُخدم أولاً) أو "bulk" (عملاء API والمهام، لا يتجاوز
+bulk_share من الحد). الطلب الذي يتوقع ألا يكمل قبل مهلته يُرفض فوراً (Rejected،
+ويعيده الخادم 429 مع Retry-After) بدل أن يشغل مكاناً في الطابور ثم يفشل.
+
+الحد يتكيف مع زمن التحليلات المرصود (AIMD): إذا تجاوز متوسطها latency_tolerance
+ضعف زمنها المعتاد فالمزود مزدحم ويُخفض الحد 10%، وإلا يرتفع تدريجياً حتى
+max_concurrency.
+"""
+import asyncio
+import math
+import os
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future, TimeoutError as FutureTimeout
+from contextlib import asynccontextmanager, contextmanager
+from typing import Deque, Dict, Optional
+
+from agents.metrics import metrics
+
+
+# بترتيب الأولوية
+LANES = ("interactive", "bulk")
+# مهلة المسار الافتراضية (deadlines[lane]) ما لم يُمرر غيرها
+LANE_DEADLINE = object()
+
+
+class Rejected(Exception):
+    """طلب لن يكمل قبل مهلته أو طابور مسار ممتلئ؛ retry_after ثوانٍ مقترحة قبل الإعادة"""
+
+    def __init__(self, lane: str, reason: str, retry_after: float):
+        super().__init__(f"{lane} request rejected ({reason}); retry after {retry_after:.0f}s")
+        self.lane = lane
+        self.reason = reason
+        self.retry_after = retry_after
+
+
+class Ticket:
+    """مكان محجوز في الحد؛ release يحرره ويسجل زمن التحليل (مرة واحدة).
+
+    observe=False لتحليل لم يستدع النماذج (خدمته الذاكرة المؤقتة مثلاً): زمنه لا
+    يدل على المزود، فلا يدخل المتوسط ولا الزمن المعتاد.
+    """
+
+    def __init__(self, controller: "AdmissionController", lane: str, waited: float):
+        self.controller = controller
+        self.lane = lane
+        self.waited = waited
+        self._admitted_at = time.monotonic()
+        self._released = False
+
+    def release(self, observe: bool = True) -> None:
+        self.controller._release(self, time.monotonic() - self._admitted_at if observe else None)
+
+
+class _Waiter:
+    def __init__(self, lane: str):
+        self.lane = lane
+        self.future: Future = Future()
+
+
+class AdmissionController:
+    """limit تحليل في وقت واحد وطابور لكل مسار بحد queue_size.
+
+    deadlines: {المسار: ثوانٍ يجب أن يكتمل الطلب قبلها، أو None للانتظار بلا رفض}.
+    initial_latency تقدير زمن التحليل قبل أول قياس.
+    """
+
+    def __init__(
+        self,
+        max_concurrency: int = 16,
+        min_concurrency: int = 2,
+        queue_size: int = 64,
+        bulk_share: float = 0.5,
+        deadlines: Optional[Dict[str, Optional[float]]] = None,
+        latency_tolerance: float = 2.0,
+        initial_latency: float = 10.0,
+        window: int = 100,
+    ):
+        self.max_concurrency = max_concurrency
+        self.min_concurrency = max(1, min(min_concurrency, max_concurrency))
+        self.queue_size = queue_size
+        self.bulk_share = bulk_share
+        self.deadlines = {"interactive": 60.0, "bulk": 300.0, **(deadlines or {})}
+        self.latency_tolerance = latency_tolerance
+        self.limit = float(max_concurrency)
+        self._latency = initial_latency
+        self._samples: Deque[float] = deque(maxlen=window)
+        self._lock = threading.Lock()
+        self._queues: Dict[str, Deque[_Waiter]] = {lane: deque() for lane in LANES}
+        self._running = {lane: 0 for lane in LANES}
+        self._admitted = {lane: 0 for lane in LANES}
+        self._rejected: Dict[str, int] = {}
+
+    @classmethod
+    def from_env(cls) -> Optional["AdmissionController"]:
+        """ADMISSION=off يعطل القبول (None)، و ADMISSION_* تضبط الحد والطابور والمهل"""
+        if os.getenv("ADMISSION", "on").lower() in ("0", "off", "false", "no"):
+            return None
+        interactive = os.getenv("ADMISSION_INTERACTIVE_DEADLINE_SECONDS") or os.getenv("ANALYSIS_DEADLINE_SECONDS")
+        bulk = os.getenv("ADMISSION_BULK_DEADLINE_SECONDS", "300")
+        return cls(
+            max_concurrency=int(os.getenv("ADMISSION_MAX_CONCURRENCY", "16")),
+            min_concurrency=int(os.getenv("ADMISSION_MIN_CONCURRENCY", "2")),
+            queue_size=int(os.getenv("ADMISSION_QUEUE_SIZE", "64")),
+            bulk_share=float(os.getenv("ADMISSION_BULK_SHARE", "0.5")),
+            deadlines={
+                "interactive": float(interactive) if interactive else 60.0,
+                "bulk": float(bulk) if bulk else None,
+            },
+        )
+
+    def lane(self, name: Optional[str], default: str = "bulk") -> str:
+        """اسم مسار صالح من ترويسة أو حقل طلب؛ غير المعروف يأخذ default"""
+        name = (name or "").strip().lower()
+        return name if name in LANES else default
+
+    def acquire(self, lane: str, deadline_seconds=LANE_DEADLINE) -> Ticket:
+        """حجز مكان، بالانتظار في الطابور إن لزم؛ Rejected إن لم يتسع الوقت أو الطابور"""
+        started = time.monotonic()
+        waiter, wait_seconds = self._enqueue(lane, deadline_seconds)
+        if waiter is None:
+            return self._admit(lane, 0.0)
+        try:
+            waiter.future.result(wait_seconds)
+        except FutureTimeout:
+            self._give_up(waiter)
+        return self._admit(lane, time.monotonic() - started)
+
+    async def acquire_async(self, lane: str, deadline_seconds=LANE_DEADLINE) -> Ticket:
+        """مثل acquire لكن الانتظار لا يحجز الحلقة؛ إلغاء المهمة يخرجها من الطابور"""
+        started = time.monotonic()
+        waiter, wait_seconds = self._enqueue(lane, deadline_seconds)
+        if waiter is None:
+            return self._admit(lane, 0.0)
+        try:
+            done, _ = await asyncio.wait({asyncio.wrap_future(waiter.future)}, timeout=wait_seconds)
+        except asyncio.CancelledError:
+            with self._lock:
+                if not waiter.future.cancel():
+                    # قُبل لحظة الإلغاء: المكان يعود لغيره
+                    self._running[lane] -= 1
+                    self._dispatch()
+                else:
+                    self._queues[lane].remove(waiter)
+            raise
+        if not done:
+            self._give_up(waiter)
+        return self._admit(lane, time.monotonic() - started)
+
+    @contextmanager
+    def slot(self, lane: str, deadline_seconds=LANE_DEADLINE):
+        ticket = self.acquire(lane, deadline_seconds)
+        try:
+            yield ticket
+        finally:
+            ticket.release()
+
+    @asynccontextmanager
+    async def slot_async(self, lane: str, deadline_seconds=LANE_DEADLINE):
+        ticket = await self.acquire_async(lane, deadline_seconds)
+        try:
+            yield ticket
+        finally:
+            ticket.release()
+
+    def _enqueue(self, lane: str, deadline_seconds):
+        """(None, None) عند القبول الفوري، وإلا (المنتظر، أقصى ثوانٍ ينتظرها)"""
+        if lane not in self._queues:
+            raise ValueError(f"unknown admission lane {lane!r}; expected one of {LANES}")
+        deadline = self.deadlines.get(lane) if deadline_seconds is LANE_DEADLINE else deadline_seconds
+        with self._lock:
+            ahead = sum(len(self._queues[other]) for other in LANES[:LANES.index(lane) + 1])
+            if not ahead and self._has_room(lane):
+                self._running[lane] += 1
+                return None, None
+            expected_wait = self._expected_wait(ahead + 1)
+            if len(self._queues[lane]) >= self.queue_size:
+                self._reject(lane, "queue_full", expected_wait)
+            # الانتظار ثم التحليل نفسه يجب أن يكتملا قبل المهلة
+            wait_seconds = None if deadline is None else deadline - self._latency
+            if wait_seconds is not None and expected_wait > wait_seconds:
+                self._reject(lane, "deadline", expected_wait)
+            waiter = _Waiter(lane)
+            self._queues[lane].append(waiter)
+        return waiter, wait_seconds
+
+    def _give_up(self, waiter: _Waiter) -> None:
+        """انتهت مهلة الانتظار: إن لم يُقبل في اللحظة نفسها يُرفض"""
+        with self._lock:
+            if not waiter.future.cancel():
+                return
+            self._queues[waiter.lane].remove(waiter)
+            self._reject(waiter.lane, "timeout", self._expected_wait(len(self._queues[waiter.lane]) + 1))
+
+    def _admit(self, lane: str, waited: float) -> Ticket:
+        with self._lock:
+            self._admitted[lane] += 1
+        metrics.admission_wait(lane, waited)
+        return Ticket(self, lane, waited)
+
+    def _reject(self, lane: str, reason: str, expected_wait: float):
+        # يُستدعى والقفل محجوز
+        self._rejected[f"{lane}:{reason}"] = self._rejected.get(f"{lane}:{reason}", 0) + 1
+        metrics.admission_rejected(lane, reason)
+        raise Rejected(lane, reason, max(1.0, math.ceil(expected_wait)))
+
+    def _has_room(self, lane: str) -> bool:
+        limit = max(self.min_concurrency, int(self.limit))
+        if sum(self._running.values()) >= limit:
+            return False
+        # bulk لا يأخذ كل الأماكن: ما بقي محجوز للواجهة
+        return lane != "bulk" or self._running[lane] < max(1, int(limit * self.bulk_share))
+
+    def _expected_wait(self, position: int) -> float:
+        """ثوانٍ تقديرية حتى يبدأ صاحب الموقع position: limit تحليل يكتمل كل متوسط زمن"""
+        limit = max(self.min_concurrency, int(self.limit))
+        return math.ceil(position / limit) * self._latency
+
+    def _dispatch(self) -> None:
+        # يُستدعى والقفل محجوز: قبول المنتظرين بترتيب الأولوية ما اتسع الحد
+        for lane in LANES:
+            queue = self._queues[lane]
+            while queue and self._has_room(lane):
+                waiter = queue.popleft()
+                if waiter.future.set_running_or_notify_cancel():
+                    self._running[lane] += 1
+                    waiter.future.set_result(True)
+
+    def _release(self, ticket: Ticket, seconds: Optional[float]) -> None:
+        with self._lock:
+            if ticket._released:
+                return
+            ticket._released = True
+            self._running[ticket.lane] -= 1
+            if seconds is not None:
+                self._observe(seconds)
+            self._dispatch()
+
+    def _observe(self, seconds: float) -> None:
+        """متوسط زمن التحليل وتكييف الحد حسب ابتعاده عن الزمن المعتاد"""
+        self._samples.append(seconds)
+        self._latency = seconds if len(self._samples) == 1 else 0.8 * self._latency + 0.2 * seconds
+        # الزمن المعتاد: العُشير الأدنى من القياسات الحديثة، أقل تأثراً بطلب سريع شاذ من الأدنى
+        baseline = sorted(self._samples)[len(self._samples) // 10]
+        if self._latency > baseline * self.latency_tolerance:
+            self.limit = max(float(self.min_concurrency), self.limit * 0.9)
+        else:
+            self.limit = min(float(self.max_concurrency), self.limit + 1 / self.limit)
+
+    def counts(self) -> Dict[str, float]:
+        """للقياس اللحظي admission: الحد والجارية والمنتظرة في كل مسار"""
+        with self._lock:
+            counts = {"limit": max(self.min_concurrency, int(self.limit))}
+            for lane in LANES:
+                counts[f"running_{lane}"] = self._running[lane]
+                counts[f"queued_{lane}"] = len(self._queues[lane])
+        return counts
+
+    def snapshot(self) -> Dict:
+        with self._lock:
+            return {
+                "limit": max(self.min_concurrency, int(self.limit)),
+                "max_concurrency": self.max_concurrency,
+                "latency_seconds": round(self._latency, 4),
+                "running": dict(self._running),
+                "queued": {lane: len(queue) for lane, queue in self._queues.items()},
+                "admitted": dict(self._admitted),
+                "rejected": dict(self._rejected),
+                "deadlines": dict(self.deadlines),
+            }
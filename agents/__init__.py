@@ -1,15 +1,45 @@
+from .base import BaseAgent
+from .cache import ResultCache
+from .hedging import HedgePolicy, default_hedge_policy
+from .http_client import HTTPSettings, connection_stats, create_clients, shared_clients
+from .prompts import PromptTemplate, prompt_cache_stats
+from .registry import AgentNode, AgentRegistry
+from .routing import SynthesisRouter, synthesis_routing_stats
+from .similarity import SimilarityIndex
+from .rate_limit import ModelLimits, RateLimiter, default_rate_limiter
 from .market_logic import MarketLogicAgent, MarketAnalysis
 from .financial_sustainability import FinancialSustainabilityAgent, FinancialAnalysis
 from .competitive_durability import CompetitiveDurabilityAgent, CompetitiveAnalysis
+from .fused_divergence import FusedDivergenceAgent, FusedAnalysis
 from .strategic_synthesizer import StrategicSynthesizerAgent, StrategicMemo
 
 __all__ = [
+    "BaseAgent",
+    "ResultCache",
+    "HedgePolicy",
+    "default_hedge_policy",
+    "HTTPSettings",
+    "connection_stats",
+    "create_clients",
+    "shared_clients",
+    "PromptTemplate",
+    "prompt_cache_stats",
+    "AgentNode",
+    "AgentRegistry",
+    "SynthesisRouter",
+    "synthesis_routing_stats",
+    "SimilarityIndex",
+    "ModelLimits",
+    "RateLimiter",
+    "default_rate_limiter",
     "MarketLogicAgent",
     "MarketAnalysis",
     "FinancialSustainabilityAgent",
     "FinancialAnalysis",
     "CompetitiveDurabilityAgent",
     "CompetitiveAnalysis",
+    "FusedDivergenceAgent",
+    "FusedAnalysis",
     "StrategicSynthesizerAgent",
     "StrategicMemo",
 ]
@@ -0,0 +1,221 @@
+import asyncio
+import hashlib
+import json
+from dataclasses import asdict
+from typing import Any, Dict, List, Tuple
+
+from .cache import make_key, normalize_idea
+from .hedging import default_hedge_policy
+from .metrics import metrics
+from .prompts import prompt_cache_stats
+from .rate_limit import default_rate_limiter
+
+
+class BaseAgent:
+    model = "gpt-4o-mini"
+    result_type = None
+    # PromptTemplate: بادئة system ثابتة ورسالة user بالمدخلات المتغيرة
+    prompt = None
+    # موقع الوكيل في رسم الاعتماديات (agents.registry): اسم العقدة، ومخرجات العقد
+    # التي يحتاجها بترتيب معاملات invoke، وما ينتجه (الافتراضي اسم العقدة وحده)
+    node_name = None
+    inputs: Tuple[str, ...] = ()
+    outputs: Tuple[str, ...] = ()
+    # اسم المرحلة في قياسات pipeline_phase_seconds
+    phase = "divergence"
+    # مخطط الاستجابة في agents.schemas.SCHEMAS؛ None يكتفي بـ json_object وإصلاح JSON
+    schema = None
+
+    def __init__(self, openai_client, async_client=None, cache=None, rate_limiter=None, hedge_policy=None):
+        self.client = openai_client
+        self.async_client = async_client
+        self.cache = cache
+        self.rate_limiter = rate_limiter or default_rate_limiter
+        self.hedge_policy = hedge_policy or default_hedge_policy
+
+    @property
+    def prompt_version(self) -> str:
+        """بصمة قالب الطلب: تتغير عند تعديل نص الـ prompt فتبطل النتائج المخزنة"""
+        fingerprint = self._prompt_fingerprint()
+        return hashlib.sha256(fingerprint.encode("utf-8")).hexdigest()[:16]
+
+    def _prompt_fingerprint(self) -> str:
+        return self.prompt.fingerprint
+
+    def _prompt_values(self, business_idea: str, *inputs) -> Dict[str, Any]:
+        return {"business_idea": business_idea}
+
+    def _build_messages(self, business_idea: str, *inputs) -> List[Dict[str, str]]:
+        return self.prompt.render(**self._prompt_values(business_idea, *inputs))
+
+    def _cache_key(self, business_idea: str, *inputs) -> str:
+        parts = [type(self).__name__, self.model, self.prompt_version, normalize_idea(business_idea)]
+        parts.extend(json.dumps(asdict(item), ensure_ascii=False, sort_keys=True) for item in inputs)
+        return make_key(*parts)
+
+    def build_request(self, business_idea: str, *inputs) -> Dict[str, Any]:
+        """جسم طلب chat.completions كما يُرسل تماماً، لاستخدامه في ملفات Batch API"""
+        return self._request(self._build_messages(business_idea, *inputs))
+
+    def parse_content(self, content: str):
+        """تحويل نص استجابة النموذج (JSON) إلى نوع النتيجة الخاص بالوكيل"""
+        return self._parse(self._decode(content))
+
+    def invoke(self, business_idea: str, *inputs):
+        """تشغيل الوكيل كعقدة في الرسم: inputs مخرجات العقد السابقة بترتيب self.inputs"""
+        return self._run(business_idea, *inputs)
+
+    async def invoke_async(self, business_idea: str, *inputs):
+        return await self._run_async(business_idea, *inputs)
+
+    def invoke_stream(self, business_idea: str, *inputs):
+        return self._run_stream(business_idea, *inputs)
+
+    def split(self, result, outputs: Tuple[str, ...]) -> Dict[str, Any]:
+        """نتيجة الاستدعاء موزعة على أسماء المخرجات"""
+        return {outputs[0]: result}
+
+    def combine(self, values: Dict[str, Any], outputs: Tuple[str, ...]):
+        """عكس split: نتيجة الوكيل من قيم مخرجاته، لزرعها في الذاكرة المؤقتة"""
+        return values[outputs[0]]
+
+    def remember(self, result, business_idea: str, *inputs) -> None:
+        """حفظ نتيجة حُصل عليها خارج المسار المباشر (مثل Batch API) في الذاكرة المؤقتة"""
+        if self.cache is not None:
+            self.cache.put(self._cache_key(business_idea, *inputs), result)
+
+    def _run(self, business_idea: str, *inputs):
+        with metrics.agent(type(self).__name__, self.model):
+            key = self._cache_key(business_idea, *inputs) if self.cache is not None else None
+            if key is not None:
+                cached = self.cache.get(key, self.result_type)
+                if cached is not None:
+                    return cached
+
+            result = self._parse(self._complete(self._build_messages(business_idea, *inputs)))
+            if key is not None:
+                self.cache.put(key, result)
+            return result
+
+    async def _run_async(self, business_idea: str, *inputs):
+        with metrics.agent(type(self).__name__, self.model):
+            key = self._cache_key(business_idea, *inputs) if self.cache is not None else None
+            if key is not None:
+                cached = self.cache.get(key, self.result_type)
+                if cached is not None:
+                    return cached
+
+            result = self._parse(await self._complete_async(self._build_messages(business_idea, *inputs)))
+            if key is not None:
+                self.cache.put(key, result)
+            return result
+
+    def _run_stream(self, business_idea: str, *inputs):
+        """بث الاستجابة: يولّد ("token", نص) لكل جزء ثم ("result", النتيجة المحللة)"""
+        with metrics.agent(type(self).__name__, self.model):
+            key = self._cache_key(business_idea, *inputs) if self.cache is not None else None
+            if key is not None:
+                cached = self.cache.get(key, self.result_type)
+                if cached is not None:
+                    yield "result", cached
+                    return
+
+            content = []
+            for delta in self._stream(self._build_messages(business_idea, *inputs)):
+                content.append(delta)
+                yield "token", delta
+
+            result = self._parse(self._decode("".join(content)))
+            if key is not None:
+                self.cache.put(key, result)
+        yield "result", result
+
+    def _decode(self, content: str) -> Dict[str, Any]:
+        """JSON الاستجابة بعد الإصلاح والتحقق بالمخطط؛ ما لا يُصلح يُحسب فشلاً ويُرفع"""
+        from . import schemas  # pydantic يُستورد عند أول استجابة لا عند بدء التشغيل
+
+        try:
+            data, repairs = schemas.decode(content, self.schema)
+        except ValueError:  # JSONDecodeError و ValidationError كلاهما ValueError
+            metrics.parse_failure(type(self).__name__)
+            raise
+        if repairs:
+            metrics.repaired_response(type(self).__name__)
+        return data
+
+    def _response_format(self) -> Dict[str, Any]:
+        if self.schema is None:
+            return {"type": "json_object"}
+        from . import schemas
+
+        if not schemas.structured_outputs_enabled():
+            return {"type": "json_object"}
+        return schemas.response_format(self.schema)
+
+    def _request(self, messages: List[Dict[str, str]]) -> Dict[str, Any]:
+        return {
+            "model": self.model,
+            "messages": messages,
+            "response_format": self._response_format(),
+        }
+
+    def _complete(self, messages: List[Dict[str, str]]) -> Dict[str, Any]:
+        request = self._request(messages)
+        prompt = _prompt_text(messages)
+        create = lambda: self.client.chat.completions.create(**request)
+        # التحوط داخل المحدد: زمن الطابور لا يدخل p95 ولا يطلق طلباً احتياطياً،
+        # والاحتياطي يحجز حصته بمحاولة واحدة
+        response = self.rate_limiter.call(
+            self.model,
+            prompt,
+            lambda: self.hedge_policy.call(
+                self.model, create, backup=lambda: self.rate_limiter.call(self.model, prompt, create, max_retries=0)
+            ),
+        )
+        self._record_usage(getattr(response, "usage", None))
+        return self._decode(response.choices[0].message.content)
+
+    def _stream(self, messages: List[Dict[str, str]]):
+        request = self._request(messages)
+        # include_usage يضيف جزءاً أخيراً بلا choices يحمل usage، ومنه cached_tokens
+        stream = self.rate_limiter.call(
+            self.model,
+            _prompt_text(messages),
+            lambda: self.client.chat.completions.create(
+                **request, stream=True, stream_options={"include_usage": True}
+            ),
+        )
+        for chunk in stream:
+            if chunk.choices and chunk.choices[0].delta.content:
+                yield chunk.choices[0].delta.content
+            elif getattr(chunk, "usage", None) is not None:
+                self._record_usage(chunk.usage)
+
+    async def _complete_async(self, messages: List[Dict[str, str]]) -> Dict[str, Any]:
+        # بدون عميل AsyncOpenAI نعود إلى المسار المتزامن في خيط منفصل
+        if self.async_client is None:
+            return await asyncio.to_thread(self._complete, messages)
+
+        request = self._request(messages)
+        prompt = _prompt_text(messages)
+        create = lambda: self.async_client.chat.completions.create(**request)
+        response = await self.rate_limiter.call_async(
+            self.model,
+            prompt,
+            lambda: self.hedge_policy.call_async(
+                self.model,
+                create,
+                backup=lambda: self.rate_limiter.call_async(self.model, prompt, create, max_retries=0),
+            ),
+        )
+        self._record_usage(getattr(response, "usage", None))
+        return self._decode(response.choices[0].message.content)
+
+    def _record_usage(self, usage) -> None:
+        prompt_cache_stats.record(self.model, usage)
+        metrics.record_usage(self.model, usage)
+
+
+def _prompt_text(messages: List[Dict[str, str]]) -> str:
+    """نص كل الرسائل معاً لتقدير عدد الرموز في محدد المعدل"""
+    return "\n".join(message["content"] for message in messages)
@@ -0,0 +1,116 @@
+"""ضغط مدخلات وكيل التوليف ضمن ميزانية رموز قبل إرسالها إلى gpt-4o.
+
+الحقول النصية في التحليلات الثلاثة تُقص بنفس النسبة تقريباً حتى يتسع مجموعها
+للميزانية، مع تفضيل القص عند نهاية جملة ثم عند حد كلمة. مستوى المخاطرة
+ونسبة الثقة لا تُمس أبداً.
+"""
+import re
+from dataclasses import dataclass, fields, replace
+from typing import Tuple
+
+from .tokens import estimate_tokens
+
+
+# أقل حصة لكل حقل حتى لا يختفي أي منظور تماماً مهما صغرت الميزانية
+MIN_FIELD_TOKENS = 12
+ELLIPSIS = "…"
+PRESERVED_FIELDS = ("risk_level", "confidence_score")
+
+_SENTENCE_END = re.compile(r"[.!?؟。؛\n]\s*")
+_WHITESPACE = re.compile(r"\s+")
+
+
+@dataclass
+class CompactionReport:
+    original_tokens: int
+    compacted_tokens: int
+    budget_tokens: int
+
+    @property
+    def saved_tokens(self) -> int:
+        return self.original_tokens - self.compacted_tokens
+
+
+def _text_fields(analysis):
+    return [
+        f.name for f in fields(analysis)
+        if f.name not in PRESERVED_FIELDS and isinstance(getattr(analysis, f.name), str)
+    ]
+
+
+def condense(text: str) -> str:
+    """طي المسافات وحذف الجمل المكررة حرفياً، بدون أي فقد في المعنى"""
+    text = _WHITESPACE.sub(" ", text).strip()
+    seen, sentences = set(), []
+    start = 0
+    for match in _SENTENCE_END.finditer(text):
+        sentence = text[start:match.end()]
+        start = match.end()
+        if sentence.strip() not in seen:
+            seen.add(sentence.strip())
+            sentences.append(sentence)
+    tail = text[start:]
+    if tail and tail.strip() not in seen:
+        sentences.append(tail)
+    return "".join(sentences).strip()
+
+
+def truncate_to_tokens(text: str, max_tokens: int) -> str:
+    """أطول بادئة من text لا تتجاوز max_tokens تقريباً، منتهية بجملة أو كلمة كاملة"""
+    if estimate_tokens(text) <= max_tokens:
+        return text
+
+    # التقدير خطي في عدد الأحرف، فالنسبة تعطي نقطة قص قريبة جداً من الهدف
+    cut = max(1, int(len(text) * max_tokens / estimate_tokens(text)))
+    while cut > 1 and estimate_tokens(text[:cut] + ELLIPSIS) > max_tokens:
+        cut = int(cut * 0.9)
+    head = text[:cut]
+
+    sentence_ends = [m.end() for m in _SENTENCE_END.finditer(head)]
+    if sentence_ends and sentence_ends[-1] >= len(head) // 2:
+        return head[:sentence_ends[-1]].rstrip()
+    if " " in head[len(head) // 2:]:
+        head = head[:head.rindex(" ")]
+    return head.rstrip() + ELLIPSIS
+
+
+def compact_analyses(analyses: Tuple, budget_tokens: int):
+    """قص الحقول النصية للتحليلات بالتناسب حتى يتسع مجموعها لـ budget_tokens.
+
+    يعيد (التحليلات بعد الضغط، CompactionReport). إذا كانت ضمن الميزانية أصلاً
+    تُعاد بعد condense فقط.
+    """
+    condensed = []
+    sizes = {}
+    for index, analysis in enumerate(analyses):
+        names = _text_fields(analysis)
+        analysis = replace(analysis, **{name: condense(getattr(analysis, name)) for name in names})
+        condensed.append(analysis)
+        for name in names:
+            sizes[index, name] = estimate_tokens(getattr(analysis, name))
+
+    original = sum(
+        estimate_tokens(getattr(analysis, name))
+        for analysis in analyses for name in _text_fields(analysis)
+    )
+    total = sum(sizes.values())
+    if total <= budget_tokens:
+        return tuple(condensed), CompactionReport(original, total, budget_tokens)
+
+    ratio = max(0.0, budget_tokens) / total
+    compacted = []
+    for index, analysis in enumerate(condensed):
+        trimmed = {
+            name: truncate_to_tokens(
+                getattr(analysis, name),
+                max(MIN_FIELD_TOKENS, int(sizes[index, name] * ratio)),
+            )
+            for name in _text_fields(analysis)
+        }
+        compacted.append(replace(analysis, **trimmed))
+
+    final = sum(
+        estimate_tokens(getattr(analysis, name))
+        for analysis in compacted for name in _text_fields(analysis)
+    )
+    return tuple(compacted), CompactionReport(original, final, budget_tokens)
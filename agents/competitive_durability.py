@@ -1,8 +1,12 @@
 from typing import Dict, Any
 from dataclasses import dataclass
 
+from .base import BaseAgent
+from .prompts import COMPETITIVE_PROMPT
+from .serialization import SLOTS
 
-@dataclass
+
+@dataclass(**SLOTS)
 class CompetitiveAnalysis:
     entry_barriers: str
     moat_strength: str
@@ -10,49 +14,10 @@ class CompetitiveAnalysis:
     unique_value_proposition: str
     risk_level: str
     confidence_score: float
-
-
-class CompetitiveDurabilityAgent:
-    def __init__(self, openai_client):
-        self.client = openai_client
-        self.model = "gpt-4o-mini"
     
-    def analyze(self, business_idea: str) -> CompetitiveAnalysis:
-        prompt = f"""أنت محلل تنافسي محترف (Competitive Durability Analyst).
-        
-مهمتك: تقييم حواجز الدخول وقوة الحماية التنافسية (Moat).
-
-الفكرة/المشروع المطروح:
-{business_idea}
-
-قم بتحليل شامل يتضمن:
-1. حواجز الدخول (Entry Barriers): ما مدى صعوبة دخول منافسين جدد؟
-2. قوة الحماية التنافسية (Moat Strength): ما الذي يحمي هذا المشروع من المنافسة؟
-3. سهولة التكرار (Ease of Replication): هل يمكن تقليد هذه الفكرة بسهولة؟
-4. عرض القيمة الفريد (Unique Value Proposition): ما الذي يجعل هذا المشروع مميزاً؟
-5. مستوى المخاطرة (Risk Level): منخفض/متوسط/عالي
-6. نسبة الثقة (Confidence Score): 0-100%
-
-أجب بصيغة JSON:
-{{
-    "entry_barriers": "...",
-    "moat_strength": "...",
-    "ease_of_replication": "...",
-    "unique_value_proposition": "...",
-    "risk_level": "منخفض/متوسط/عالي",
-    "confidence_score": 0.85
-}}"""
-
-        response = self.client.chat.completions.create(
-            model=self.model,
-            messages=[{"role": "user", "content": prompt}],
-            response_format={"type": "json_object"}
-        )
-        
-        import json
-        result = json.loads(response.choices[0].message.content)
-        
-        return CompetitiveAnalysis(
+    @classmethod
+    def from_dict(cls, result: Dict[str, Any]) -> "CompetitiveAnalysis":
+        return cls(
             entry_barriers=result.get("entry_barriers", ""),
             moat_strength=result.get("moat_strength", ""),
             ease_of_replication=result.get("ease_of_replication", ""),
@@ -60,3 +25,20 @@ class CompetitiveDurabilityAgent:
             risk_level=result.get("risk_level", "متوسط"),
             confidence_score=result.get("confidence_score", 0.5)
         )
+
+
+class CompetitiveDurabilityAgent(BaseAgent):
+    model = "gpt-4o-mini"
+    result_type = CompetitiveAnalysis
+    prompt = COMPETITIVE_PROMPT
+    schema = "competitive_analysis"
+    node_name = "competitive"
+    
+    def analyze(self, business_idea: str) -> CompetitiveAnalysis:
+        return self._run(business_idea)
+    
+    async def analyze_async(self, business_idea: str) -> CompetitiveAnalysis:
+        return await self._run_async(business_idea)
+    
+    def _parse(self, result: Dict[str, Any]) -> CompetitiveAnalysis:
+        return CompetitiveAnalysis.from_dict(result)
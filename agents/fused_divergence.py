@@ -0,0 +1,58 @@
+from typing import Dict, Any, Tuple
+from dataclasses import dataclass
+
+from .base import BaseAgent
+from .prompts import FUSED_DIVERGENCE_PROMPT
+from .serialization import SLOTS
+from .market_logic import MarketAnalysis
+from .financial_sustainability import FinancialAnalysis
+from .competitive_durability import CompetitiveAnalysis
+
+
+@dataclass(**SLOTS)
+class FusedAnalysis:
+    market_analysis: MarketAnalysis
+    financial_analysis: FinancialAnalysis
+    competitive_analysis: CompetitiveAnalysis
+
+    def __post_init__(self):
+        # عند الاسترجاع من الذاكرة المؤقتة تصل الأقسام كقواميس
+        if isinstance(self.market_analysis, dict):
+            self.market_analysis = MarketAnalysis(**self.market_analysis)
+        if isinstance(self.financial_analysis, dict):
+            self.financial_analysis = FinancialAnalysis(**self.financial_analysis)
+        if isinstance(self.competitive_analysis, dict):
+            self.competitive_analysis = CompetitiveAnalysis(**self.competitive_analysis)
+
+
+class FusedDivergenceAgent(BaseAgent):
+    """وضع الاستدعاء الواحد: التحليلات الثلاثة من طلب gpt-4o-mini واحد.
+    
+    يرسل الفكرة والتعليمات المشتركة مرة واحدة بدلاً من ثلاث، ثم يقسم كائن
+    JSON المجمع إلى MarketAnalysis و FinancialAnalysis و CompetitiveAnalysis.
+    """
+    model = "gpt-4o-mini"
+    result_type = FusedAnalysis
+    prompt = FUSED_DIVERGENCE_PROMPT
+    schema = "fused_analysis"
+    node_name = "fused"
+    outputs = ("market", "financial", "competitive")
+    
+    def analyze(self, business_idea: str) -> FusedAnalysis:
+        return self._run(business_idea)
+    
+    async def analyze_async(self, business_idea: str) -> FusedAnalysis:
+        return await self._run_async(business_idea)
+    
+    def split(self, result: FusedAnalysis, outputs: Tuple[str, ...]) -> Dict[str, Any]:
+        return dict(zip(outputs, (result.market_analysis, result.financial_analysis, result.competitive_analysis)))
+    
+    def combine(self, values: Dict[str, Any], outputs: Tuple[str, ...]) -> FusedAnalysis:
+        return FusedAnalysis(*(values[name] for name in outputs))
+    
+    def _parse(self, result: Dict[str, Any]) -> FusedAnalysis:
+        return FusedAnalysis(
+            market_analysis=MarketAnalysis.from_dict(result.get("market", {})),
+            financial_analysis=FinancialAnalysis.from_dict(result.get("financial", {})),
+            competitive_analysis=CompetitiveAnalysis.from_dict(result.get("competitive", {}))
+        )
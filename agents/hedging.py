@@ -0,0 +1,165 @@
+"""طلبات احتياطية (hedged requests) لقص ذيل زمن الاستجابة.
+
+استدعاء تجاوز p95 الحديث لنموذجه يُطلق له طلب مطابق ثانٍ، وتُستخدم أول
+إجابة. في المسار غير المتزامن يُلغى الطلب الخاسر فوراً (ويُغلق اتصاله)؛ في
+المسار المتزامن لا يمكن إيقاف خيط، فتكمل الخاسرة في الخلفية وتُهمل نتيجتها.
+
+التحوط يعمل داخل محدد المعدل: المهلة تبدأ بعد حجز الطلب الأصلي، وقياسات p95
+زمن النموذج وحده بلا انتظار الطابور أو تراجع 429. الطلب الاحتياطي (backup)
+يحجز حصته الخاصة في المحدد، فلا يتجاوز حدود المزود.
+"""
+import asyncio
+import contextvars
+import os
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from typing import Deque, Dict, Optional
+
+from .metrics import metrics
+
+
+class HedgePolicy:
+    """متى يُطلق الطلب الاحتياطي: بعد p95 آخر window استدعاء للنموذج.
+
+    لا تحوط قبل min_samples قياساً، ولا قبل min_delay ثانية: استدعاءات النماذج
+    تستغرق ثوانٍ، وما دون ذلك لا يستحق دفع طلب ثانٍ.
+    """
+
+    def __init__(
+        self,
+        percentile: float = 0.95,
+        window: int = 200,
+        min_samples: int = 20,
+        min_delay: float = 1.0,
+        enabled: bool = True,
+    ):
+        self.percentile = percentile
+        self.window = window
+        self.min_samples = min_samples
+        self.min_delay = min_delay
+        self.enabled = enabled
+        self._lock = threading.Lock()
+        self._latencies: Dict[str, Deque[float]] = {}
+        self._executor = None
+
+    @classmethod
+    def from_env(cls) -> "HedgePolicy":
+        """HEDGE_REQUESTS=off يعطل التحوط، و HEDGE_PERCENTILE و HEDGE_MIN_DELAY_SECONDS تضبطه"""
+        return cls(
+            percentile=float(os.getenv("HEDGE_PERCENTILE", "0.95")),
+            min_delay=float(os.getenv("HEDGE_MIN_DELAY_SECONDS", "1.0")),
+            enabled=os.getenv("HEDGE_REQUESTS", "on").lower() not in ("0", "off", "false", "no"),
+        )
+
+    def observe(self, model: str, seconds: float) -> None:
+        with self._lock:
+            latencies = self._latencies.get(model)
+            if latencies is None:
+                latencies = self._latencies[model] = deque(maxlen=self.window)
+            latencies.append(seconds)
+
+    def delay(self, model: str) -> Optional[float]:
+        """ثوانٍ قبل إطلاق الطلب الاحتياطي، أو None بلا تحوط"""
+        if not self.enabled:
+            return None
+        with self._lock:
+            latencies = sorted(self._latencies.get(model, ()))
+        if len(latencies) < self.min_samples:
+            return None
+        return max(self.min_delay, latencies[min(len(latencies) - 1, int(self.percentile * len(latencies)))])
+
+    def _pool(self) -> ThreadPoolExecutor:
+        with self._lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=64, thread_name_prefix="hedged-call")
+            return self._executor
+
+    def call(self, model: str, fn, backup=None):
+        """fn() مع طلب احتياطي backup() (أو fn()) عند التأخر؛ زمنه يُسجل في قياسات النموذج"""
+        delay = self.delay(model)
+        started = time.perf_counter()
+        if delay is None:
+            result = fn()
+            self._record(model, started)
+            return result
+
+        pool = self._pool()
+        primary = pool.submit(contextvars.copy_context().run, fn)
+        done, _ = wait([primary], timeout=delay)
+        if done:
+            result = primary.result()
+            self._record(model, started)
+            return result
+
+        metrics.hedge(model)
+        backup = pool.submit(contextvars.copy_context().run, backup or fn)
+        pending = {primary, backup}
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            winner = _winner(done, pending, primary)
+            if winner is not None:
+                if winner is backup:
+                    metrics.hedge_won(model)
+                self._record(model, started)
+                return winner.result()
+
+    async def call_async(self, model: str, fn, backup=None):
+        """مثل call لكن fn() و backup() تعيدان coroutine، والطلب الخاسر يُلغى"""
+        delay = self.delay(model)
+        started = time.perf_counter()
+        if delay is None:
+            result = await fn()
+            self._record(model, started)
+            return result
+
+        primary = asyncio.ensure_future(fn())
+        try:
+            done, _ = await asyncio.wait({primary}, timeout=delay)
+            if done:
+                result = primary.result()
+                self._record(model, started)
+                return result
+
+            metrics.hedge(model)
+            backup = asyncio.ensure_future((backup or fn)())
+            pending = {primary, backup}
+            try:
+                while pending:
+                    done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                    winner = _winner(done, pending, primary)
+                    if winner is not None:
+                        if winner is backup:
+                            metrics.hedge_won(model)
+                        self._record(model, started)
+                        return winner.result()
+            finally:
+                for task in pending:
+                    task.cancel()
+        finally:
+            if not primary.done():
+                primary.cancel()
+
+    def _record(self, model: str, started: float) -> None:
+        seconds = time.perf_counter() - started
+        self.observe(model, seconds)
+        metrics.observe_request(model, seconds)
+
+
+def _winner(done, pending, primary):
+    """أول طلب ناجح بين المكتملة؛ فشل أحد الطلبين لا يُرفع ما دام الآخر قد ينجح.
+
+    done مجموعة بلا ترتيب: إن اكتمل الطلبان معاً يُفضل الناجح منهما، وإن فشلا
+    يُرفع خطأ الطلب الأصلي. None يعني انتظار ما بقي.
+    """
+    for future in done:
+        if future.exception() is None:
+            return future
+    if pending:
+        return None
+    return primary if primary in done else next(iter(done))
+
+
+# سياسة العملية المشتركة: كل الوكلاء يتعلمون p95 من نفس القياسات
+default_hedge_policy = HedgePolicy.from_env()
@@ -0,0 +1,169 @@
+"""مصنع عملاء OpenAI المشترك: مجمّع اتصالات واحد مضبوط لكل العملية.
+
+كل استدعاء نموذج يعيد استخدام اتصال مفتوح (keep-alive) بدل مصافحة TCP/TLS
+جديدة، وذلك بشرط أن تتشارك app.py والمنسق والوكلاء نفس العميلين. الإحصاءات
+تُجمع عبر امتداد trace في httpcore: كل اتصال جديد يمر بـ connect_tcp، وكل طلب
+لم يمر به أعاد استخدام اتصال قائم.
+"""
+import importlib.util
+import os
+import threading
+from dataclasses import dataclass, replace
+from typing import TYPE_CHECKING, Dict, Optional, Tuple
+
+if TYPE_CHECKING:
+    from openai import AsyncOpenAI, OpenAI
+
+
+def _httpx():
+    """httpx يُستورد عند بناء العملاء فقط، فاستيراد agents يبقى سريعاً"""
+    try:
+        import httpx
+    except ImportError:  # إصدارات openai الأحدث مبنية على httpx2 بنفس الواجهة
+        import httpx2 as httpx
+    return httpx
+
+
+@dataclass(frozen=True)
+class HTTPSettings:
+    max_connections: int = 200
+    # اتصالات خاملة تبقى مفتوحة بين الدفعات؛ أقل من التزامن يعني مصافحات متكررة
+    max_keepalive_connections: int = 100
+    keepalive_expiry: float = 90.0
+    # يتطلب حزمة h2، وبدونها يُستخدم HTTP/1.1
+    http2: bool = True
+    connect_timeout: float = 5.0
+    read_timeout: float = 120.0
+    write_timeout: float = 30.0
+    pool_timeout: float = 30.0
+
+    @classmethod
+    def from_env(cls) -> "HTTPSettings":
+        """القيم من متغيرات OPENAI_HTTP_* مع الإبقاء على الافتراضي لما لم يُحدد"""
+        overrides = {}
+        for name, field in cls.__dataclass_fields__.items():
+            value = os.getenv(f"OPENAI_HTTP_{name.upper()}")
+            if value is None or value == "":
+                continue
+            if field.type in (bool, "bool"):
+                overrides[name] = value.lower() in ("1", "true", "yes", "on")
+            elif field.type in (int, "int"):
+                overrides[name] = int(value)
+            else:
+                overrides[name] = float(value)
+        return replace(cls(), **overrides)
+
+    def limits(self):
+        return _httpx().Limits(
+            max_connections=self.max_connections,
+            max_keepalive_connections=self.max_keepalive_connections,
+            keepalive_expiry=self.keepalive_expiry,
+        )
+
+    def timeout(self):
+        return _httpx().Timeout(
+            connect=self.connect_timeout,
+            read=self.read_timeout,
+            write=self.write_timeout,
+            pool=self.pool_timeout,
+        )
+
+
+def http2_available() -> bool:
+    return importlib.util.find_spec("h2") is not None
+
+
+class ConnectionStats:
+    """عدادات الطلبات والاتصالات الجديدة والمصافحات عبر امتداد trace"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counters = {"requests": 0, "connections_opened": 0, "tls_handshakes": 0, "connect_failures": 0}
+
+    def _on_event(self, name: str) -> None:
+        key = None
+        if name.endswith("send_request_headers.started"):
+            key = "requests"
+        elif name == "connection.connect_tcp.complete":
+            key = "connections_opened"
+        elif name == "connection.start_tls.complete":
+            key = "tls_handshakes"
+        elif name == "connection.connect_tcp.failed":
+            key = "connect_failures"
+        if key is not None:
+            with self._lock:
+                self._counters[key] += 1
+
+    def trace(self, name, info) -> None:
+        self._on_event(name)
+
+    async def atrace(self, name, info) -> None:
+        self._on_event(name)
+
+    def attach(self, request) -> None:
+        request.extensions = {**request.extensions, "trace": self.trace}
+
+    async def attach_async(self, request) -> None:
+        request.extensions = {**request.extensions, "trace": self.atrace}
+
+    def snapshot(self) -> Dict[str, float]:
+        with self._lock:
+            counters = dict(self._counters)
+        requests = counters["requests"]
+        reused = max(0, requests - counters["connections_opened"])
+        return {**counters, "reused": reused, "reuse_ratio": reused / requests if requests else 0.0}
+
+    def reset(self) -> None:
+        with self._lock:
+            for key in self._counters:
+                self._counters[key] = 0
+
+
+# إحصاءات كل العملاء المبنيين عبر هذا المصنع
+connection_stats = ConnectionStats()
+
+
+def create_clients(
+    api_key: Optional[str] = None,
+    settings: Optional[HTTPSettings] = None,
+    stats: ConnectionStats = connection_stats,
+    **client_kwargs,
+) -> Tuple["OpenAI", "AsyncOpenAI"]:
+    """عميلان متزامن وغير متزامن بإعدادات النقل المحددة.
+
+    إعادة المحاولة معطلة في العميلين لأن agents.rate_limit تتولاها.
+    """
+    from openai import AsyncOpenAI, DefaultAsyncHttpxClient, DefaultHttpxClient, OpenAI
+
+    settings = settings or HTTPSettings.from_env()
+    transport = dict(
+        limits=settings.limits(),
+        timeout=settings.timeout(),
+        http2=settings.http2 and http2_available(),
+    )
+    http_client = DefaultHttpxClient(**transport, event_hooks={"request": [stats.attach]})
+    async_http_client = DefaultAsyncHttpxClient(**transport, event_hooks={"request": [stats.attach_async]})
+    client = OpenAI(
+        api_key=api_key, max_retries=0, timeout=settings.timeout(), http_client=http_client, **client_kwargs
+    )
+    async_client = AsyncOpenAI(
+        api_key=api_key, max_retries=0, timeout=settings.timeout(), http_client=async_http_client, **client_kwargs
+    )
+    return client, async_client
+
+
+_shared: Dict[Optional[str], Tuple["OpenAI", "AsyncOpenAI"]] = {}
+_shared_lock = threading.Lock()
+
+
+def shared_clients(api_key: Optional[str] = None) -> Tuple["OpenAI", "AsyncOpenAI"]:
+    """العميلان المشتركان للعملية لكل مفتاح API، يُبنيان عند أول طلب.
+
+    مجمّع العميل غير المتزامن مرتبط بحلقة asyncio التي يُستخدم فيها أولاً،
+    لذلك تُوجه استدعاءاته كلها إلى حلقة واحدة (انظر event_loop.py).
+    """
+    with _shared_lock:
+        clients = _shared.get(api_key)
+        if clients is None:
+            clients = _shared[api_key] = create_clients(api_key)
+        return clients
@@ -1,8 +1,12 @@
 from typing import Dict, Any
 from dataclasses import dataclass
 
+from .base import BaseAgent
+from .prompts import MARKET_PROMPT
+from .serialization import SLOTS
 
-@dataclass
+
+@dataclass(**SLOTS)
 class MarketAnalysis:
     market_demand: str
     customer_segments: str
@@ -10,49 +14,10 @@ class MarketAnalysis:
     demand_gaps: str
     risk_level: str
     confidence_score: float
-
-
-class MarketLogicAgent:
-    def __init__(self, openai_client):
-        self.client = openai_client
-        self.model = "gpt-4o-mini"
     
-    def analyze(self, business_idea: str) -> MarketAnalysis:
-        prompt = f"""أنت محلل سوق محترف (Market Logic Analyst).
-        
-مهمتك: تحليل ديناميكيات السوق والفجوات في الطلب.
-
-الفكرة/المشروع المطروح:
-{business_idea}
-
-قم بتحليل شامل يتضمن:
-1. الطلب السوقي (Market Demand): ما مدى قوة الحاجة لهذا المنتج/الخدمة؟
-2. شرائح العملاء المستهدفة (Customer Segments): من هم العملاء المحتملون؟
-3. اتجاهات السوق الحالية (Market Trends): ماذا يحدث في هذا السوق الآن؟
-4. الفجوات في الطلب (Demand Gaps): ما هي الاحتياجات غير الملباة؟
-5. مستوى المخاطرة (Risk Level): منخفض/متوسط/عالي
-6. نسبة الثقة (Confidence Score): 0-100%
-
-أجب بصيغة JSON:
-{{
-    "market_demand": "...",
-    "customer_segments": "...",
-    "market_trends": "...",
-    "demand_gaps": "...",
-    "risk_level": "منخفض/متوسط/عالي",
-    "confidence_score": 0.85
-}}"""
-
-        response = self.client.chat.completions.create(
-            model=self.model,
-            messages=[{"role": "user", "content": prompt}],
-            response_format={"type": "json_object"}
-        )
-        
-        import json
-        result = json.loads(response.choices[0].message.content)
-        
-        return MarketAnalysis(
+    @classmethod
+    def from_dict(cls, result: Dict[str, Any]) -> "MarketAnalysis":
+        return cls(
             market_demand=result.get("market_demand", ""),
             customer_segments=result.get("customer_segments", ""),
             market_trends=result.get("market_trends", ""),
@@ -60,3 +25,20 @@ class MarketLogicAgent:
             risk_level=result.get("risk_level", "متوسط"),
             confidence_score=result.get("confidence_score", 0.5)
         )
+
+
+class MarketLogicAgent(BaseAgent):
+    model = "gpt-4o-mini"
+    result_type = MarketAnalysis
+    prompt = MARKET_PROMPT
+    schema = "market_analysis"
+    node_name = "market"
+    
+    def analyze(self, business_idea: str) -> MarketAnalysis:
+        return self._run(business_idea)
+    
+    async def analyze_async(self, business_idea: str) -> MarketAnalysis:
+        return await self._run_async(business_idea)
+    
+    def _parse(self, result: Dict[str, Any]) -> MarketAnalysis:
+        return MarketAnalysis.from_dict(result)
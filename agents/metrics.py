@@ -0,0 +1,436 @@
+"""قياسات المسار الساخن: زمن كل وكيل وكل مرحلة، الرموز والتكلفة لكل نموذج، وأخطاء التحليل.
+
+metrics هو المجمّع المشترك على مستوى العملية ويُعرض بصيغة Prometheus عبر render().
+داخل collect_request_metrics() تُسجَّل نفس القياسات أيضاً في RequestMetrics
+خاص بالطلب الحالي (عبر contextvars)، لإرفاقها باستجابة JSON عند الطلب.
+"""
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Callable, Dict, List, Optional, Tuple
+
+
+LATENCY_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 20.0, 30.0, 60.0, 120.0)
+
+# دولار لكل مليون رمز: (prompt، prompt مخزن لدى المزود، completion)
+MODEL_PRICES = {
+    "gpt-4o": (2.50, 1.25, 10.00),
+    "gpt-4o-mini": (0.15, 0.075, 0.60),
+}
+
+
+def usage_tokens(usage) -> Optional[Tuple[int, int, int]]:
+    """(prompt، completion، cached) من response.usage، أو None إذا لم يكن متاحاً"""
+    prompt_tokens = getattr(usage, "prompt_tokens", None)
+    completion_tokens = getattr(usage, "completion_tokens", None)
+    if not isinstance(prompt_tokens, int):
+        return None
+    if not isinstance(completion_tokens, int):
+        completion_tokens = 0
+    cached_tokens = getattr(getattr(usage, "prompt_tokens_details", None), "cached_tokens", None)
+    if not isinstance(cached_tokens, int):
+        cached_tokens = 0
+    return prompt_tokens, completion_tokens, cached_tokens
+
+
+def usage_cost(model: str, prompt_tokens: int, completion_tokens: int, cached_tokens: int) -> float:
+    prices = MODEL_PRICES.get(model)
+    if prices is None:
+        return 0.0
+    prompt_price, cached_price, completion_price = prices
+    return (
+        (prompt_tokens - cached_tokens) * prompt_price
+        + cached_tokens * cached_price
+        + completion_tokens * completion_price
+    ) / 1_000_000
+
+
+class _Histogram:
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float) -> None:
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[i] += 1
+                break
+        self.sum += value
+        self.count += 1
+
+
+class RequestMetrics:
+    """قياسات طلب تحليل واحد بشكل قابل للتحويل إلى JSON"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.phases: Dict[str, float] = {}
+        self.agents: Dict[str, float] = {}
+        self.tokens: Dict[str, Dict[str, int]] = {}
+        self.cost_usd = 0.0
+        self.parse_failures = 0
+        self.retries = 0
+        self.compaction_saved_tokens = 0
+        self.schedule: Dict = {}
+        self.hedges = 0
+        self.deadline_exceeded: List[str] = []
+        self.repaired_responses = 0
+        # إعادة محاولة بنفس request_id: مراحل استُعيدت من نقاط الحفظ ومراحل أُعيد تنفيذها
+        self.restored_stages: List[str] = []
+        self.reexecuted_stages: List[str] = []
+
+    def to_dict(self) -> Dict:
+        with self._lock:
+            return {
+                "phases_seconds": {name: round(value, 4) for name, value in self.phases.items()},
+                "agents_seconds": {name: round(value, 4) for name, value in self.agents.items()},
+                "tokens": {model: dict(counts) for model, counts in self.tokens.items()},
+                "cost_usd": round(self.cost_usd, 6),
+                "parse_failures": self.parse_failures,
+                "retries": self.retries,
+                "compaction_saved_tokens": self.compaction_saved_tokens,
+                "schedule": self.schedule,
+                "hedges": self.hedges,
+                "deadline_exceeded": list(self.deadline_exceeded),
+                "repaired_responses": self.repaired_responses,
+                "restored_stages": list(self.restored_stages),
+                "reexecuted_stages": list(self.reexecuted_stages),
+            }
+
+
+_current_request: ContextVar[Optional[RequestMetrics]] = ContextVar("request_metrics", default=None)
+
+
+@contextmanager
+def collect_request_metrics():
+    """تجميع قياسات كل ما يُنفذ داخل الكتلة (ومهام asyncio والخيوط التي تنسخ السياق منها)"""
+    collected = RequestMetrics()
+    token = _current_request.set(collected)
+    try:
+        yield collected
+    finally:
+        _current_request.reset(token)
+
+
+class MetricsRegistry:
+    """مدرجات زمنية وعدادات بسيطة مفهرسة بالتسميات، بدون اعتماد على prometheus_client"""
+
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = buckets
+        self._lock = threading.Lock()
+        self._agent_seconds: Dict[Tuple[str, str], _Histogram] = {}
+        self._phase_seconds: Dict[str, _Histogram] = {}
+        self._tokens: Dict[Tuple[str, str], int] = {}
+        self._cost: Dict[str, float] = {}
+        self._parse_failures: Dict[str, int] = {}
+        self._retries: Dict[str, int] = {}
+        self._compaction_saved: Dict[str, int] = {}
+        self._request_seconds: Dict[str, _Histogram] = {}
+        self._hedges: Dict[str, int] = {}
+        self._hedge_wins: Dict[str, int] = {}
+        self._deadline_exceeded: Dict[str, int] = {}
+        self._repaired: Dict[str, int] = {}
+        self._stages_restored: Dict[str, int] = {}
+        self._stages_reexecuted: Dict[str, int] = {}
+        self._admission_wait: Dict[str, _Histogram] = {}
+        self._admission_rejected: Dict[Tuple[str, str], int] = {}
+        self._gauges: Dict[str, Tuple[str, str, Callable[[], Dict[str, float]]]] = {}
+
+    def _histogram(self, table, key) -> _Histogram:
+        histogram = table.get(key)
+        if histogram is None:
+            histogram = table[key] = _Histogram(self.buckets)
+        return histogram
+
+    def observe_agent(self, agent: str, model: str, seconds: float) -> None:
+        with self._lock:
+            self._histogram(self._agent_seconds, (agent, model)).observe(seconds)
+        current = _current_request.get()
+        if current is not None:
+            with current._lock:
+                current.agents[agent] = current.agents.get(agent, 0.0) + seconds
+
+    def observe_phase(self, phase: str, seconds: float) -> None:
+        with self._lock:
+            self._histogram(self._phase_seconds, phase).observe(seconds)
+        current = _current_request.get()
+        if current is not None:
+            with current._lock:
+                current.phases[phase] = current.phases.get(phase, 0.0) + seconds
+
+    @contextmanager
+    def agent(self, agent: str, model: str):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe_agent(agent, model, time.perf_counter() - started)
+
+    @contextmanager
+    def phase(self, name: str):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe_phase(name, time.perf_counter() - started)
+
+    def record_usage(self, model: str, usage) -> None:
+        tokens = usage_tokens(usage)
+        if tokens is None:
+            return
+        prompt_tokens, completion_tokens, cached_tokens = tokens
+        cost = usage_cost(model, prompt_tokens, completion_tokens, cached_tokens)
+        counts = {"prompt": prompt_tokens, "completion": completion_tokens, "cached": cached_tokens}
+
+        with self._lock:
+            for kind, value in counts.items():
+                self._tokens[(model, kind)] = self._tokens.get((model, kind), 0) + value
+            self._cost[model] = self._cost.get(model, 0.0) + cost
+        current = _current_request.get()
+        if current is not None:
+            with current._lock:
+                model_tokens = current.tokens.setdefault(model, {"prompt": 0, "completion": 0, "cached": 0})
+                for kind, value in counts.items():
+                    model_tokens[kind] += value
+                current.cost_usd += cost
+
+    def parse_failure(self, agent: str) -> None:
+        with self._lock:
+            self._parse_failures[agent] = self._parse_failures.get(agent, 0) + 1
+        current = _current_request.get()
+        if current is not None:
+            with current._lock:
+                current.parse_failures += 1
+
+    def repaired_response(self, agent: str) -> None:
+        """استجابة لم تكن JSON صالحاً وأصلحها agents.schemas قبل التحقق"""
+        with self._lock:
+            self._repaired[agent] = self._repaired.get(agent, 0) + 1
+        current = _current_request.get()
+        if current is not None:
+            with current._lock:
+                current.repaired_responses += 1
+
+    def stage_restored(self, node: str) -> None:
+        with self._lock:
+            self._stages_restored[node] = self._stages_restored.get(node, 0) + 1
+        current = _current_request.get()
+        if current is not None:
+            with current._lock:
+                current.restored_stages.append(node)
+
+    def stage_reexecuted(self, node: str) -> None:
+        with self._lock:
+            self._stages_reexecuted[node] = self._stages_reexecuted.get(node, 0) + 1
+        current = _current_request.get()
+        if current is not None:
+            with current._lock:
+                current.reexecuted_stages.append(node)
+
+    def stage_counts(self) -> Dict[str, Tuple[int, int]]:
+        """{العقدة: (مرات استعادتها من نقطة حفظ، مرات إعادة تنفيذها في إعادة محاولة)}"""
+        with self._lock:
+            nodes = set(self._stages_restored) | set(self._stages_reexecuted)
+            return {
+                node: (self._stages_restored.get(node, 0), self._stages_reexecuted.get(node, 0))
+                for node in sorted(nodes)
+            }
+
+    def retry(self, model: str) -> None:
+        with self._lock:
+            self._retries[model] = self._retries.get(model, 0) + 1
+        current = _current_request.get()
+        if current is not None:
+            with current._lock:
+                current.retries += 1
+
+    def compaction(self, model: str, saved_tokens: int) -> None:
+        with self._lock:
+            self._compaction_saved[model] = self._compaction_saved.get(model, 0) + saved_tokens
+        current = _current_request.get()
+        if current is not None:
+            with current._lock:
+                current.compaction_saved_tokens += saved_tokens
+
+    def observe_request(self, model: str, seconds: float) -> None:
+        """زمن استدعاء نموذج واحد كما رآه الوكيل (مع إعادات المحاولة والطلب الاحتياطي)"""
+        with self._lock:
+            self._histogram(self._request_seconds, model).observe(seconds)
+
+    def hedge(self, model: str) -> None:
+        with self._lock:
+            self._hedges[model] = self._hedges.get(model, 0) + 1
+        current = _current_request.get()
+        if current is not None:
+            with current._lock:
+                current.hedges += 1
+
+    def hedge_won(self, model: str) -> None:
+        with self._lock:
+            self._hedge_wins[model] = self._hedge_wins.get(model, 0) + 1
+
+    def hedge_counts(self) -> Dict[str, Tuple[int, int]]:
+        """{النموذج: (طلبات احتياطية أُطلقت، منها سبقت الأصلي)}"""
+        with self._lock:
+            return {model: (count, self._hedge_wins.get(model, 0)) for model, count in self._hedges.items()}
+
+    def deadline_exceeded(self, phase: str) -> None:
+        with self._lock:
+            self._deadline_exceeded[phase] = self._deadline_exceeded.get(phase, 0) + 1
+        current = _current_request.get()
+        if current is not None:
+            with current._lock:
+                current.deadline_exceeded.append(phase)
+
+    def admission_wait(self, lane: str, seconds: float) -> None:
+        """انتظار طلب مقبول في طابور القبول (admission.py)، صفر عند القبول الفوري"""
+        with self._lock:
+            self._histogram(self._admission_wait, lane).observe(seconds)
+
+    def admission_rejected(self, lane: str, reason: str) -> None:
+        with self._lock:
+            key = (lane, reason)
+            self._admission_rejected[key] = self._admission_rejected.get(key, 0) + 1
+
+    def schedule(self, report: Dict) -> None:
+        """توقيت عقد رسم الاعتماديات ومساره الحرج للطلب الحالي (انظر scheduler.py)"""
+        current = _current_request.get()
+        if current is not None:
+            with current._lock:
+                current.schedule = report
+
+    def gauge(self, name: str, help_text: str, label: str, collect: Callable[[], Dict[str, float]]) -> None:
+        """قياس لحظي يُقرأ عند كل render: collect تعيد {قيمة التسمية: القيمة}"""
+        with self._lock:
+            self._gauges[name] = (help_text, label, collect)
+
+    def render(self) -> str:
+        """كل القياسات بصيغة نص Prometheus (text/plain; version=0.0.4)"""
+        lines = []
+        with self._lock:
+            gauges = dict(self._gauges)
+        # دوال القياس اللحظي قد تأخذ أقفالها الخاصة، فتُستدعى خارج قفل المجمّع
+        for name, (help_text, label, collect) in gauges.items():
+            _render_gauge(lines, name, help_text, {_labels(**{label: key}): value for key, value in collect().items()})
+        with self._lock:
+            _render_histograms(
+                lines, "agent_latency_seconds", "زمن استدعاء كل وكيل",
+                {_labels(agent=agent, model=model): h for (agent, model), h in self._agent_seconds.items()},
+            )
+            _render_histograms(
+                lines, "pipeline_phase_seconds", "زمن كل مرحلة من مسار التحليل",
+                {_labels(phase=phase): h for phase, h in self._phase_seconds.items()},
+            )
+            _render_histograms(
+                lines, "llm_request_seconds", "زمن استدعاء النموذج حسب النموذج، لرصد ذيل التوزيع",
+                {_labels(model=model): h for model, h in self._request_seconds.items()},
+            )
+            _render_histograms(
+                lines, "admission_queue_wait_seconds", "انتظار الطلبات المقبولة في طابور القبول حسب المسار",
+                {_labels(lane=lane): h for lane, h in self._admission_wait.items()},
+            )
+            _render_counter(
+                lines, "llm_tokens_total", "رموز النماذج حسب النوع (prompt/completion/cached)",
+                {_labels(model=model, kind=kind): value for (model, kind), value in self._tokens.items()},
+            )
+            _render_counter(
+                lines, "llm_cost_usd_total", "التكلفة التقديرية بالدولار",
+                {_labels(model=model): value for model, value in self._cost.items()},
+            )
+            _render_counter(
+                lines, "llm_parse_failures_total", "استجابات لم تكن JSON صالحاً",
+                {_labels(agent=agent): value for agent, value in self._parse_failures.items()},
+            )
+            _render_counter(
+                lines, "llm_repaired_responses_total", "استجابات JSON معطوبة أُصلحت بدل إعادة الطلب",
+                {_labels(agent=agent): value for agent, value in self._repaired.items()},
+            )
+            _render_counter(
+                lines, "llm_retries_total", "إعادات المحاولة في محدد المعدل",
+                {_labels(model=model): value for model, value in self._retries.items()},
+            )
+            _render_counter(
+                lines, "llm_compaction_saved_tokens_total", "رموز المدخلات الموفرة بضغط مدخلات التوليف",
+                {_labels(model=model): value for model, value in self._compaction_saved.items()},
+            )
+            _render_counter(
+                lines, "llm_hedged_requests_total", "طلبات احتياطية أُطلقت لتجاوز الطلب الأصلي p95",
+                {_labels(model=model): value for model, value in self._hedges.items()},
+            )
+            _render_counter(
+                lines, "llm_hedge_wins_total", "طلبات احتياطية سبقت الطلب الأصلي",
+                {_labels(model=model): value for model, value in self._hedge_wins.items()},
+            )
+            _render_counter(
+                lines, "pipeline_deadline_exceeded_total", "مراحل تجاوزت حصتها من مهلة التحليل",
+                {_labels(phase=phase): value for phase, value in self._deadline_exceeded.items()},
+            )
+            _render_counter(
+                lines, "pipeline_stages_restored_total", "عقد استُعيدت من نقاط الحفظ عند إعادة المحاولة",
+                {_labels(node=node): value for node, value in self._stages_restored.items()},
+            )
+            _render_counter(
+                lines, "pipeline_stages_reexecuted_total", "عقد أُعيد تنفيذها عند إعادة المحاولة بنفس request_id",
+                {_labels(node=node): value for node, value in self._stages_reexecuted.items()},
+            )
+            _render_counter(
+                lines, "admission_rejected_total", "طلبات رُفضت بـ 429 قبل بدء التحليل حسب المسار والسبب",
+                {_labels(lane=lane, reason=reason): value for (lane, reason), value in self._admission_rejected.items()},
+            )
+        return "\n".join(lines) + "\n"
+
+    def reset(self) -> None:
+        with self._lock:
+            for table in (
+                self._agent_seconds, self._phase_seconds, self._tokens,
+                self._cost, self._parse_failures, self._retries, self._compaction_saved,
+                self._request_seconds, self._hedges, self._hedge_wins, self._deadline_exceeded,
+                self._repaired, self._stages_restored, self._stages_reexecuted,
+                self._admission_wait, self._admission_rejected,
+            ):
+                table.clear()
+
+
+def _labels(**labels) -> str:
+    return ",".join(
+        '%s="%s"' % (name, str(value).replace("\\", "\\\\").replace('"', '\\"'))
+        for name, value in labels.items()
+    )
+
+
+def _format_value(value) -> str:
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+def _render_histograms(lines, name, help_text, histograms) -> None:
+    lines.append(f"# HELP {name} {help_text}")
+    lines.append(f"# TYPE {name} histogram")
+    for labels, histogram in histograms.items():
+        cumulative = 0
+        for bound, count in zip(histogram.buckets, histogram.counts):
+            cumulative += count
+            lines.append(f'{name}_bucket{{{labels},le="{bound}"}} {cumulative}')
+        lines.append(f'{name}_bucket{{{labels},le="+Inf"}} {histogram.count}')
+        lines.append(f"{name}_sum{{{labels}}} {_format_value(histogram.sum)}")
+        lines.append(f"{name}_count{{{labels}}} {histogram.count}")
+
+
+def _render_counter(lines, name, help_text, values) -> None:
+    lines.append(f"# HELP {name} {help_text}")
+    lines.append(f"# TYPE {name} counter")
+    for labels, value in values.items():
+        lines.append(f"{name}{{{labels}}} {_format_value(value)}")
+
+
+def _render_gauge(lines, name, help_text, values) -> None:
+    lines.append(f"# HELP {name} {help_text}")
+    lines.append(f"# TYPE {name} gauge")
+    for labels, value in values.items():
+        lines.append(f"{name}{{{labels}}} {_format_value(value)}")
+
+
+# المجمّع المشترك لكل الوكلاء والمسارات في العملية
+metrics = MetricsRegistry()
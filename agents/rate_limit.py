@@ -0,0 +1,271 @@
+import asyncio
+import functools
+import random
+import threading
+import time
+from dataclasses import dataclass
+from typing import Dict, Optional
+
+from .metrics import metrics
+from .tokens import estimate_tokens
+
+
+@functools.lru_cache(maxsize=None)
+def retryable_errors():
+    """أخطاء عابرة تستحق إعادة المحاولة؛ أي خطأ آخر (مثل 400 أو 401) يُرفع فوراً.
+
+    استيراد openai مؤجل إلى أول خطأ: استيراد agents لا يدفع كلفته.
+    """
+    import openai
+
+    return (
+        openai.RateLimitError,
+        openai.APITimeoutError,
+        openai.APIConnectionError,
+        openai.InternalServerError,
+    )
+
+
+@dataclass
+class ModelLimits:
+    requests_per_minute: int
+    tokens_per_minute: int
+    # تقدير طول الاستجابة المحجوز مسبقاً، ويُصحح لاحقاً من response.usage
+    expected_completion_tokens: int = 1000
+
+
+DEFAULT_LIMITS = {
+    "gpt-4o": ModelLimits(requests_per_minute=500, tokens_per_minute=30_000, expected_completion_tokens=1500),
+    "gpt-4o-mini": ModelLimits(requests_per_minute=500, tokens_per_minute=200_000),
+}
+FALLBACK_LIMITS = ModelLimits(requests_per_minute=500, tokens_per_minute=30_000)
+
+
+class _ModelBudget:
+    """دلوا رموز (طلبات ورموز) لنموذج واحد بنظام الحجز المسبق.
+
+    كل استدعاء يخصم حصته فوراً حتى لو أصبح الرصيد سالباً، وينتظر بقدر العجز
+    الذي سببه. بذلك تُصطف الاستدعاءات المتزامنة بترتيب وصولها وتُوزع الدفعات
+    المفاجئة على الزمن بدلاً من إرسالها معاً.
+    """
+
+    def __init__(self, limits: ModelLimits, now: float):
+        self.limits = limits
+        self.requests = float(limits.requests_per_minute)
+        self.tokens = float(limits.tokens_per_minute)
+        self.updated_at = now
+        self.blocked_until = 0.0
+        self.stats = {
+            "requests": 0,
+            "retries": 0,
+            "rate_limited": 0,
+            "failures": 0,
+            "estimated_tokens": 0,
+            "actual_tokens": 0,
+            "waited_seconds": 0.0,
+            "in_flight": 0,
+        }
+
+    def refill(self, now: float) -> None:
+        elapsed = max(0.0, now - self.updated_at)
+        self.updated_at = now
+        self.requests = min(
+            self.limits.requests_per_minute,
+            self.requests + elapsed * self.limits.requests_per_minute / 60,
+        )
+        self.tokens = min(
+            self.limits.tokens_per_minute,
+            self.tokens + elapsed * self.limits.tokens_per_minute / 60,
+        )
+
+    def reserve(self, tokens: int, now: float) -> float:
+        """خصم الحصة وإرجاع مدة الانتظار اللازمة قبل الإرسال"""
+        self.refill(now)
+        self.requests -= 1
+        self.tokens -= tokens
+        wait = max(
+            -self.requests * 60 / self.limits.requests_per_minute if self.requests < 0 else 0.0,
+            -self.tokens * 60 / self.limits.tokens_per_minute if self.tokens < 0 else 0.0,
+            self.blocked_until - now,
+        )
+        return max(0.0, wait)
+
+
+class RateLimiter:
+    """محدد معدل مشترك على مستوى العملية لكل نموذج، مع إعادة محاولة بتراجع أسي عشوائي.
+
+    الحالة الحالية لكل نموذج متاحة عبر snapshot().
+    """
+
+    def __init__(
+        self,
+        limits: Optional[Dict[str, ModelLimits]] = None,
+        max_retries: int = 5,
+        base_delay: float = 0.5,
+        max_delay: float = 30.0,
+        clock=time.monotonic,
+        sleep=time.sleep,
+        async_sleep=asyncio.sleep,
+    ):
+        self.limits = dict(DEFAULT_LIMITS if limits is None else limits)
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self._clock = clock
+        self._sleep = sleep
+        self._async_sleep = async_sleep
+        self._budgets: Dict[str, _ModelBudget] = {}
+        self._lock = threading.Lock()
+
+    def configure(self, model: str, limits: ModelLimits) -> None:
+        with self._lock:
+            self.limits[model] = limits
+            if model in self._budgets:
+                self._budgets[model].limits = limits
+
+    def _budget(self, model: str) -> _ModelBudget:
+        budget = self._budgets.get(model)
+        if budget is None:
+            budget = _ModelBudget(self.limits.get(model, FALLBACK_LIMITS), self._clock())
+            self._budgets[model] = budget
+        return budget
+
+    def _reserve(self, model: str, estimated: int) -> float:
+        with self._lock:
+            budget = self._budget(model)
+            wait = budget.reserve(estimated, self._clock())
+            budget.stats["estimated_tokens"] += estimated
+            budget.stats["waited_seconds"] += wait
+            budget.stats["in_flight"] += 1
+            return wait
+
+    def _settle(self, model: str, estimated: int, response) -> None:
+        """تصحيح الرصيد بالاستهلاك الفعلي من response.usage بدلاً من التقدير"""
+        usage = getattr(response, "usage", None)
+        actual = getattr(usage, "total_tokens", None)
+        with self._lock:
+            budget = self._budget(model)
+            budget.stats["requests"] += 1
+            budget.stats["in_flight"] -= 1
+            if isinstance(actual, int):
+                budget.tokens += estimated - actual
+                budget.stats["actual_tokens"] += actual
+
+    def _retry_delay(
+        self, model: str, error: Exception, attempt: int, max_retries: Optional[int] = None
+    ) -> Optional[float]:
+        """مدة الانتظار قبل المحاولة التالية، أو None إذا لم يعد هناك ما يبرر الإعادة"""
+        import openai
+
+        if max_retries is None:
+            max_retries = self.max_retries
+        if not isinstance(error, retryable_errors()) or attempt >= max_retries:
+            with self._lock:
+                self._budget(model).stats["failures"] += 1
+            return None
+
+        delay = random.uniform(0, min(self.max_delay, self.base_delay * 2 ** attempt))
+        retry_after = _retry_after_seconds(error)
+        if retry_after is not None:
+            delay = max(delay, retry_after)
+
+        with self._lock:
+            budget = self._budget(model)
+            budget.stats["retries"] += 1
+            metrics.retry(model)
+            if isinstance(error, openai.RateLimitError):
+                # 429 يعني أن الحد الفعلي لدى المزود أُستنفد: نوقف كل المستدعين لهذا النموذج
+                budget.stats["rate_limited"] += 1
+                budget.blocked_until = max(budget.blocked_until, self._clock() + delay)
+        return delay
+
+    def _release(self, model: str) -> None:
+        with self._lock:
+            self._budget(model).stats["in_flight"] -= 1
+
+    def call(self, model: str, prompt: str, fn, max_retries: Optional[int] = None):
+        """تنفيذ fn() ضمن ميزانية النموذج مع إعادة المحاولة عند الأخطاء العابرة.
+
+        max_retries يتجاوز حد المحدد لهذا الاستدعاء (0 لمحاولة واحدة).
+        """
+        estimated = estimate_tokens(prompt) + self.limits.get(model, FALLBACK_LIMITS).expected_completion_tokens
+        attempt = 0
+        while True:
+            wait = self._reserve(model, estimated)
+            if wait:
+                self._sleep(wait)
+            try:
+                response = fn()
+            except Exception as e:
+                self._release(model)
+                delay = self._retry_delay(model, e, attempt, max_retries)
+                if delay is None:
+                    raise
+                self._sleep(delay)
+                attempt += 1
+                continue
+            except BaseException:
+                self._release(model)
+                raise
+            self._settle(model, estimated, response)
+            return response
+
+    async def call_async(self, model: str, prompt: str, fn, max_retries: Optional[int] = None):
+        """مثل call لكن fn() تعيد coroutine والانتظار لا يحجز خيطاً"""
+        estimated = estimate_tokens(prompt) + self.limits.get(model, FALLBACK_LIMITS).expected_completion_tokens
+        attempt = 0
+        while True:
+            wait = self._reserve(model, estimated)
+            if wait:
+                await self._async_sleep(wait)
+            try:
+                response = await fn()
+            except Exception as e:
+                self._release(model)
+                delay = self._retry_delay(model, e, attempt, max_retries)
+                if delay is None:
+                    raise
+                await self._async_sleep(delay)
+                attempt += 1
+                continue
+            except BaseException:
+                self._release(model)
+                raise
+            self._settle(model, estimated, response)
+            return response
+
+    def snapshot(self) -> Dict[str, Dict]:
+        now = self._clock()
+        with self._lock:
+            state = {}
+            for model, budget in self._budgets.items():
+                budget.refill(now)
+                state[model] = {
+                    "requests_per_minute": budget.limits.requests_per_minute,
+                    "tokens_per_minute": budget.limits.tokens_per_minute,
+                    "available_requests": round(budget.requests, 2),
+                    "available_tokens": round(budget.tokens, 1),
+                    "blocked_for_seconds": round(max(0.0, budget.blocked_until - now), 3),
+                    **budget.stats,
+                }
+            return state
+
+
+def _retry_after_seconds(error: Exception) -> Optional[float]:
+    response = getattr(error, "response", None)
+    headers = getattr(response, "headers", None)
+    if not headers:
+        return None
+    for header, scale in (("retry-after-ms", 0.001), ("retry-after", 1.0)):
+        value = headers.get(header)
+        if value is None:
+            continue
+        try:
+            return max(0.0, float(value) * scale)
+        except (TypeError, ValueError):
+            continue
+    return None
+
+
+# المحدد المشترك لكل الوكلاء في العملية
+default_rate_limiter = RateLimiter()
@@ -0,0 +1,127 @@
+"""سجل الوكلاء: كل عقدة تعلن مدخلاتها ومخرجاتها، ومنها يُبنى رسم الاعتماديات.
+
+إضافة منظور جديد (تنظيمي أو تشغيلي مثلاً) تعني تسجيل وكيله هنا فقط؛ المجدول
+(scheduler.DAGScheduler) يشغله بالتوازي مع كل عقدة لا تعتمد عليه.
+"""
+from dataclasses import dataclass
+from typing import Any, Dict, Iterator, List, Optional, Set, Tuple
+
+
+@dataclass(frozen=True)
+class AgentNode:
+    name: str
+    agent: Any
+    # أسماء مخرجات عقد أخرى، بترتيب معاملات invoke بعد الفكرة
+    inputs: Tuple[str, ...]
+    outputs: Tuple[str, ...]
+    phase: str
+    # ثوانٍ قبل اعتبار العقدة عالقة؛ None بلا حد
+    timeout: Optional[float] = None
+
+    def run(self, business_idea: str, values: Dict[str, Any]) -> Dict[str, Any]:
+        result = self.agent.invoke(business_idea, *(values[name] for name in self.inputs))
+        return self.agent.split(result, self.outputs)
+
+    async def run_async(self, business_idea: str, values: Dict[str, Any]) -> Dict[str, Any]:
+        result = await self.agent.invoke_async(business_idea, *(values[name] for name in self.inputs))
+        return self.agent.split(result, self.outputs)
+
+    def stream(self, business_idea: str, values: Dict[str, Any]):
+        """يولّد ("token", نص) ثم ("result", المخرجات) للوكلاء الذين يدعمون البث"""
+        for kind, value in self.agent.invoke_stream(business_idea, *(values[name] for name in self.inputs)):
+            yield kind, self.agent.split(value, self.outputs) if kind == "result" else value
+
+    @property
+    def streams(self) -> bool:
+        return callable(getattr(self.agent, "invoke_stream", None))
+
+    def remember(self, business_idea: str, values: Dict[str, Any]) -> None:
+        """زرع نتيجة معروفة في ذاكرة الوكيل المؤقتة تحت مدخلاتها"""
+        self.agent.remember(
+            self.agent.combine(values, self.outputs), business_idea, *(values[name] for name in self.inputs)
+        )
+
+
+class AgentRegistry:
+    """العقد بترتيب التسجيل، مع التحقق من الاعتماديات والدورات"""
+
+    def __init__(self):
+        self._nodes: Dict[str, AgentNode] = {}
+
+    def register(
+        self,
+        agent,
+        name: Optional[str] = None,
+        inputs: Optional[Tuple[str, ...]] = None,
+        outputs: Optional[Tuple[str, ...]] = None,
+        phase: Optional[str] = None,
+        timeout: Optional[float] = None,
+    ) -> AgentNode:
+        """تسجيل وكيل؛ ما لم يُحدد يُؤخذ من خصائص صنفه (node_name, inputs, outputs, phase)"""
+        name = name or agent.node_name
+        if not name:
+            raise ValueError(f"{type(agent).__name__} has no node_name; pass name=")
+        if name in self._nodes:
+            raise ValueError(f"agent node {name!r} is already registered")
+        outputs = tuple(outputs or agent.outputs or (name,))
+        taken = self.producers()
+        for output in outputs:
+            if output in taken:
+                raise ValueError(f"output {output!r} is already produced by node {taken[output]!r}")
+        node = AgentNode(
+            name=name,
+            agent=agent,
+            inputs=tuple(agent.inputs if inputs is None else inputs),
+            outputs=outputs,
+            phase=phase or agent.phase,
+            timeout=timeout,
+        )
+        self._nodes[name] = node
+        return node
+
+    def unregister(self, name: str) -> AgentNode:
+        return self._nodes.pop(name)
+
+    def __getitem__(self, name: str) -> AgentNode:
+        return self._nodes[name]
+
+    def __contains__(self, name: str) -> bool:
+        return name in self._nodes
+
+    def __iter__(self) -> Iterator[AgentNode]:
+        return iter(list(self._nodes.values()))
+
+    def __len__(self) -> int:
+        return len(self._nodes)
+
+    def producers(self) -> Dict[str, str]:
+        """{اسم المخرج: اسم العقدة التي تنتجه}"""
+        return {output: node.name for node in self._nodes.values() for output in node.outputs}
+
+    def outputs(self) -> List[str]:
+        return [output for node in self._nodes.values() for output in node.outputs]
+
+    def dependencies(self) -> Dict[str, Set[str]]:
+        """{اسم العقدة: أسماء العقد التي تنتج مدخلاتها}"""
+        producers = self.producers()
+        dependencies = {}
+        for node in self._nodes.values():
+            missing = [name for name in node.inputs if name not in producers]
+            if missing:
+                raise ValueError(f"agent node {node.name!r} needs {missing} which no registered node produces")
+            dependencies[node.name] = {producers[name] for name in node.inputs}
+        return dependencies
+
+    def order(self) -> List[AgentNode]:
+        """ترتيب طوبولوجي مستقر (ترتيب التسجيل عند التعادل)؛ ValueError عند وجود دورة"""
+        dependencies = self.dependencies()
+        ordered, placed = [], set()
+        while len(ordered) < len(dependencies):
+            ready = [name for name, deps in dependencies.items() if name not in placed and deps <= placed]
+            if not ready:
+                cycle = sorted(set(dependencies) - placed)
+                raise ValueError(f"agent nodes {cycle} form a dependency cycle")
+            for name in ready:
+                ordered.append(self._nodes[name])
+                placed.add(name)
+        return ordered
@@ -0,0 +1,185 @@
+"""توجيه التوليف بحسب الخلاف بين المحللين.
+
+gpt-4o أبطأ وأغلى خطوة في المسار، وعمله حل التعارض بين التحليلات الثلاثة.
+عندما يتفق المحللون على مستوى المخاطرة بثقة عالية لا يبقى تعارض يُحل، فتُبنى
+المذكرة من قالب ثابت، أو تُكتب بـ gpt-4o-mini عند خلاف محدود، ولا يصل إلى
+gpt-4o إلا الخلاف الحقيقي. المسار المتخذ يُسجل في StrategicMemo.synthesis_route.
+"""
+import os
+import threading
+from dataclasses import dataclass
+from typing import Dict, Optional, Tuple
+
+from .metrics import usage_cost
+from .serialization import plain
+
+
+RISK_ORDER = {"منخفض": 0, "متوسط": 1, "عالي": 2}
+# رموز مذكرة نموذجية، لتقدير الكلفة الموفرة دون انتظار استجابة gpt-4o
+MEMO_COMPLETION_TOKENS = 700
+
+TEMPLATE_ROUTE = "template"
+# مذكرة بُنيت مما اكتمل قبل نهاية مهلة التحليل (scheduler.Deadline)
+DEGRADED_ROUTE = "degraded"
+
+
+def disagreement_score(*analyses) -> float:
+    """0 اتفاق تام بثقة كاملة، 1 أقصى خلاف.
+
+    نصف الوزن لتباعد مستويات المخاطرة، والباقي لضعف أدنى ثقة ولتباعد الثقات.
+    """
+    risks = [RISK_ORDER.get(analysis.risk_level, 1) for analysis in analyses]
+    confidences = [min(1.0, max(0.0, float(analysis.confidence_score))) for analysis in analyses]
+    risk_spread = (max(risks) - min(risks)) / 2
+    uncertainty = 1 - min(confidences)
+    confidence_spread = max(confidences) - min(confidences)
+    return min(1.0, 0.5 * risk_spread + 0.3 * uncertainty + 0.2 * confidence_spread)
+
+
+def template_memo(business_idea: str, market, financial, competitive):
+    """مذكرة حتمية من التحليلات المتفقة، بلا استدعاء نموذج"""
+    from .strategic_synthesizer import StrategicMemo
+
+    confidence = (market.confidence_score + financial.confidence_score + competitive.confidence_score) / 3
+    risk_level = market.risk_level
+    recommendation = {
+        "منخفض": "المضي في المشروع",
+        "متوسط": "المضي بحذر مع مراقبة المؤشرات الرئيسية",
+        "عالي": "عدم المضي قبل معالجة المخاطر المشتركة",
+    }.get(risk_level, "المضي بحذر")
+    return StrategicMemo(
+        executive_summary=(
+            f"اتفق المحللون الثلاثة على أن مخاطرة الفكرة {risk_level} بثقة متوسطة {confidence:.0%}. "
+            f"الطلب: {market.market_demand} الاقتصاديات: {financial.unit_economics} "
+            f"الحماية التنافسية: {competitive.moat_strength}"
+        ),
+        detailed_analysis={
+            "market_perspective": f"{market.market_demand} {market.demand_gaps}".strip(),
+            "financial_perspective": f"{financial.unit_economics} {financial.financial_stability}".strip(),
+            "competitive_perspective": f"{competitive.moat_strength} {competitive.unique_value_proposition}".strip(),
+        },
+        overall_risk_level=risk_level,
+        overall_confidence_score=round(confidence, 2),
+        final_recommendation=recommendation,
+        conflicts_identified="لا تعارض: المحللون متفقون على مستوى المخاطرة بثقة عالية",
+        resolution_rationale="بُنيت المذكرة من التحليلات مباشرة لعدم وجود تعارض يتطلب الحل",
+    )
+
+
+def degraded_memo(business_idea: str, analyses: Dict[str, object], missing: Tuple[str, ...]):
+    """مذكرة من التحليلات المكتملة فقط عندما لم يتسع الوقت للتوليف.
+
+    الثقة متوسط ثقات المكتمل مضروباً في نسبته، والمخاطرة أعلى مستوى بينها:
+    تحليل ناقص لا يبرر توصية متفائلة.
+    """
+    from .strategic_synthesizer import StrategicMemo
+
+    completed = [analysis for name, analysis in analyses.items() if name not in missing]
+    if completed:
+        confidence = sum(analysis.confidence_score for analysis in completed) / len(completed)
+        confidence *= len(completed) / len(analyses)
+        risk_level = max((analysis.risk_level for analysis in completed), key=lambda level: RISK_ORDER.get(level, 1))
+    else:
+        confidence, risk_level = 0.0, "متوسط"
+    missing_text = "، ".join(missing)
+    return StrategicMemo(
+        executive_summary=(
+            f"لم يكتمل التحليل ضمن المهلة المحددة (ناقص: {missing_text}). "
+            f"المذكرة مبنية على {len(completed)} من {len(analyses)} تحليلات دون توليف."
+        ),
+        detailed_analysis={
+            f"{name}_perspective": " ".join(
+                value for value in plain(analysis).values() if isinstance(value, str)
+            )
+            for name, analysis in analyses.items() if name not in missing
+        },
+        overall_risk_level=risk_level,
+        overall_confidence_score=round(confidence, 2),
+        final_recommendation="إعادة التحليل بمهلة أطول قبل اتخاذ القرار",
+        conflicts_identified="لم تُفحص التعارضات: التوليف لم يكتمل ضمن المهلة",
+        resolution_rationale="مذكرة احتياطية من التحليلات المكتملة فقط",
+        synthesis_route=DEGRADED_ROUTE,
+    )
+
+
+class RoutingStats:
+    """عدد المذكرات وزمنها لكل مسار، والكلفة الموفرة مقارنة بإرسال كل شيء إلى gpt-4o"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._routes: Dict[str, Dict[str, float]] = {}
+        self._cost_saved = 0.0
+
+    def record(self, route: str, seconds: float, cost_saved: float) -> None:
+        with self._lock:
+            stats = self._routes.setdefault(route, {"count": 0, "seconds": 0.0})
+            stats["count"] += 1
+            stats["seconds"] += seconds
+            self._cost_saved += cost_saved
+
+    def counts(self) -> Dict[str, int]:
+        with self._lock:
+            return {route: stats["count"] for route, stats in self._routes.items()}
+
+    def snapshot(self, full_route: str = "gpt-4o") -> Dict:
+        """الزمن الموفر تقديري: متوسط زمن gpt-4o المرصود مطروحاً منه زمن كل مذكرة أرخص"""
+        with self._lock:
+            routes = {route: dict(stats) for route, stats in self._routes.items()}
+            cost_saved = self._cost_saved
+        full = routes.get(full_route)
+        full_mean = full["seconds"] / full["count"] if full else None
+        latency_saved = None
+        if full_mean is not None:
+            latency_saved = sum(
+                full_mean * stats["count"] - stats["seconds"]
+                for route, stats in routes.items() if route != full_route
+            )
+        return {
+            "routes": {
+                route: {"count": stats["count"], "mean_seconds": stats["seconds"] / stats["count"]}
+                for route, stats in routes.items()
+            },
+            "cost_saved_usd": round(cost_saved, 6),
+            "latency_saved_seconds": latency_saved,
+        }
+
+    def reset(self) -> None:
+        with self._lock:
+            self._routes.clear()
+            self._cost_saved = 0.0
+
+
+# إحصاءات كل المُوجِّهات في العملية
+synthesis_routing_stats = RoutingStats()
+
+
+@dataclass(frozen=True)
+class SynthesisRouter:
+    """الحدان على disagreement_score: أقل من template_below قالب، وأقل من cheap_below نموذج أرخص"""
+    template_below: float = 0.1
+    cheap_below: float = 0.4
+    cheap_model: str = "gpt-4o-mini"
+
+    @classmethod
+    def from_env(cls) -> Optional["SynthesisRouter"]:
+        """SYNTHESIS_TEMPLATE_BELOW و SYNTHESIS_CHEAP_BELOW؛ SYNTHESIS_ROUTING=off يعيد None"""
+        if os.getenv("SYNTHESIS_ROUTING", "on").lower() in ("0", "off", "false", "no"):
+            return None
+        return cls(
+            template_below=float(os.getenv("SYNTHESIS_TEMPLATE_BELOW", cls.template_below)),
+            cheap_below=float(os.getenv("SYNTHESIS_CHEAP_BELOW", cls.cheap_below)),
+            cheap_model=os.getenv("SYNTHESIS_CHEAP_MODEL", cls.cheap_model),
+        )
+
+    def route(self, score: float, full_model: str) -> str:
+        if score < self.template_below:
+            return TEMPLATE_ROUTE
+        if score < self.cheap_below:
+            return self.cheap_model
+        return full_model
+
+    def cost_saved(self, route: str, full_model: str, prompt_tokens: int) -> float:
+        full = usage_cost(full_model, prompt_tokens, MEMO_COMPLETION_TOKENS, 0)
+        if route == TEMPLATE_ROUTE:
+            return full
+        return full - usage_cost(route, prompt_tokens, MEMO_COMPLETION_TOKENS, 0)
@@ -0,0 +1,249 @@
+"""مخططات pydantic لاستجابات الوكلاء، وإصلاح JSON المعطوب قبل التحقق منه.
+
+المخطط نفسه يُرسل مع الطلب (response_format من نوع json_schema بوضع strict)
+فيلتزم به النموذج، ثم يُتحقق به من الاستجابة: "85%" أو 85 في confidence_score
+تصبح 0.85، و "High" أو "مرتفع" في مستوى المخاطرة تصبح "عالي". ما لم يكن JSON
+صالحاً (أسوار markdown، فاصلة زائدة، استجابة مقطوعة) يُصلح قبل الاستسلام.
+
+تُستورد عند أول طلب لا عند استيراد agents: pydantic وحده يضيف ~100ms للبدء.
+"""
+import json
+import os
+import re
+from functools import lru_cache
+from typing import Any, Dict, List, Literal, Optional, Tuple
+
+from pydantic import BaseModel, ConfigDict, field_validator
+
+
+RiskLevel = Literal["منخفض", "متوسط", "عالي"]
+
+RISK_SYNONYMS = {
+    "منخفض": "منخفض", "منخفضة": "منخفض", "low": "منخفض",
+    "متوسط": "متوسط", "متوسطة": "متوسط", "medium": "متوسط", "moderate": "متوسط",
+    "عالي": "عالي", "عالية": "عالي", "مرتفع": "عالي", "مرتفعة": "عالي", "high": "عالي",
+}
+
+
+def _risk(value):
+    return RISK_SYNONYMS.get(str(value).strip().lower(), "متوسط")
+
+
+def _confidence(value):
+    """0.85 و "0.85" و "85%" و 85 كلها 0.85؛ ما لا يُفهم يصبح 0.5.
+
+    القيم من 2 فأعلى نسب مئوية؛ ما بين 1 و 2 (1.5 مثلاً) تجاوز طفيف يُقص إلى 1
+    بدل قراءته 0.015، وكل ناتج يُقص إلى [0, 1].
+    """
+    text = str(value).strip()
+    percent = text.endswith("%")
+    try:
+        number = float(text.rstrip("%").strip())
+    except ValueError:
+        return 0.5
+    if percent or number >= 2:
+        number /= 100
+    return min(1.0, max(0.0, number))
+
+
+def _text(value):
+    if value is None:
+        return ""
+    if isinstance(value, list):
+        return "، ".join(_text(item) for item in value)
+    if isinstance(value, dict):
+        return " ".join(_text(item) for item in value.values())
+    return str(value)
+
+
+class _Schema(BaseModel):
+    model_config = ConfigDict(extra="ignore")
+
+    @field_validator("*", mode="before")
+    @classmethod
+    def _coerce(cls, value, info):
+        annotation = cls.model_fields[info.field_name].annotation
+        if annotation is str:
+            return _text(value)
+        if annotation is float:
+            return _confidence(value)
+        if annotation is RiskLevel:
+            return _risk(value)
+        return value
+
+
+class MarketSchema(_Schema):
+    market_demand: str = ""
+    customer_segments: str = ""
+    market_trends: str = ""
+    demand_gaps: str = ""
+    risk_level: RiskLevel = "متوسط"
+    confidence_score: float = 0.5
+
+
+class FinancialSchema(_Schema):
+    unit_economics: str = ""
+    operational_costs: str = ""
+    revenue_streams: str = ""
+    financial_stability: str = ""
+    risk_level: RiskLevel = "متوسط"
+    confidence_score: float = 0.5
+
+
+class CompetitiveSchema(_Schema):
+    entry_barriers: str = ""
+    moat_strength: str = ""
+    ease_of_replication: str = ""
+    unique_value_proposition: str = ""
+    risk_level: RiskLevel = "متوسط"
+    confidence_score: float = 0.5
+
+
+class FusedSchema(_Schema):
+    market: MarketSchema = MarketSchema()
+    financial: FinancialSchema = FinancialSchema()
+    competitive: CompetitiveSchema = CompetitiveSchema()
+
+
+class PerspectivesSchema(_Schema):
+    # منظورات إضافية يكتبها النموذج خارج المخطط (في وضع json_object) تبقى كما هي
+    model_config = ConfigDict(extra="allow")
+
+    market_perspective: str = ""
+    financial_perspective: str = ""
+    competitive_perspective: str = ""
+
+
+class MemoSchema(_Schema):
+    executive_summary: str = ""
+    detailed_analysis: PerspectivesSchema = PerspectivesSchema()
+    overall_risk_level: RiskLevel = "متوسط"
+    overall_confidence_score: float = 0.5
+    final_recommendation: str = ""
+    conflicts_identified: str = ""
+    resolution_rationale: str = ""
+
+    @field_validator("detailed_analysis", mode="before")
+    @classmethod
+    def _perspectives(cls, value):
+        if isinstance(value, str):
+            return {"market_perspective": value}
+        return value if isinstance(value, dict) else {}
+
+
+SCHEMAS = {
+    "market_analysis": MarketSchema,
+    "financial_analysis": FinancialSchema,
+    "competitive_analysis": CompetitiveSchema,
+    "fused_analysis": FusedSchema,
+    "strategic_memo": MemoSchema,
+}
+
+
+def structured_outputs_enabled() -> bool:
+    """STRUCTURED_OUTPUTS=off يعود إلى json_object لمزودين لا يدعمون json_schema"""
+    return os.getenv("STRUCTURED_OUTPUTS", "on").lower() not in ("0", "off", "false", "no")
+
+
+@lru_cache(maxsize=None)
+def response_format(name: str) -> Dict[str, Any]:
+    """response_format بوضع strict: كل الحقول مطلوبة ولا حقول إضافية ولا قيم افتراضية"""
+    schema = _strict(SCHEMAS[name].model_json_schema())
+    return {"type": "json_schema", "json_schema": {"name": name, "strict": True, "schema": schema}}
+
+
+def _strict(node):
+    if isinstance(node, list):
+        return [_strict(item) for item in node]
+    if not isinstance(node, dict):
+        return node
+    node = {key: _strict(value) for key, value in node.items() if key not in ("default", "title")}
+    if node.get("type") == "object":
+        node["required"] = list(node.get("properties", {}))
+        node["additionalProperties"] = False
+    return node
+
+
+def decode(content: str, name: Optional[str] = None) -> Tuple[Dict[str, Any], List[str]]:
+    """(القاموس بعد التحقق بمخطط name، الإصلاحات التي احتاجها النص).
+
+    JSONDecodeError الأصلي يُرفع إذا لم يُفلح الإصلاح.
+    """
+    repairs: List[str] = []
+    try:
+        data = json.loads(content)
+    except json.JSONDecodeError as error:
+        data = _repair(content, repairs)
+        if data is None:
+            raise error
+    if name is not None:
+        if not isinstance(data, dict):
+            raise json.JSONDecodeError(f"expected a JSON object for {name}", content, 0)
+        data = SCHEMAS[name].model_validate(data).model_dump()
+    return data, repairs
+
+
+_FENCE = re.compile(r"^```[a-zA-Z]*\s*|\s*```\s*$")
+
+
+def _repair(content: str, repairs: List[str]):
+    text = content.strip()
+    if text.startswith("```"):
+        text = _FENCE.sub("", text)
+        repairs.append("fences")
+    start = text.find("{")
+    if start < 0:
+        return None
+    if start > 0:
+        repairs.append("leading_text")
+    text, closed = _scan(text[start:], repairs)
+    for candidate in (text, closed):
+        try:
+            return json.loads(candidate)
+        except json.JSONDecodeError:
+            continue
+    return None
+
+
+def _scan(text: str, repairs: List[str]) -> Tuple[str, str]:
+    """(النص حتى نهاية الكائن الأول بلا فواصل زائدة، ونفس النص مغلقاً إن كان مقطوعاً)"""
+    out, stack = [], []
+    in_string = escape = False
+    for index, char in enumerate(text):
+        if in_string:
+            out.append(char)
+            if escape:
+                escape = False
+            elif char == "\\":
+                escape = True
+            elif char == '"':
+                in_string = False
+            continue
+        if char == '"':
+            in_string = True
+        elif char in "{[":
+            stack.append("}" if char == "{" else "]")
+        elif char in "}]":
+            # فاصلة قبل قوس الإغلاق مباشرة
+            while out and out[-1].isspace():
+                out.pop()
+            if out and out[-1] == ",":
+                out.pop()
+                repairs.append("trailing_comma")
+            if stack:
+                stack.pop()
+            out.append(char)
+            if not stack:
+                if text[index + 1:].strip():
+                    repairs.append("trailing_text")
+                return "".join(out), "".join(out)
+            continue
+        out.append(char)
+
+    # استجابة مقطوعة (max_tokens أو انقطاع البث): إغلاق النص والأقواس المفتوحة
+    repairs.append("truncated")
+    closed = "".join(out) + ('"' if in_string else "")
+    closed = closed.rstrip().rstrip(",")
+    if closed.endswith(":"):
+        closed += "null"
+    return "".join(out), closed + "".join(reversed(stack))
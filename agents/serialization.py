@@ -0,0 +1,55 @@
+"""ترميز JSON سريع لأنواع النتائج بلا dataclasses.asdict.
+
+asdict ينسخ كل كائن تكرارياً (ومعه detailed_analysis) قبل أن يبدأ الترميز؛ هنا
+يُقرأ كل حقل مباشرة من الكائن ويُرمز كما هو. النص العربي يُكتب UTF-8 لا \\uXXXX
+(بايتان للحرف بدل ستة)، ومع orjson المثبت يُستخدم بدل json القياسي.
+"""
+import json
+import sys
+from dataclasses import fields
+from typing import Any, Dict, Tuple
+
+try:
+    import orjson
+except ImportError:  # اعتماد اختياري: json القياسي يعطي نفس الناتج بسرعة أقل
+    orjson = None
+
+
+# أنواع النتائج بلا __dict__ لكل كائن على Python 3.10+، وكما كانت على 3.9
+SLOTS = {"slots": True} if sys.version_info >= (3, 10) else {}
+
+_field_names: Dict[type, Tuple[str, ...]] = {}
+
+
+def plain(obj) -> Dict[str, Any]:
+    """قاموس سطحي بحقول الـ dataclass: القيم المتداخلة لا تُنسخ، ويرمزها dumps عند الوصول إليها"""
+    names = _field_names.get(type(obj))
+    if names is None:
+        names = _field_names[type(obj)] = tuple(f.name for f in fields(obj) if not f.name.startswith("_"))
+    return {name: getattr(obj, name) for name in names}
+
+
+def _default(obj):
+    try:
+        return plain(obj)
+    except TypeError:
+        raise TypeError(f"Object of type {type(obj).__name__} is not JSON serializable") from None
+
+
+def dumps(obj) -> bytes:
+    """JSON مضغوط بترميز UTF-8؛ الـ dataclasses في أي عمق تُرمز بحقولها"""
+    if orjson is not None:
+        return orjson.dumps(obj, default=_default)
+    return json.dumps(obj, ensure_ascii=False, separators=(",", ":"), default=_default).encode("utf-8")
+
+
+def merge(head: Dict[str, Any], encoded: bytes, tail: Dict[str, Any] = None) -> bytes:
+    """كائن JSON واحد من مفاتيح head ثم كائن مرمز مسبقاً ثم مفاتيح tail، بلا فك ترميزه"""
+    parts = [dumps(head)[:-1]] if head else [b"{"]
+    inner = encoded[1:-1]
+    if inner:
+        parts.append((b"," if head else b"") + inner)
+    if tail:
+        parts.append((b"," if head or inner else b"") + dumps(tail)[1:-1])
+    parts.append(b"}")
+    return b"".join(parts)
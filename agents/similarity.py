@@ -0,0 +1,154 @@
+"""فهرس تشابه للأفكار المحللة سابقاً: يلتقط إعادة صياغة نفس الفكرة بتعديلات طفيفة.
+
+النص يُوحد أولاً بقواعد عربية (حذف التشكيل والتطويل، توحيد الألف والياء والتاء
+المربوطة، حذف الترقيم)، ثم يُمثل بمجموعة أزواج كلمات متتالية (shingles).
+توقيع MinHash مقسوم إلى نطاقات LSH يحدد المرشحين في O(1) تقريباً، ويُتحقق من
+كل مرشح بمعامل Jaccard الفعلي على مجموعتي الأزواج.
+"""
+import hashlib
+import re
+import struct
+import threading
+import unicodedata
+from collections import OrderedDict
+from typing import Any, Optional, Tuple
+
+
+_TASHKEEL = re.compile("[\u0610-\u061a\u064b-\u065f\u0670\u06d6-\u06ed\u0640]")
+_LETTERS = str.maketrans({
+    "أ": "ا", "إ": "ا", "آ": "ا", "ٱ": "ا",
+    "ى": "ي", "ئ": "ي",
+    "ة": "ه",
+    "ؤ": "و",
+})
+_SENTENCE_END = re.compile(r"[.!?؟؛\n]+")
+_PUNCTUATION = re.compile(r"[^\w\s]|_")
+
+
+def normalize_arabic(text: str) -> str:
+    """توحيد النص للمقارنة: لا يُستخدم إلا داخل الفهرس ولا يُرسل إلى النموذج"""
+    text = unicodedata.normalize("NFKC", text)
+    text = _TASHKEEL.sub("", text).translate(_LETTERS).lower()
+    return " ".join(_PUNCTUATION.sub(" ", text).split())
+
+
+def shingles(text: str) -> frozenset:
+    """أزواج الكلمات المتتالية داخل كل جملة، فإعادة ترتيب الجمل لا تغير المجموعة"""
+    result = set()
+    for sentence in _SENTENCE_END.split(text):
+        words = normalize_arabic(sentence).split()
+        if len(words) == 1:
+            result.add(words[0])
+        result.update(f"{a} {b}" for a, b in zip(words, words[1:]))
+    return frozenset(result)
+
+
+def _hash_values(shingle: str, count: int) -> Tuple[int, ...]:
+    """count قيمة تجزئة مستقلة 32 بت للـ shingle من استدعاء shake_128 واحد"""
+    return struct.unpack(f"<{count}I", hashlib.shake_128(shingle.encode("utf-8")).digest(4 * count))
+
+
+class SimilarityIndex:
+    """فهرس MinHash/LSH في الذاكرة يعيد أقرب قيمة مخزنة فوق عتبة التشابه.
+
+    num_perm = bands * rows. مع 10 نطاقات × 7 صفوف يُرشح زوج تشابهه 0.85 باحتمال
+    نحو 98%، وزوج تشابهه 0.5 باحتمال نحو 7%، فيبقى عدد المرشحين صغيراً.
+    """
+
+    def __init__(
+        self,
+        threshold: float = 0.85,
+        bands: int = 10,
+        rows: int = 7,
+        max_entries: int = 200_000,
+    ):
+        self.threshold = threshold
+        self.bands = bands
+        self.rows = rows
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[int, Tuple[frozenset, Tuple, Any]]" = OrderedDict()
+        self._buckets = {}
+        self._next_id = 0
+        self._lock = threading.Lock()
+        self._counters = {"lookups": 0, "hits": 0, "candidates": 0}
+
+    def _band_keys(self, shingle_set: frozenset) -> Tuple:
+        num_perm = self.bands * self.rows
+        columns = zip(*[_hash_values(s, num_perm) for s in shingle_set])
+        signature = [min(column) for column in columns]
+        rows = self.rows
+        return tuple(
+            (band, hash(tuple(signature[band * rows:(band + 1) * rows])))
+            for band in range(self.bands)
+        )
+
+    def add(self, text: str, value: Any) -> None:
+        """نص بلا شرائح (علامات ترقيم فقط مثلاً) لا يُفهرس: لا شيء يقارَن به"""
+        shingle_set = shingles(text)
+        if not shingle_set:
+            return
+        band_keys = self._band_keys(shingle_set)
+        with self._lock:
+            entry_id = self._next_id
+            self._next_id += 1
+            self._entries[entry_id] = (shingle_set, band_keys, value)
+            for key in band_keys:
+                self._buckets.setdefault(key, []).append(entry_id)
+            while len(self._entries) > self.max_entries:
+                self._evict_oldest()
+
+    def _evict_oldest(self) -> None:
+        entry_id, (_, band_keys, _) = self._entries.popitem(last=False)
+        for key in band_keys:
+            bucket = self._buckets.get(key)
+            if bucket is None:
+                continue
+            bucket.remove(entry_id)
+            if not bucket:
+                del self._buckets[key]
+
+    def query(self, text: str) -> Optional[Tuple[float, Any]]:
+        """(التشابه، القيمة) لأقرب فكرة مخزنة تشابهها >= threshold، وإلا None"""
+        shingle_set = shingles(text)
+        if not shingle_set:
+            # بلا شرائح كل نصين "متطابقان"، فلا تُعاد مذكرة فكرة أخرى
+            with self._lock:
+                self._counters["lookups"] += 1
+            return None
+        band_keys = self._band_keys(shingle_set)
+        with self._lock:
+            self._counters["lookups"] += 1
+            candidates = set()
+            for key in band_keys:
+                candidates.update(self._buckets.get(key, ()))
+            self._counters["candidates"] += len(candidates)
+
+            best = None
+            for entry_id in candidates:
+                stored, _, value = self._entries[entry_id]
+                common = len(shingle_set & stored)
+                union = len(shingle_set) + len(stored) - common
+                similarity = common / union
+                if similarity >= self.threshold and (best is None or similarity > best[0]):
+                    best = (similarity, value)
+            if best is not None:
+                self._counters["hits"] += 1
+            return best
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self._buckets.clear()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def stats(self):
+        with self._lock:
+            lookups = self._counters["lookups"]
+            return {
+                **self._counters,
+                "entries": len(self._entries),
+                "hit_rate": self._counters["hits"] / lookups if lookups else 0.0,
+                "threshold": self.threshold,
+            }
@@ -1,11 +1,20 @@
-from typing import Dict, Any
-from dataclasses import dataclass
+import copy
+import time
+from typing import Dict, Any, Optional
+from dataclasses import dataclass, fields, replace
+from .base import BaseAgent
+from .compaction import compact_analyses
+from .metrics import metrics
+from .tokens import estimate_tokens
+from .prompts import SYNTHESIS_PROMPT
+from .serialization import SLOTS, plain
+from .routing import TEMPLATE_ROUTE, disagreement_score, synthesis_routing_stats, template_memo
 from .market_logic import MarketAnalysis
 from .financial_sustainability import FinancialAnalysis
 from .competitive_durability import CompetitiveAnalysis
 
 
-@dataclass
+@dataclass(**SLOTS)
 class StrategicMemo:
     executive_summary: str
     detailed_analysis: Dict[str, str]
@@ -14,12 +23,42 @@ class StrategicMemo:
     final_recommendation: str
     conflicts_identified: str
     resolution_rationale: str
+    # من كتب المذكرة: "template" أو "degraded" أو اسم النموذج، ودرجة الخلاف التي حددت ذلك (agents/routing.py)
+    synthesis_route: str = "gpt-4o"
+    disagreement_score: Optional[float] = None
+    
+    @classmethod
+    def from_dict(cls, result: Dict[str, Any]) -> "StrategicMemo":
+        return cls(
+            executive_summary=result.get("executive_summary", ""),
+            detailed_analysis=result.get("detailed_analysis", {}),
+            overall_risk_level=result.get("overall_risk_level", "متوسط"),
+            overall_confidence_score=result.get("overall_confidence_score", 0.5),
+            final_recommendation=result.get("final_recommendation", ""),
+            conflicts_identified=result.get("conflicts_identified", ""),
+            resolution_rationale=result.get("resolution_rationale", "")
+        )
 
 
-class StrategicSynthesizerAgent:
-    def __init__(self, openai_client):
-        self.client = openai_client
-        self.model = "gpt-4o"
+class StrategicSynthesizerAgent(BaseAgent):
+    model = "gpt-4o"
+    result_type = StrategicMemo
+    prompt = SYNTHESIS_PROMPT
+    schema = "strategic_memo"
+    node_name = "synthesis"
+    inputs = ("market", "financial", "competitive")
+    phase = "synthesis"
+    
+    def __init__(self, *args, input_token_budget: Optional[int] = None, router=None, **kwargs):
+        """input_token_budget: حد تقديري لرموز الطلب كاملاً؛ None يرسل التحليلات كما هي.
+        
+        router (SynthesisRouter): يوجّه الحالات قليلة الخلاف إلى قالب أو نموذج أرخص؛
+        None يرسل كل شيء إلى self.model.
+        """
+        super().__init__(*args, **kwargs)
+        self.input_token_budget = input_token_budget
+        self.router = router
+        self._variants = {}
     
     def synthesize(
         self,
@@ -28,77 +67,127 @@ class StrategicSynthesizerAgent:
         financial_analysis: FinancialAnalysis,
         competitive_analysis: CompetitiveAnalysis
     ) -> StrategicMemo:
-        prompt = f"""أنت شريك عام استراتيجي (General Partner / Strategic Decision Maker).
-
-مهمتك: إجراء "حل التعارض" (Conflict Resolution) بين آراء المحللين الثلاثة، وإصدار مذكرة استراتيجية نهائية.
-
-الفكرة/المشروع المطروح:
-{business_idea}
-
-========== تحليل السوق (Market Logic) ==========
-الطلب السوقي: {market_analysis.market_demand}
-شرائح العملاء: {market_analysis.customer_segments}
-اتجاهات السوق: {market_analysis.market_trends}
-فجوات الطلب: {market_analysis.demand_gaps}
-مستوى المخاطرة: {market_analysis.risk_level}
-نسبة الثقة: {market_analysis.confidence_score * 100}%
-
-========== التحليل المالي (Financial Sustainability) ==========
-اقتصاديات الوحدة: {financial_analysis.unit_economics}
-التكاليف التشغيلية: {financial_analysis.operational_costs}
-مصادر الدخل: {financial_analysis.revenue_streams}
-الاستقرار المالي: {financial_analysis.financial_stability}
-مستوى المخاطرة: {financial_analysis.risk_level}
-نسبة الثقة: {financial_analysis.confidence_score * 100}%
-
-========== التحليل التنافسي (Competitive Durability) ==========
-حواجز الدخول: {competitive_analysis.entry_barriers}
-قوة الحماية التنافسية: {competitive_analysis.moat_strength}
-سهولة التكرار: {competitive_analysis.ease_of_replication}
-عرض القيمة الفريد: {competitive_analysis.unique_value_proposition}
-مستوى المخاطرة: {competitive_analysis.risk_level}
-نسبة الثقة: {competitive_analysis.confidence_score * 100}%
-
-========== المطلوب منك ==========
-1. تحديد التعارضات بين آراء المحللين الثلاثة
-2. حل هذه التعارضات بناءً على المنطق الاستراتيجي
-3. إصدار مذكرة استراتيجية نهائية تتضمن:
-   - ملخص تنفيذي (Executive Summary)
-   - تحليل تفصيلي لكل مسار (Detailed Analysis)
-   - مستوى المخاطرة الإجمالي (Overall Risk Level)
-   - نسبة الثقة الإجمالية (Overall Confidence Score)
-   - التوصية النهائية (Final Recommendation)
-
-أجب بصيغة JSON:
-{{
-    "executive_summary": "ملخص تنفيذي شامل من 3-5 جمل يوضح الصورة الكبيرة",
-    "detailed_analysis": {{
-        "market_perspective": "تحليل من منظور السوق",
-        "financial_perspective": "تحليل من منظور مالي",
-        "competitive_perspective": "تحليل من منظور تنافسي"
-    }},
-    "overall_risk_level": "منخفض/متوسط/عالي",
-    "overall_confidence_score": 0.85,
-    "final_recommendation": "التوصية النهائية: هل يجب المضي في المشروع؟ ولماذا؟",
-    "conflicts_identified": "التعارضات التي وجدتها بين المحللين",
-    "resolution_rationale": "كيف تم حل هذه التعارضات والمبررات"
-}}"""
-
-        response = self.client.chat.completions.create(
-            model=self.model,
-            messages=[{"role": "user", "content": prompt}],
-            response_format={"type": "json_object"}
+        analyses = (market_analysis, financial_analysis, competitive_analysis)
+        route, score = self._route(analyses)
+        started = time.perf_counter()
+        if route == TEMPLATE_ROUTE:
+            memo = template_memo(business_idea, *analyses)
+        else:
+            memo = self._variant(route)._run(business_idea, *analyses)
+        return self._routed(memo, route, score, started, business_idea, analyses)
+    
+    async def synthesize_async(
+        self,
+        business_idea: str,
+        market_analysis: MarketAnalysis,
+        financial_analysis: FinancialAnalysis,
+        competitive_analysis: CompetitiveAnalysis
+    ) -> StrategicMemo:
+        analyses = (market_analysis, financial_analysis, competitive_analysis)
+        route, score = self._route(analyses)
+        started = time.perf_counter()
+        if route == TEMPLATE_ROUTE:
+            memo = template_memo(business_idea, *analyses)
+        else:
+            memo = await self._variant(route)._run_async(business_idea, *analyses)
+        return self._routed(memo, route, score, started, business_idea, analyses)
+    
+    def synthesize_stream(
+        self,
+        business_idea: str,
+        market_analysis: MarketAnalysis,
+        financial_analysis: FinancialAnalysis,
+        competitive_analysis: CompetitiveAnalysis
+    ):
+        """يولّد ("token", جزء نصي) أثناء الكتابة ثم ("result", StrategicMemo) في النهاية"""
+        analyses = (market_analysis, financial_analysis, competitive_analysis)
+        route, score = self._route(analyses)
+        started = time.perf_counter()
+        if route == TEMPLATE_ROUTE:
+            memo = template_memo(business_idea, *analyses)
+        else:
+            for kind, value in self._variant(route)._run_stream(business_idea, *analyses):
+                if kind == "token":
+                    yield kind, value
+                else:
+                    memo = value
+        yield "result", self._routed(memo, route, score, started, business_idea, analyses)
+    
+    def invoke(self, business_idea: str, *analyses) -> StrategicMemo:
+        return self.synthesize(business_idea, *analyses)
+    
+    async def invoke_async(self, business_idea: str, *analyses) -> StrategicMemo:
+        return await self.synthesize_async(business_idea, *analyses)
+    
+    def invoke_stream(self, business_idea: str, *analyses):
+        return self.synthesize_stream(business_idea, *analyses)
+    
+    def _route(self, analyses):
+        if self.router is None:
+            return self.model, None
+        score = disagreement_score(*analyses)
+        return self.router.route(score, self.model), round(score, 4)
+    
+    def _variant(self, model: str) -> "StrategicSynthesizerAgent":
+        """نسخة بنفس العملاء والذاكرة المؤقتة لنموذج آخر؛ النموذج جزء من مفتاح الذاكرة"""
+        if model == self.model:
+            return self
+        variant = self._variants.get(model)
+        if variant is None:
+            variant = copy.copy(self)
+            variant.model, variant.router, variant._variants = model, None, {}
+            self._variants[model] = variant
+        return variant
+    
+    def _routed(self, memo, route, score, started, business_idea, analyses) -> StrategicMemo:
+        if self.router is not None:
+            prompt_tokens = estimate_tokens(self.prompt.system) + estimate_tokens(
+                self.prompt.render_user(self._template_values(business_idea, analyses))
+            )
+            synthesis_routing_stats.record(
+                route, time.perf_counter() - started, self.router.cost_saved(route, self.model, prompt_tokens)
+            )
+        return replace(memo, synthesis_route=route, disagreement_score=score)
+    
+    def _prompt_fingerprint(self) -> str:
+        # الميزانية تغير نص المدخلات، فهي جزء من بصمة الطلب ومفتاح الذاكرة المؤقتة
+        return f"{super()._prompt_fingerprint()}\x1fbudget={self.input_token_budget}"
+    
+    def _prompt_values(
+        self,
+        business_idea: str,
+        market_analysis: MarketAnalysis,
+        financial_analysis: FinancialAnalysis,
+        competitive_analysis: CompetitiveAnalysis
+    ) -> Dict[str, Any]:
+        analyses = (market_analysis, financial_analysis, competitive_analysis)
+        if self.input_token_budget is not None:
+            analyses = self._compact(business_idea, analyses)
+        return self._template_values(business_idea, analyses)
+    
+    def _compact(self, business_idea: str, analyses):
+        """قص نصوص التحليلات حتى يتسع الطلب كاملاً لـ input_token_budget"""
+        blank = tuple(
+            replace(analysis, **{
+                f.name: "" for f in fields(analysis)
+                if isinstance(getattr(analysis, f.name), str) and f.name != "risk_level"
+            })
+            for analysis in analyses
         )
-        
-        import json
-        result = json.loads(response.choices[0].message.content)
-        
-        return StrategicMemo(
-            executive_summary=result.get("executive_summary", ""),
-            detailed_analysis=result.get("detailed_analysis", {}),
-            overall_risk_level=result.get("overall_risk_level", "متوسط"),
-            overall_confidence_score=result.get("overall_confidence_score", 0.5),
-            final_recommendation=result.get("final_recommendation", ""),
-            conflicts_identified=result.get("conflicts_identified", ""),
-            resolution_rationale=result.get("resolution_rationale", "")
+        overhead = estimate_tokens(self.prompt.system) + estimate_tokens(
+            self.prompt.render_user(self._template_values(business_idea, blank))
         )
+        compacted, report = compact_analyses(analyses, self.input_token_budget - overhead)
+        metrics.compaction(self.model, report.saved_tokens)
+        return compacted
+    
+    def _template_values(self, business_idea: str, analyses) -> Dict[str, Any]:
+        values = {"business_idea": business_idea}
+        for prefix, analysis in zip(("market", "financial", "competitive"), analyses):
+            values.update(plain(analysis))
+            values[f"{prefix}_risk_level"] = analysis.risk_level
+            values[f"{prefix}_confidence"] = analysis.confidence_score * 100
+        return values
+    
+    def _parse(self, result: Dict[str, Any]) -> StrategicMemo:
+        return StrategicMemo.from_dict(result)
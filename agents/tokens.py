@@ -0,0 +1,11 @@
+def estimate_tokens(text: str) -> int:
+    """تقدير عدد الرموز (tokens) بلا اتصال وبلا مكتبة tokenizer.
+
+    تقريب محافظ: نحو 4 أحرف لاتينية لكل رمز، بينما الحروف العربية وغيرها
+    أكثف بكثير (نحو 2.5 حرف لكل رمز).
+    """
+    if not text:
+        return 0
+    ascii_chars = sum(1 for ch in text if ch < "\x80")
+    other_chars = len(text) - ascii_chars
+    return int(ascii_chars / 4 + other_chars / 2.5) + 1
@@ -1,8 +1,11 @@
+import json
 import os
-from flask import Flask, render_template, request, jsonify, send_from_directory
+import re
+import threading
+from contextlib import asynccontextmanager
+from concurrent.futures import wait
+from flask import Flask, Response, render_template, request, jsonify, send_from_directory, stream_with_context
 from dotenv import load_dotenv
-from openai import OpenAI
-from dataclasses import asdict
 
 # استيراد الوكلاء من مجلد agents
 try:
@@ -11,11 +14,32 @@ try:
         FinancialSustainabilityAgent,
         CompetitiveDurabilityAgent,
         StrategicSynthesizerAgent,
+        FusedDivergenceAgent,
+        ResultCache,
+        default_rate_limiter,
+        prompt_cache_stats,
+        SimilarityIndex,
+        connection_stats,
+        shared_clients,
+        SynthesisRouter,
+        synthesis_routing_stats,
     )
 except ImportError as e:
     print(f"خطأ في استيراد الوكلاء: {e}")
     print("تأكد من وجود مجلد agents وبداخله ملفات الوكلاء.")
 
+from admission import AdmissionController, Rejected
+from agents.cache import DEFAULT_CACHE_PATH
+from agents.metrics import collect_request_metrics, metrics
+from agents.serialization import merge, plain
+from checkpoints import DEFAULT_CHECKPOINT_PATH, CheckpointStore
+from compression import MIN_SIZE, compress, negotiate
+from history import DEFAULT_HISTORY_PATH, AnalysisStore
+from jobs import DEFAULT_JOBS_PATH, JobQueue, JobStore
+from pipeline import CONTENT_HASH_LENGTH, AnalysisPipeline, DivergenceStage, default_registry
+from singleflight import DEFAULT_LOCK_DIR, SingleFlight
+from event_loop import shared_event_loop
+
 # إعداد المسارات المطلقة لضمان عمل templates و static على الماك
 current_dir = os.path.dirname(os.path.abspath(__file__))
 
@@ -25,14 +49,155 @@ app = Flask(__name__,
 
 # تحميل مفتاح API من ملف .env
 load_dotenv()
-api_key = os.getenv("OPENAI_API_KEY")
-client = OpenAI(api_key=api_key)
 
-# تهيئة الوكلاء باستخدام عميل OpenAI
-market_agent = MarketLogicAgent(client)
-financial_agent = FinancialSustainabilityAgent(client)
-competitive_agent = CompetitiveDurabilityAgent(client)
-synthesizer = StrategicSynthesizerAgent(client)
+
+class Services:
+    """مكونات الخادم تُبنى عند أول استخدام لا عند الاستيراد.
+
+    بدء الحاوية لا يدفع كلفة استيراد openai ولا بناء الوكلاء، وغياب
+    OPENAI_API_KEY لا يمنع تشغيل الخادم: الخطأ يظهر في أول طلب يحتاج النموذج.
+    كل مكون يُبنى بدالة _build_<name> مرة واحدة، ويمكن استبداله بالإسناد المباشر.
+    """
+
+    def __init__(self):
+        self._lock = threading.RLock()
+
+    def __getattr__(self, name):
+        builder = getattr(type(self), f"_build_{name}", None)
+        if builder is None:
+            raise AttributeError(name)
+        with self._lock:
+            if name not in self.__dict__:
+                self.__dict__[name] = builder(self)
+            return self.__dict__[name]
+
+    def _build_clients(self):
+        # عميلان مشتركان بمجمّع اتصالات مضبوط (OPENAI_HTTP_*)؛ إعادة المحاولة تتولاها agents.rate_limit
+        clients = shared_clients(os.getenv("OPENAI_API_KEY"))
+        metrics.gauge("openai_http_connections", "طلبات HTTP والاتصالات الجديدة والمعاد استخدامها", "kind",
+                      lambda: {key: value for key, value in connection_stats.snapshot().items() if key != "reuse_ratio"})
+        return clients
+
+    def _build_agents_loop(self):
+        # حلقة asyncio واحدة لكل العملية: كل طلبات /analyze تتشارك عميل AsyncOpenAI
+        # ومجمّع اتصالاته بدلاً من حجز خيط لكل استدعاء نموذج
+        return shared_event_loop()
+
+    def _build_result_cache(self):
+        # ذاكرة مؤقتة للنتائج: إعادة إرسال نفس الفكرة لا تعيد دفع تكلفة الاستدعاءات الأربعة
+        return ResultCache(
+            # RESULT_CACHE_PATH فارغ يعني ذاكرة مؤقتة في الذاكرة فقط
+            path=os.getenv("RESULT_CACHE_PATH", DEFAULT_CACHE_PATH) or None,
+            max_memory_entries=int(os.getenv("RESULT_CACHE_MEMORY_ENTRIES", "1024")),
+            ttl_seconds=float(os.getenv("RESULT_CACHE_TTL_SECONDS", str(7 * 24 * 3600))),
+        )
+
+    def _build_analysis_history(self):
+        # سجل التحليلات المكتملة مع بحث نصي؛ HISTORY_DB_PATH فارغ يعني قاعدة في الذاكرة فقط
+        return AnalysisStore(os.getenv("HISTORY_DB_PATH", DEFAULT_HISTORY_PATH) or None)
+
+    def _build_checkpoints(self):
+        # مخرجات كل مرحلة لكل request_id: إعادة المحاولة بعد فشل التوليف لا تعيد التحليلات الثلاثة
+        # CHECKPOINT_DB_PATH فارغ يعني قاعدة في الذاكرة فقط
+        return CheckpointStore(
+            os.getenv("CHECKPOINT_DB_PATH", DEFAULT_CHECKPOINT_PATH) or None,
+            ttl_seconds=float(os.getenv("CHECKPOINT_TTL_SECONDS", str(24 * 3600))),
+        )
+
+    def _build_single_flight(self):
+        # طلبات /analyze المتطابقة المتزامنة تنتظر تشغيلاً واحداً للفكرة. SINGLE_FLIGHT_LOCK_DIR
+        # يمد ذلك إلى عمال العمليات الأخرى على نفس الجهاز، وفارغاً يقصره على هذه العملية
+        if os.getenv("SINGLE_FLIGHT", "on").lower() in ("0", "off", "false", "no"):
+            return None
+        single_flight = SingleFlight(os.getenv("SINGLE_FLIGHT_LOCK_DIR", DEFAULT_LOCK_DIR) or None)
+        metrics.gauge("single_flight_requests", "طلبات التحليل المدمجة في تشغيل جارٍ", "kind", single_flight.counts)
+        return single_flight
+
+    def _build_admission(self):
+        # حد التحليلات المتزامنة وطابور الأولوية أمام المسار؛ ADMISSION=off يقبل كل طلب فوراً
+        admission = AdmissionController.from_env()
+        if admission is not None:
+            metrics.gauge("admission", "حد القبول والتحليلات الجارية والمنتظرة حسب المسار", "state", admission.counts)
+        return admission
+
+    def _build_market_agent(self):
+        return MarketLogicAgent(*self.clients, self.result_cache)
+
+    def _build_financial_agent(self):
+        return FinancialSustainabilityAgent(*self.clients, self.result_cache)
+
+    def _build_competitive_agent(self):
+        return CompetitiveDurabilityAgent(*self.clients, self.result_cache)
+
+    def _build_synthesizer(self):
+        # SYNTHESIS_INPUT_TOKEN_BUDGET يحد طول طلب gpt-4o بضغط نصوص التحليلات قبل التوليف
+        # و SYNTHESIS_* توجّه الحالات قليلة الخلاف إلى قالب أو gpt-4o-mini (agents/routing.py)
+        synthesis_budget = os.getenv("SYNTHESIS_INPUT_TOKEN_BUDGET")
+        metrics.gauge("synthesis_routes", "المذكرات حسب مسار التوليف", "route", synthesis_routing_stats.counts)
+        return StrategicSynthesizerAgent(
+            *self.clients,
+            self.result_cache,
+            input_token_budget=int(synthesis_budget) if synthesis_budget else None,
+            router=SynthesisRouter.from_env(),
+        )
+
+    def _build_divergence(self):
+        # طبقة التباعد المشتركة: DIVERGENCE_WORKERS يحدد خيوط منفذ المجدول
+        # و DIVERGENCE_MODE=fused يجمع الوكلاء الثلاثة في استدعاء gpt-4o-mini واحد
+        fused = os.getenv("DIVERGENCE_MODE", "split") == "fused"
+        return DivergenceStage(
+            self.market_agent,
+            self.financial_agent,
+            self.competitive_agent,
+            max_workers=int(os.getenv("DIVERGENCE_WORKERS", "12")),
+            fused_agent=FusedDivergenceAgent(*self.clients, self.result_cache) if fused else None,
+        )
+
+    def _build_similar_ideas(self):
+        # فهرس الأفكار شبه المطابقة؛ SIMILAR_IDEA_THRESHOLD فارغ يعطله
+        similar_threshold = os.getenv("SIMILAR_IDEA_THRESHOLD", "0.85")
+        return SimilarityIndex(threshold=float(similar_threshold)) if similar_threshold else None
+
+    def _build_agent_registry(self):
+        # عقد المسار؛ AGENT_TIMEOUT_SECONDS مهلة كل عقدة. وكلاء إضافيون يُسجلون هنا
+        # (services.agent_registry.register) فيشغلهم /analyze والبث والطابور معاً
+        timeout = os.getenv("AGENT_TIMEOUT_SECONDS")
+        return default_registry(self.divergence, self.synthesizer, timeout=float(timeout) if timeout else None)
+
+    def _build_analysis_pipeline(self):
+        # ANALYSIS_DEADLINE_SECONDS مهلة التحليل الكلية؛ ما لم يكتمل ضمنها يُعاد كمذكرة احتياطية
+        deadline = os.getenv("ANALYSIS_DEADLINE_SECONDS")
+        return AnalysisPipeline(
+            self.divergence,
+            self.synthesizer,
+            similar=self.similar_ideas,
+            registry=self.agent_registry,
+            deadline_seconds=float(deadline) if deadline else None,
+            checkpoints=self.checkpoints,
+            single_flight=self.single_flight,
+        )
+
+    def _build_job_queue(self):
+        # طابور المهام: POST /jobs لا يحجز عامل Flask طوال التحليل. JOBS_DB_PATH فارغ يعني طابوراً في الذاكرة
+        return JobQueue(
+            JobStore(os.getenv("JOBS_DB_PATH", DEFAULT_JOBS_PATH) or None),
+            self.analysis_pipeline,
+            history=self.analysis_history,
+            loop=self.agents_loop,
+            workers=int(os.getenv("JOB_WORKERS", "4")),
+            admission=self.admission,
+        ).start()
+
+
+services = Services()
+
+
+def __getattr__(name):
+    """app.market_agent وأمثالها تبقى متاحة كما كانت، وتُبنى عند أول وصول"""
+    try:
+        return getattr(services, name)
+    except AttributeError:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}") from None
 
 @app.route('/')
 def index():
@@ -49,8 +214,111 @@ def serve_sw():
     """تقديم ملف الـ Service Worker"""
     return send_from_directory(app.static_folder, 'sw.js')
 
+@app.route('/cache/stats')
+def cache_stats():
+    """عدادات الإصابة والإخفاق في الذاكرة المؤقتة للنتائج"""
+    stats = services.result_cache.stats()
+    if services.similar_ideas is not None:
+        stats["similar_ideas"] = services.similar_ideas.stats()
+    if services.single_flight is not None:
+        stats["single_flight"] = services.single_flight.stats()
+    return jsonify(stats)
+
+@app.route('/rate-limits')
+def rate_limits():
+    """حالة محدد المعدل المشترك لكل نموذج: الرصيد المتاح والانتظار وإعادة المحاولات"""
+    return jsonify(default_rate_limiter.snapshot())
+
+@app.route('/connections')
+def connections():
+    """إعادة استخدام اتصالات HTTP إلى OpenAI: كل طلب بلا اتصال جديد وفّر مصافحة"""
+    return jsonify(connection_stats.snapshot())
+
+@app.route('/synthesis-routing')
+def synthesis_routing():
+    """المذكرات حسب مسار التوليف (قالب، gpt-4o-mini، gpt-4o) والزمن والكلفة الموفرة"""
+    return jsonify(synthesis_routing_stats.snapshot())
+
+@app.route('/admission')
+def admission_state():
+    """حد القبول الحالي، والتحليلات الجارية والمنتظرة والمرفوضة في كل مسار"""
+    if services.admission is None:
+        return jsonify({"enabled": False})
+    return jsonify({"enabled": True, **services.admission.snapshot()})
+
+@app.route('/prompt-cache')
+def prompt_cache():
+    """نسبة رموز الـ prompt المخدومة من ذاكرة المزود المؤقتة لكل نموذج"""
+    return jsonify(prompt_cache_stats.snapshot())
+
+@app.route('/metrics')
+def metrics_endpoint():
+    """قياسات الزمن والرموز والتكلفة بصيغة Prometheus"""
+    return Response(metrics.render(), mimetype='text/plain; version=0.0.4')
+
+def json_response(body: bytes, status: int = 200):
+    """جسم JSON مرمز مسبقاً، مضغوط حسب Accept-Encoding إن تجاوز MIN_SIZE"""
+    encoding = negotiate(request.headers.get("Accept-Encoding")) if len(body) >= MIN_SIZE else None
+    response = Response(compress(body, encoding) if encoding else body, status=status, mimetype="application/json")
+    if encoding:
+        response.headers["Content-Encoding"] = encoding
+    response.headers["Vary"] = "Accept-Encoding"
+    return response
+
+def request_lane(data, default):
+    """مسار الأولوية: ترويسة X-Priority أو حقل priority (interactive أو bulk)"""
+    return services.admission.lane(request.headers.get('X-Priority') or data.get('priority'), default)
+
+def rejected_response(e):
+    """رفض سريع بدل انتظار لن يكتمل قبل المهلة"""
+    response = jsonify({"status": "error", "message": str(e), "reason": e.reason, "retry_after": e.retry_after})
+    response.status_code = 429
+    response.headers["Retry-After"] = str(int(e.retry_after))
+    return response
+
+def request_id_from(data):
+    """معرف الطلب لنقاط الحفظ: request_id في الجسم أو ترويسة Idempotency-Key.
+
+    None بدونهما: طلب لا يستطيع العميل إعادته بمعرفه لا يستحق كتابة نقاط حفظ.
+    """
+    request_id = data.get('request_id') or request.headers.get('Idempotency-Key')
+    return str(request_id) if request_id else None
+
+def failure_body(e, request_id):
+    """جسم خطأ التحليل: المعرف وما حُفظ من مراحل، لإعادة المحاولة بنفس request_id"""
+    return {
+        "status": "error",
+        "message": str(e),
+        "request_id": request_id,
+        "completed_stages": services.analysis_pipeline.completed_stages(request_id),
+    }
+
+async def run_with_metrics(business_idea, request_id=None, lane=None):
+    """تشغيل المسار الكامل مع قياسات هذا الطلب وحده، وثوانٍ انتظرها في طابور القبول.
+
+    مكان القبول يحجزه من يشغل المسار فعلاً (lane)، لا الفكرة شبه المطابقة ولا التابع
+    لتحليل جارٍ، فيقرر ذلك داخل مسار القائد بلا سباق مع انتهاء تشغيل آخر.
+    """
+    tickets = []
+
+    @asynccontextmanager
+    async def admit():
+        ticket = await services.admission.acquire_async(lane)
+        tickets.append(ticket)
+        try:
+            yield
+        finally:
+            # تشغيل خدمته الذاكرة المؤقتة كله لا يمثل زمن المزود
+            ticket.release(observe=bool(collected.tokens))
+
+    with collect_request_metrics() as collected:
+        result = await services.analysis_pipeline.run_async(
+            business_idea, request_id=request_id, admit=admit if services.admission is not None else None,
+        )
+    return result, collected, tickets[0].waited if tickets else 0.0
+
 @app.route('/analyze', methods=['POST'])
-def analyze():
+async def analyze():
     """استقبال فكرة المشروع وتحليلها عبر الوكلاء"""
     data = request.json
     business_idea = data.get('idea')
@@ -58,32 +326,215 @@ def analyze():
     if not business_idea:
         return jsonify({"status": "error", "message": "لم يتم تقديم فكرة مشروع"}), 400
 
+    request_id = request_id_from(data)
+    lane = request_lane(data, "bulk") if services.admission is not None else None
     try:
-        # المرحلة 1: التحليل بواسطة الوكلاء الثلاثة
-        market_analysis = market_agent.analyze(business_idea)
-        financial_analysis = financial_agent.analyze(business_idea)
-        competitive_analysis = competitive_agent.analyze(business_idea)
-        
-        # المرحلة 2: التركيب النهائي (Synthesis) للمذكرة الاستراتيجية
-        strategic_memo = synthesizer.synthesize(
-            business_idea,
-            market_analysis,
-            financial_analysis,
-            competitive_analysis
+        # المرحلتان (التباعد ثم التوليف) على حلقة الوكلاء الخلفية
+        result, collected, waited = await services.agents_loop.run_async(
+            run_with_metrics(business_idea, request_id, lane)
         )
         
-        # إرجاع النتائج بتنسيق JSON للواجهة الفاخرة
-        return jsonify({
-            "status": "success",
-            "market_analysis": asdict(market_analysis),
-            "financial_analysis": asdict(financial_analysis),
-            "competitive_analysis": asdict(competitive_analysis),
-            "strategic_memo": asdict(strategic_memo)
-        })
+        # إرجاع النتائج بتنسيق JSON للواجهة الفاخرة، مع القياسات إذا طُلبت. الأقسام
+        # مرمزة مرة واحدة في result.to_json() (والسجل حفظ نفس البايتات)
+        history_id = services.analysis_history.add(result)
+        extra = None
+        if data.get('include_metrics') or request.args.get('metrics'):
+            extra = {"metrics": {**collected.to_dict(), "queue_wait_seconds": round(waited, 4)}}
+        head = {"status": "success", "history_id": history_id, "result_url": result.url, "request_id": request_id}
+        return json_response(merge(head, result.to_json(), extra))
 
+    except Rejected as e:
+        # التابعون لقائد رُفض يُرفضون معه
+        return rejected_response(e)
     except Exception as e:
         print(f"حدث خطأ أثناء التحليل: {e}")
-        return jsonify({"status": "error", "message": str(e)}), 500
+        return jsonify(failure_body(e, request_id)), 500
+
+# النتيجة لا تتغير تحت عنوانها أبداً: المتصفح والوسطاء يحتفظون بها سنة دون إعادة التحقق
+IMMUTABLE = "public, max-age=31536000, immutable"
+CONTENT_HASH = re.compile(f"[0-9a-f]{{{CONTENT_HASH_LENGTH}}}")
+
+@app.route('/results/<content_hash>')
+def get_result(content_hash):
+    """تحليل مكتمل بعنوان بصمته (AnalysisResult.url) مع ETag قوي وردود 304"""
+    etag = content_hash.lower()
+    # بصمة بشكل خاطئ أو غير مخزنة لا تعطي 304 قابلاً للتخزين
+    if not CONTENT_HASH.fullmatch(etag) or not services.analysis_history.has(etag):
+        return jsonify({"status": "error", "message": "نتيجة غير موجودة"}), 404
+    # كل ترميز للجسم له وسمه الخاص، وأي منها يعني أن لدى العميل المحتوى نفسه
+    if any(request.if_none_match.contains(tag) for tag in (etag, f"{etag}-gzip", f"{etag}-br")):
+        response = Response(status=304)
+        response.set_etag(etag)
+        response.headers["Cache-Control"] = IMMUTABLE
+        return response
+    
+    document = services.analysis_history.document(etag)
+    if document is None:
+        return jsonify({"status": "error", "message": "نتيجة غير موجودة"}), 404
+    response = json_response(document)
+    encoding = response.headers.get("Content-Encoding")
+    response.set_etag(f"{etag}-{encoding}" if encoding else etag)
+    response.headers["Cache-Control"] = IMMUTABLE
+    return response
+
+@app.route('/history')
+def history_page():
+    """التحليلات السابقة، الأحدث أولاً. الصفحة التالية: ?before=<next_before>"""
+    page = services.analysis_history.page(
+        limit=request.args.get('limit', 20, type=int),
+        before=request.args.get('before', type=int),
+        risk_level=request.args.get('risk_level'),
+        min_confidence=request.args.get('min_confidence', type=float),
+        encoded=True,
+    )
+    return json_response(page)
+
+@app.route('/history/search')
+def history_search():
+    """بحث نصي في الأفكار والمذكرات والتحليلات السابقة"""
+    query = request.args.get('q', '').strip()
+    if not query:
+        return jsonify({"status": "error", "message": "لم يتم تقديم نص للبحث"}), 400
+    page = services.analysis_history.search(
+        query,
+        limit=request.args.get('limit', 20, type=int),
+        before=request.args.get('before', type=int),
+        encoded=True,
+    )
+    return json_response(page)
+
+@app.route('/jobs', methods=['POST'])
+def submit_job():
+    """إضافة فكرة إلى طابور التحليل وإرجاع معرف المهمة فوراً"""
+    business_idea = (request.json or {}).get('idea')
+    if not business_idea:
+        return jsonify({"status": "error", "message": "لم يتم تقديم فكرة مشروع"}), 400
+    
+    job_id = services.job_queue.submit(business_idea)
+    response = jsonify({"status": "queued", "job_id": job_id})
+    response.headers["Location"] = f"/jobs/{job_id}"
+    return response, 202
+
+@app.route('/jobs/stats')
+def job_stats():
+    """عمق الطابور وانشغال العمال"""
+    return jsonify(services.job_queue.stats())
+
+@app.route('/jobs/<job_id>')
+def get_job(job_id):
+    """حالة المهمة وتقدم كل مرحلة، والنتيجة عند الاكتمال"""
+    job = services.job_queue.store.get(job_id)
+    if job is None:
+        return jsonify({"status": "error", "message": "مهمة غير موجودة"}), 404
+    return jsonify(job)
+
+def sse_event(event, data):
+    """تنسيق حدث Server-Sent Events واحد"""
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+@app.route('/analyze/stream', methods=['GET', 'POST'])
+def analyze_stream():
+    """بث التحليل: نتيجة كل وكيل فور اكتمالها ثم نص المذكرة أثناء توليده"""
+    data = (request.json or {}) if request.method == 'POST' else request.args
+    business_idea = data.get('idea')
+    
+    if not business_idea:
+        return jsonify({"status": "error", "message": "لم يتم تقديم فكرة مشروع"}), 400
+    request_id = request_id_from(data)
+    pipeline = services.analysis_pipeline
+    # فكرة شبه مطابقة لفكرة سابقة: كل الأحداث دفعة واحدة بلا استدعاء النماذج
+    similar = pipeline.lookup_similar(business_idea)
+    # نفس الفكرة قيد التحليل في طلب آخر: انتظار نتيجته بدل تشغيل النماذج مرة ثانية
+    flight = pipeline.join_flight(business_idea) if similar is None else None
+    # القائد وحده يحجز مكان القبول، والبث هو مسار الواجهة: الأولوية التفاعلية ما لم
+    # يطلب العميل غيرها. رفضه يُبلغ التابعين الذين انضموا إليه في هذه الأثناء
+    ticket = None
+    if similar is None and (flight is None or flight.leader) and services.admission is not None:
+        try:
+            ticket = services.admission.acquire(request_lane(data, "interactive"))
+        except Rejected as e:
+            if flight is not None:
+                flight.finish(error=e)
+            return rejected_response(e)
+    # تشغيل لم يبث أي جزء نص خدمته الذاكرة المؤقتة: زمنه لا يدخل تكييف حد القبول
+    called_models = []
+
+    def close():
+        # عميل قطع البث قبل النتيجة: التابعون لا ينتظرون قائداً لن يكمل
+        if flight is not None and flight.leader:
+            flight.finish(error=RuntimeError("analysis stream closed before its result"))
+        if ticket is not None:
+            ticket.release(observe=bool(called_models))
+
+    def replay(result, **flags):
+        """كل أقسام نتيجة جاهزة دفعة واحدة، ثم حدث done"""
+        for name, section in result.to_dict().items():
+            yield sse_event(name, section)
+        history_id = services.analysis_history.add(result)
+        yield sse_event("done", {
+            "status": "success", "history_id": history_id, "result_url": result.url, "request_id": request_id, **flags,
+        })
+
+    def generate():
+        # تعليق أولي ليصل أول بايت فوراً قبل انتهاء أي وكيل
+        yield ": stream-open\n\n"
+        try:
+            if similar is not None:
+                yield from replay(similar, similar=True)
+                return
+            if flight is not None and not flight.leader:
+                while not wait([flight.future], timeout=10).done:
+                    yield ": keep-alive\n\n"
+                yield from replay(pipeline.coalesced(business_idea, flight.future.result()), coalesced=True)
+                return
+            if flight is not None:
+                flight.acquire_process_lock(pipeline.single_flight.process_wait_seconds)
+                # عملية أخرى حللت الفكرة أثناء انتظار قفلها ونشرت نتيجتها
+                shared = flight.reuse(pipeline.decode_shared)
+                if shared is not None:
+                    flight.finish(shared)
+                    yield from replay(pipeline.coalesced(business_idea, shared), coalesced=True)
+                    return
+            
+            # كل عقدة تُرسل كحدث مستقل فور اكتمالها (أو فور استعادتها من نقطة حفظ)،
+            # ونص المذكرة جزءاً جزءاً أثناء توليده
+            values = {}
+            for kind, name, value in pipeline.iter_events(business_idea, request_id, heartbeat=10, stream=True):
+                if kind == "heartbeat":
+                    yield ": keep-alive\n\n"
+                elif kind == "token":
+                    called_models.append(name)
+                    yield sse_event("memo_token" if name == "synthesis" else f"{name}_token", {"text": value})
+                else:
+                    values[name] = value
+                    yield sse_event("strategic_memo" if name == "synthesis" else f"{name}_analysis", plain(value))
+            
+            result = pipeline.result_from(business_idea, values)
+            if flight is not None:
+                flight.finish(result, published=pipeline.encode_shared(result))
+            if "synthesis" not in values:
+                # تجاوز المهلة: المذكرة الاحتياطية لم تُبث بعد
+                yield sse_event("strategic_memo", plain(result.strategic_memo))
+            history_id = services.analysis_history.add(result)
+            yield sse_event("done", {
+                "status": "success", "history_id": history_id, "result_url": result.url, "request_id": request_id,
+            })
+        except Exception as e:
+            if flight is not None and flight.leader:
+                flight.finish(error=e)
+            print(f"حدث خطأ أثناء التحليل: {e}")
+            yield sse_event("error", failure_body(e, request_id))
+        finally:
+            close()
+
+    response = Response(
+        stream_with_context(generate()),
+        mimetype='text/event-stream',
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+    # بث أُغلق قبل أن يبدأ المولد لا يمر بـ finally
+    response.call_on_close(close)
+    return response
 
 if __name__ == '__main__':
     # طباعة مسار البحث للتأكد عند التشغيل
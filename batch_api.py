@@ -0,0 +1,146 @@
+"""وضع Batch API: تحليل أعداد كبيرة من الأفكار عبر ملفات JSONL بدلاً من الاستدعاءات المباشرة.
+
+المسار على مرحلتين، كل منهما دفعة مستقلة لدى المزود:
+1. compile_divergence_batch: طلبات الوكلاء الثلاثة لكل فكرة
+2. ingest_divergence_results ثم compile_synthesis_batch: طلبات التوليف بناءً على نتائج المرحلة الأولى
+3. ingest_synthesis_results: تحويل نتائج التوليف إلى StrategicMemo
+
+كل الدوال تعمل على ملفات محلية فقط؛ submit_batch و download_batch_output
+هما الخطوتان الوحيدتان اللتان تتصلان بالشبكة.
+"""
+import json
+from typing import Dict, Iterable, Tuple
+
+from pipeline import AnalysisResult
+
+
+BATCH_ENDPOINT = "/v1/chat/completions"
+SYNTHESIS = "synthesis"
+
+
+def _custom_id(idea_id: str, stage: str) -> str:
+    return f"{idea_id}:{stage}"
+
+
+def _write_request(f, custom_id: str, body: Dict) -> None:
+    line = {"custom_id": custom_id, "method": "POST", "url": BATCH_ENDPOINT, "body": body}
+    f.write(json.dumps(line, ensure_ascii=False) + "\n")
+
+
+def compile_divergence_batch(records: Iterable[Dict], agents: Dict, path: str) -> int:
+    """كتابة طلب لكل (فكرة، وكيل). records عناصر {"id", "idea"}، و agents مثل DivergenceStage.agents"""
+    count = 0
+    with open(path, "w", encoding="utf-8") as f:
+        for record in records:
+            for name, agent in agents.items():
+                _write_request(f, _custom_id(record["id"], name), agent.build_request(record["idea"]))
+                count += 1
+    return count
+
+
+def read_batch_output(path: str) -> Tuple[Dict[str, str], Dict[str, str]]:
+    """قراءة ملف نتائج الدفعة: (custom_id -> نص الاستجابة، custom_id -> رسالة الخطأ)"""
+    contents, errors = {}, {}
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            if not line.strip():
+                continue
+            record = json.loads(line)
+            custom_id = record["custom_id"]
+            response = record.get("response") or {}
+            if record.get("error") or response.get("status_code", 200) != 200:
+                error = record.get("error") or response.get("body", {}).get("error") or {}
+                errors[custom_id] = error.get("message", "batch request failed")
+                continue
+            contents[custom_id] = response["body"]["choices"][0]["message"]["content"]
+    return contents, errors
+
+
+def ingest_divergence_results(path: str, records: Iterable[Dict], agents: Dict):
+    """تحويل نتائج المرحلة الأولى إلى {idea_id: {name: analysis}} مع أخطاء كل فكرة.
+
+    الأفكار التي لم تكتمل تحليلاتها الثلاثة تُعاد في الأخطاء ولا تدخل مرحلة التوليف.
+    """
+    contents, errors = read_batch_output(path)
+    analyses, failures = {}, {}
+
+    for record in records:
+        results = {}
+        for name, agent in agents.items():
+            custom_id = _custom_id(record["id"], name)
+            try:
+                if custom_id in errors:
+                    raise ValueError(errors[custom_id])
+                if custom_id not in contents:
+                    raise KeyError(f"missing result for {custom_id}")
+                results[name] = agent.parse_content(contents[custom_id])
+                agent.remember(results[name], record["idea"])
+            except (ValueError, KeyError) as e:
+                failures[record["id"]] = f"{name}: {e}"
+                break
+        else:
+            analyses[record["id"]] = results
+
+    return analyses, failures
+
+
+def compile_synthesis_batch(records: Iterable[Dict], analyses: Dict, synthesizer, path: str) -> int:
+    count = 0
+    with open(path, "w", encoding="utf-8") as f:
+        for record in records:
+            results = analyses.get(record["id"])
+            if results is None:
+                continue
+            body = synthesizer.build_request(
+                record["idea"], results["market"], results["financial"], results["competitive"]
+            )
+            _write_request(f, _custom_id(record["id"], SYNTHESIS), body)
+            count += 1
+    return count
+
+
+def ingest_synthesis_results(path: str, records: Iterable[Dict], analyses: Dict, synthesizer):
+    """بناء AnalysisResult لكل فكرة اكتملت مرحلتاها: ({idea_id: result}, {idea_id: error})"""
+    contents, errors = read_batch_output(path)
+    results, failures = {}, {}
+
+    for record in records:
+        divergence = analyses.get(record["id"])
+        if divergence is None:
+            continue
+        custom_id = _custom_id(record["id"], SYNTHESIS)
+        try:
+            if custom_id in errors:
+                raise ValueError(errors[custom_id])
+            if custom_id not in contents:
+                raise KeyError(f"missing result for {custom_id}")
+            memo = synthesizer.parse_content(contents[custom_id])
+        except (ValueError, KeyError) as e:
+            failures[record["id"]] = f"{SYNTHESIS}: {e}"
+            continue
+
+        inputs = (divergence["market"], divergence["financial"], divergence["competitive"])
+        synthesizer.remember(memo, record["idea"], *inputs)
+        results[record["id"]] = AnalysisResult(record["idea"], *inputs, memo)
+
+    return results, failures
+
+
+def submit_batch(client, path: str, completion_window: str = "24h"):
+    """رفع ملف الطلبات وإنشاء الدفعة لدى المزود"""
+    with open(path, "rb") as f:
+        batch_file = client.files.create(file=f, purpose="batch")
+    return client.batches.create(
+        input_file_id=batch_file.id,
+        endpoint=BATCH_ENDPOINT,
+        completion_window=completion_window,
+    )
+
+
+def download_batch_output(client, batch_id: str, path: str):
+    """تنزيل ملف النتائج إذا اكتملت الدفعة، وإرجاع حالتها"""
+    batch = client.batches.retrieve(batch_id)
+    if batch.status == "completed" and batch.output_file_id:
+        with open(path, "wb") as f:
+            f.write(client.files.content(batch.output_file_id).read())
+    return batch
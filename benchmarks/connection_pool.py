@@ -0,0 +1,103 @@
+"""أثر مجمّع الاتصالات المشترك على عدد المصافحات والزمن تحت التزامن.
+
+    python -m benchmarks.connection_pool --bursts 10 --concurrency 16 --handshake-ms 100
+
+يرسل دفعات متتالية من الطلبات المتزامنة إلى خادم OpenAI وهمي محلي، ويقارن:
+- client-per-burst: عميل جديد لكل دفعة، كما كان كل AIConsultantOrchestrator يبني عميله
+- keepalive-N: عميل مشترك لكن مجمّع keep-alive أصغر من التزامن (--small-keepalive)
+- shared-tuned: عميل مشترك بإعدادات HTTPSettings الافتراضية
+"""
+import argparse
+import asyncio
+import json
+import statistics
+import time
+
+from agents.http_client import ConnectionStats, HTTPSettings, create_clients
+from benchmarks.mock_openai_server import MockOpenAIServer
+
+
+MESSAGES = [
+    {"role": "system", "content": "You are a Market Logic Analyst."},
+    {"role": "user", "content": "الفكرة/المشروع المطروح:\nمنصة لتوصيل المخبوزات"},
+]
+
+
+async def burst(client, concurrency, latencies):
+    async def one():
+        start = time.perf_counter()
+        await client.chat.completions.create(model="gpt-4o-mini", messages=MESSAGES)
+        latencies.append(time.perf_counter() - start)
+
+    await asyncio.gather(*(one() for _ in range(concurrency)))
+
+
+async def run_scenario(name, server, settings, shared, args):
+    stats = ConnectionStats()
+    latencies = []
+    start = time.perf_counter()
+    connections_before = server.stats["connections"]
+    clients = create_clients("mock-key", settings, stats=stats, base_url=server.base_url) if shared else None
+    for _ in range(args.bursts):
+        _, async_client = clients or create_clients("mock-key", settings, stats=stats, base_url=server.base_url)
+        await burst(async_client, args.concurrency, latencies)
+        if not shared:
+            await async_client.close()
+        # فاصل بين الدفعات كما بين موجات طلبات /analyze
+        await asyncio.sleep(args.gap)
+    if shared:
+        await clients[1].close()
+    elapsed = time.perf_counter() - start - args.gap * args.bursts
+
+    latencies.sort()
+    return {
+        "scenario": name,
+        **stats.snapshot(),
+        "server_connections": server.stats["connections"] - connections_before,
+        "p50_ms": statistics.median(latencies) * 1000,
+        "p95_ms": latencies[int(0.95 * (len(latencies) - 1))] * 1000,
+        "requests_per_second": len(latencies) / elapsed,
+    }
+
+
+async def run_all(args):
+    base = HTTPSettings(http2=False)
+    scenarios = [
+        ("client-per-burst", base, False),
+        (f"keepalive-{args.small_keepalive}", HTTPSettings(http2=False, max_keepalive_connections=args.small_keepalive), True),
+        ("shared-tuned", base, True),
+    ]
+    results = []
+    with MockOpenAIServer(handshake_delay=args.handshake_ms / 1000, latency=args.latency_ms / 1000) as server:
+        for name, settings, shared in scenarios:
+            results.append(await run_scenario(name, server, settings, shared, args))
+    return results
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--bursts", type=int, default=10)
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--handshake-ms", type=float, default=100.0, help="كلفة كل اتصال جديد على الخادم")
+    parser.add_argument("--latency-ms", type=float, default=50.0)
+    parser.add_argument("--small-keepalive", type=int, default=8)
+    parser.add_argument("--gap", type=float, default=0.2, help="ثوانٍ بين الدفعات (لا تدخل في المعدل)")
+    parser.add_argument("--json", help="حفظ النتائج في ملف JSON")
+    args = parser.parse_args(argv)
+
+    results = asyncio.run(run_all(args))
+
+    print(f"{'scenario':<20}{'requests':>9}{'new conns':>10}{'reuse':>8}{'p50 ms':>9}{'p95 ms':>9}{'req/s':>8}")
+    for r in results:
+        print(
+            f"{r['scenario']:<20}{r['requests']:>9}{r['server_connections']:>10}{r['reuse_ratio'] * 100:>7.1f}%"
+            f"{r['p50_ms']:>9.1f}{r['p95_ms']:>9.1f}{r['requests_per_second']:>8.0f}"
+        )
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
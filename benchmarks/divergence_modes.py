@@ -0,0 +1,107 @@
+"""مقارنة وضعي طبقة التباعد: ثلاثة استدعاءات (split) مقابل استدعاء واحد (fused).
+
+    python -m benchmarks.divergence_modes --ideas 60 --concurrency 12
+
+يقيس لكل وضع: الرموز المرسلة والمستقبلة، زمن التباعد لكل فكرة (p50/p95)،
+ونسبة استجابات 429 من المزود الوهمي تحت نفس حدود RPM/TPM.
+"""
+import argparse
+import json
+import statistics
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from agents import (
+    MarketLogicAgent,
+    FinancialSustainabilityAgent,
+    CompetitiveDurabilityAgent,
+    FusedDivergenceAgent,
+    ModelLimits,
+    RateLimiter,
+)
+from benchmarks.fake_provider import FakeProvider
+from pipeline import DivergenceStage, divergence_registry
+from scheduler import DAGScheduler
+
+
+def percentile(values, q):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+def run_mode(mode, args):
+    provider = FakeProvider(
+        requests_per_minute=args.rpm,
+        tokens_per_minute=args.tpm,
+        time_scale=args.time_scale,
+        latency_scale=args.latency_scale,
+    )
+    # حدود محلية واسعة: نريد رؤية ضغط المزود نفسه، مع إعادة محاولة سريعة
+    limiter = RateLimiter(
+        limits={"gpt-4o-mini": ModelLimits(requests_per_minute=10**6, tokens_per_minute=10**9)},
+        max_retries=20,
+        base_delay=0.01,
+    )
+    agents = [
+        agent_type(provider, rate_limiter=limiter)
+        for agent_type in (MarketLogicAgent, FinancialSustainabilityAgent, CompetitiveDurabilityAgent)
+    ]
+    fused = FusedDivergenceAgent(provider, rate_limiter=limiter) if mode == "fused" else None
+    stage = DivergenceStage(*agents, fused_agent=fused)
+    scheduler = DAGScheduler(divergence_registry(stage), max_workers=3 * args.concurrency)
+
+    def timed(index):
+        start = time.perf_counter()
+        scheduler.run(f"فكرة رقم {index}: منصة توصيل مخبوزات محلية عبر اشتراك شهري")
+        return time.perf_counter() - start
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.concurrency) as pool:
+        latencies = list(pool.map(timed, range(args.ideas)))
+    wall = time.perf_counter() - start
+    scheduler.shutdown()
+
+    attempts = provider.stats["requests"] + provider.stats["rate_limited"]
+    return {
+        "mode": mode,
+        "ideas": args.ideas,
+        "requests": provider.stats["requests"],
+        "prompt_tokens": provider.stats["prompt_tokens"],
+        "completion_tokens": provider.stats["completion_tokens"],
+        "tokens_per_idea": (provider.stats["prompt_tokens"] + provider.stats["completion_tokens"]) / args.ideas,
+        "latency_p50": statistics.median(latencies),
+        "latency_p95": percentile(latencies, 0.95),
+        "rate_limited": provider.stats["rate_limited"],
+        "rate_limited_ratio": provider.stats["rate_limited"] / attempts if attempts else 0.0,
+        "wall_seconds": wall,
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--ideas", type=int, default=60)
+    parser.add_argument("--concurrency", type=int, default=12)
+    parser.add_argument("--rpm", type=int, default=24, help="حد الطلبات في الدقيقة لدى المزود الوهمي")
+    parser.add_argument("--tpm", type=int, default=60_000, help="حد الرموز في الدقيقة لدى المزود الوهمي")
+    parser.add_argument("--time-scale", type=float, default=0.01)
+    parser.add_argument("--latency-scale", type=float, default=0.1)
+    parser.add_argument("--json", help="حفظ النتائج في ملف JSON")
+    args = parser.parse_args(argv)
+
+    results = [run_mode(mode, args) for mode in ("split", "fused")]
+
+    header = f"{'mode':<7}{'requests':>9}{'tokens/idea':>13}{'p50 s':>8}{'p95 s':>8}{'429s':>6}{'429 %':>8}{'wall s':>8}"
+    print(header)
+    for r in results:
+        print(
+            f"{r['mode']:<7}{r['requests']:>9}{r['tokens_per_idea']:>13.0f}{r['latency_p50']:>8.3f}"
+            f"{r['latency_p95']:>8.3f}{r['rate_limited']:>6}{r['rate_limited_ratio'] * 100:>7.1f}%{r['wall_seconds']:>8.2f}"
+        )
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
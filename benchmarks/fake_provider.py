@@ -0,0 +1,133 @@
+"""مزود وهمي داخل العملية يحاكي chat.completions لقياس الأداء بلا تكلفة API.
+
+زمن الاستجابة يتناسب مع عدد رموز الإخراج (ومع رموز الإدخال إن ضُبط
+seconds_per_input_token)، وحدود RPM/TPM تُفرض على نافذة
+منزلقة وتعيد RateLimitError (429) مع Retry-After كما يفعل المزود الحقيقي.
+time_scale يضغط نافذة الحدود: 0.01 يعني أن دقيقة المزود تمر في 0.6 ثانية،
+و latency_scale يضغط زمن الاستجابة بنفس الطريقة.
+"""
+import json
+import threading
+import time
+from collections import deque
+from types import SimpleNamespace
+from unittest.mock import Mock
+
+import openai
+
+from agents.tokens import estimate_tokens
+
+
+FIELDS = {
+    "market": ["market_demand", "customer_segments", "market_trends", "demand_gaps"],
+    "financial": ["unit_economics", "operational_costs", "revenue_streams", "financial_stability"],
+    "competitive": ["entry_barriers", "moat_strength", "ease_of_replication", "unique_value_proposition"],
+}
+MEMO_FIELDS = ["executive_summary", "final_recommendation", "conflicts_identified", "resolution_rationale"]
+FILLER = "تحليل مفصل للسوق والعملاء والتكاليف والمنافسة في المملكة "
+
+
+def _text(words: int) -> str:
+    return (FILLER * (words // 8 + 1)).strip()[: words * 6]
+
+
+def _section(name: str, words: int):
+    section = {field: _text(words) for field in FIELDS[name]}
+    section.update(risk_level="متوسط", confidence_score=0.7)
+    return section
+
+
+def fake_payload(prompt: str, words_per_field: int = 60):
+    """استجابة JSON مناسبة لنوع الوكيل الظاهر في نص الطلب"""
+    if "General Partner" in prompt:
+        memo = {field: _text(words_per_field) for field in MEMO_FIELDS}
+        memo.update(
+            detailed_analysis={"market_perspective": _text(words_per_field)},
+            overall_risk_level="متوسط",
+            overall_confidence_score=0.7,
+        )
+        return memo
+    if '"market": {' in prompt:
+        return {name: _section(name, words_per_field) for name in FIELDS}
+    for name, marker in (
+        ("market", "Market Logic Analyst"),
+        ("financial", "Financial Sustainability Analyst"),
+        ("competitive", "Competitive Durability Analyst"),
+    ):
+        if marker in prompt:
+            return _section(name, words_per_field)
+    raise ValueError("unrecognised prompt")
+
+
+class FakeProvider:
+    def __init__(
+        self,
+        requests_per_minute: int = 500,
+        tokens_per_minute: int = 200_000,
+        base_latency: float = 0.4,
+        seconds_per_output_token: float = 0.01,
+        seconds_per_input_token: float = 0.0,
+        time_scale: float = 0.01,
+        latency_scale: float = 0.1,
+        words_per_field: int = 60,
+        model_latency=None,
+    ):
+        self.requests_per_minute = requests_per_minute
+        self.tokens_per_minute = tokens_per_minute
+        self.base_latency = base_latency
+        self.seconds_per_output_token = seconds_per_output_token
+        self.seconds_per_input_token = seconds_per_input_token
+        self.time_scale = time_scale
+        self.latency_scale = latency_scale
+        self.words_per_field = words_per_field
+        # مضاعف الزمن لكل نموذج، مثل {"gpt-4o-mini": 0.4}؛ النماذج غير المذكورة 1
+        self.model_latency = model_latency or {}
+        self._window = deque()
+        self._lock = threading.Lock()
+        self.stats = {"requests": 0, "rate_limited": 0, "prompt_tokens": 0, "completion_tokens": 0}
+        # نفس واجهة العميل: provider.chat.completions.create(...)
+        self.chat = SimpleNamespace(completions=SimpleNamespace(create=self.create))
+
+    def _admit(self, tokens: int) -> None:
+        now = time.monotonic()
+        window = 60 * self.time_scale
+        with self._lock:
+            while self._window and self._window[0][0] <= now - window:
+                self._window.popleft()
+            used_tokens = sum(t for _, t in self._window)
+            if (len(self._window) >= self.requests_per_minute
+                    or used_tokens + tokens > self.tokens_per_minute):
+                self.stats["rate_limited"] += 1
+                retry_after = self._window[0][0] + window - now if self._window else window
+                raise openai.RateLimitError(
+                    "Rate limit reached",
+                    response=Mock(status_code=429, headers={"retry-after": f"{max(retry_after, 0):.3f}"}),
+                    body=None,
+                )
+            self._window.append((now, tokens))
+            self.stats["requests"] += 1
+
+    def create(self, **kwargs):
+        prompt = "\n".join(message["content"] for message in kwargs["messages"])
+        content = json.dumps(fake_payload(prompt, self.words_per_field), ensure_ascii=False)
+        prompt_tokens = estimate_tokens(prompt)
+        completion_tokens = estimate_tokens(content)
+        self._admit(prompt_tokens + completion_tokens)
+
+        time.sleep((
+            self.base_latency
+            + prompt_tokens * self.seconds_per_input_token
+            + completion_tokens * self.seconds_per_output_token
+        ) * self.latency_scale * self.model_latency.get(kwargs.get("model"), 1.0))
+        with self._lock:
+            self.stats["prompt_tokens"] += prompt_tokens
+            self.stats["completion_tokens"] += completion_tokens
+
+        return SimpleNamespace(
+            choices=[SimpleNamespace(message=SimpleNamespace(content=content))],
+            usage=SimpleNamespace(
+                prompt_tokens=prompt_tokens,
+                completion_tokens=completion_tokens,
+                total_tokens=prompt_tokens + completion_tokens,
+            ),
+        )
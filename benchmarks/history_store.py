@@ -0,0 +1,97 @@
+"""زمن صفحات السجل والبحث فيه عند مليون تحليل مخزن.
+
+    python -m benchmarks.history_store --rows 1000000 --path /tmp/history.sqlite3
+
+يملأ قاعدة SQLite بتحليلات اصطناعية عبر add_many، ثم يقيس p50/p99 لكل من:
+- page: صفحة عشوائية بالـ keyset (before=id عشوائي)
+- page_risk: نفس الشيء مع تصفية مستوى المخاطرة
+- offset: نفس الصفحة بطريقة OFFSET للمقارنة، كلفتها تنمو مع عمق الصفحة
+- search: بحث FTS5 بكلمتين من المفردات المشتركة
+"""
+import argparse
+import json
+import os
+import random
+import statistics
+import time
+
+from agents import MarketAnalysis, FinancialAnalysis, CompetitiveAnalysis, StrategicMemo
+from benchmarks.similar_ideas import ITEMS, CITIES, make_idea
+from history import AnalysisStore
+from pipeline import AnalysisResult
+
+
+RISK_LEVELS = ["منخفض", "متوسط", "عالي"]
+
+
+def make_result(rng):
+    idea = make_idea(rng)
+    risk = rng.choice(RISK_LEVELS)
+    return AnalysisResult(
+        idea,
+        MarketAnalysis(f"طلب على {rng.choice(ITEMS)}", "العائلات", "نمو", "الجودة", risk, rng.random()),
+        FinancialAnalysis("هامش جيد", "توصيل", "اشتراكات", "مستقر", risk, rng.random()),
+        CompetitiveAnalysis("منخفضة", "ضعيفة", "سهل", f"الانتشار في {rng.choice(CITIES)}", risk, rng.random()),
+        StrategicMemo(f"ملخص: {idea}", {"market_perspective": "سوق واعدة"}, risk, rng.random(),
+                      "المضي بحذر", "لا شيء", "مبرر"),
+    )
+
+
+def measure(fn, queries):
+    latencies = []
+    for query in queries:
+        start = time.perf_counter()
+        fn(query)
+        latencies.append(time.perf_counter() - start)
+    latencies.sort()
+    return {
+        "p50_ms": statistics.median(latencies) * 1000,
+        "p99_ms": latencies[int(0.99 * (len(latencies) - 1))] * 1000,
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, default=1_000_000)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--batch", type=int, default=5000, help="عدد النتائج في كل add_many")
+    parser.add_argument("--path", default=None, help="ملف القاعدة (الافتراضي في الذاكرة)")
+    parser.add_argument("--seed", type=int, default=7)
+    parser.add_argument("--json", help="حفظ النتائج في ملف JSON")
+    args = parser.parse_args(argv)
+
+    if args.path and os.path.exists(args.path):
+        os.remove(args.path)
+    rng = random.Random(args.seed)
+    store = AnalysisStore(args.path)
+
+    start = time.perf_counter()
+    for offset in range(0, args.rows, args.batch):
+        store.add_many(make_result(rng) for _ in range(min(args.batch, args.rows - offset)))
+    insert_seconds = time.perf_counter() - start
+
+    ids = [rng.randrange(1, args.rows + 1) for _ in range(args.queries)]
+    offset_sql = "SELECT id, payload FROM analyses ORDER BY id DESC LIMIT 21 OFFSET ?"
+    words = [f"{rng.choice(ITEMS)} {rng.choice(CITIES)}" for _ in range(args.queries)]
+    results = {
+        "rows": args.rows,
+        "insert_rows_per_second": args.rows / insert_seconds,
+        "page": measure(lambda before: store.page(before=before), ids),
+        "page_risk": measure(lambda before: store.page(before=before, risk_level="عالي"), ids),
+        "offset": measure(lambda before: store._db.execute(offset_sql, (args.rows - before,)).fetchall(), ids),
+        "search": measure(store.search, words),
+    }
+
+    print(f"inserted {args.rows} analyses at {results['insert_rows_per_second']:.0f} rows/s")
+    print(f"{'query':<12}{'p50 ms':>9}{'p99 ms':>9}")
+    for kind in ("page", "page_risk", "offset", "search"):
+        r = results[kind]
+        print(f"{kind:<12}{r['p50_ms']:>9.3f}{r['p99_ms']:>9.3f}")
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
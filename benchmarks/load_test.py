@@ -0,0 +1,302 @@
+"""اختبار حمل كامل على خادم OpenAI وهمي محلي: بلا تكلفة API وبأرقام قابلة للمقارنة.
+
+    python -m benchmarks.load_test --targets orchestrator,flask,batch,jobs \\
+        --concurrency 1,4,16 --requests 32 --latency lognormal:400:0.5 --output results.json
+    python -m benchmarks.load_test ... --compare results.json
+
+لكل هدف ومستوى تزامن: p50/p95/p99 لزمن التحليل الكامل، التحليلات/ثانية،
+طلبات النموذج/ثانية، الأخطاء، و RSS الحالي والأقصى بالميغابايت.
+- orchestrator: AIConsultantOrchestrator.analyze (اللوحة تُكتب إلى ذاكرة لا إلى الطرفية)
+- flask: POST /analyze عبر عميل اختبار Flask
+- batch: AIConsultantOrchestrator.analyze_many بحد التزامن المطلوب
+- jobs: POST /jobs ثم استطلاع GET /jobs/<id> حتى الاكتمال
+كل فكرة فريدة، والذاكرة المؤقتة وفهرس الأفكار شبه المطابقة في الذاكرة أو معطلان،
+فكل تحليل يمر بالنماذج الأربعة. --compare يطبع الفرق عن ملف نتائج سابق.
+--hedge و --deadline-ms يقيسان أثر الطلبات الاحتياطية ومهلة التحليل على الذيل.
+--admission و --admission-limit يضبطان حد التحليلات الجارية في flask و jobs؛ الطلبات
+المرفوضة بـ 429 تُحسب في الأخطاء.
+"""
+import argparse
+import io
+import json
+import os
+import random
+import resource
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from benchmarks.mock_openai_server import LatencyModel, MockOpenAIServer
+from benchmarks.similar_ideas import make_idea
+
+
+TARGETS = ("orchestrator", "flask", "batch", "jobs")
+
+
+def rss_mb():
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 2**20
+    except (OSError, ValueError):
+        return None
+
+
+def peak_rss_mb():
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def percentiles(latencies):
+    ordered = sorted(latencies)
+    pick = lambda q: ordered[min(len(ordered) - 1, int(q * len(ordered)))] * 1000
+    return {"p50_ms": pick(0.50), "p95_ms": pick(0.95), "p99_ms": pick(0.99)}
+
+
+class Ideas:
+    """أفكار فريدة من مفردات مشتركة؛ الرقم في كل فكرة يمنع إصابات الذاكرة المؤقتة"""
+
+    def __init__(self, seed=11):
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+
+    def next(self):
+        with self._lock:
+            return make_idea(self._rng)
+
+
+def _orchestrator(**kwargs):
+    from rich.console import Console
+    from agents import ResultCache
+    from history import AnalysisStore
+    from orchestrator import AIConsultantOrchestrator
+
+    deadline = os.getenv("ANALYSIS_DEADLINE_SECONDS")
+    orchestrator = AIConsultantOrchestrator(
+        cache=ResultCache(path=None),
+        history=AnalysisStore(None),
+        similarity_threshold=None,
+        deadline_seconds=float(deadline) if deadline else None,
+        **kwargs,
+    )
+    orchestrator.console = Console(file=io.StringIO(), width=120)
+    return orchestrator
+
+
+def _threaded(call, concurrency, requests, ideas):
+    """requests تحليلاً عبر concurrency خيطاً؛ يعيد أزمنة الاستدعاءات الناجحة وعدد الفاشلة"""
+    latencies, failures = [], []
+
+    def one(_):
+        idea = ideas.next()
+        start = time.perf_counter()
+        try:
+            call(idea)
+        except Exception as e:
+            failures.append(repr(e))
+            return
+        latencies.append(time.perf_counter() - start)
+
+    with ThreadPoolExecutor(concurrency) as pool:
+        list(pool.map(one, range(requests)))
+    return latencies, failures
+
+
+def run_orchestrator(concurrency, requests, ideas):
+    # analyze يعرض لوحة rich حية، ولا يمكن لوحتين حيتين مشاركة Console واحد
+    local = threading.local()
+
+    def call(idea):
+        if not hasattr(local, "orchestrator"):
+            local.orchestrator = _orchestrator()
+        local.orchestrator.analyze(idea)
+
+    return _threaded(call, concurrency, requests, ideas)
+
+
+def run_flask(concurrency, requests, ideas):
+    import app
+
+    client = app.app.test_client()
+
+    def call(idea):
+        response = client.post("/analyze", json={"idea": idea})
+        if response.status_code != 200:
+            raise RuntimeError(response.get_json().get("message"))
+
+    return _threaded(call, concurrency, requests, ideas)
+
+
+def run_jobs(concurrency, requests, ideas):
+    import app
+
+    client = app.app.test_client()
+
+    def call(idea):
+        location = client.post("/jobs", json={"idea": idea}).headers["Location"]
+        while True:
+            job = client.get(location).get_json()
+            if job["status"] == "succeeded":
+                return
+            if job["status"] == "failed":
+                raise RuntimeError(job.get("error"))
+            time.sleep(0.01)
+
+    return _threaded(call, concurrency, requests, ideas)
+
+
+def run_batch(concurrency, requests, ideas):
+    orchestrator = _orchestrator(max_workers=3 * concurrency)
+    batch = [ideas.next() for _ in range(requests)]
+    latencies, failures = [], []
+    start = time.perf_counter()
+    # زمن كل فكرة في الدفعة: من بداية الدفعة حتى اكتمالها (ما ينتظره صاحب الدفعة)
+    for _, result in orchestrator.analyze_many(batch, max_concurrency=concurrency, return_exceptions=True):
+        if isinstance(result, Exception):
+            failures.append(repr(result))
+        else:
+            latencies.append(time.perf_counter() - start)
+    return latencies, failures
+
+
+RUNNERS = {"orchestrator": run_orchestrator, "flask": run_flask, "batch": run_batch, "jobs": run_jobs}
+
+
+def configure_environment(server, args):
+    """يجب أن يسبق استيراد app: مكوناته تقرأ البيئة عند أول استخدام"""
+    os.environ.update({
+        "OPENAI_API_KEY": "mock-key",
+        "OPENAI_BASE_URL": server.base_url,
+        "RESULT_CACHE_PATH": "",
+        "HISTORY_DB_PATH": "",
+        "JOBS_DB_PATH": "",
+        "CHECKPOINT_DB_PATH": "",
+        "SINGLE_FLIGHT_LOCK_DIR": "",
+        "SIMILAR_IDEA_THRESHOLD": "",
+        "JOB_WORKERS": str(args.job_workers),
+        "SYNTHESIS_ROUTING": args.synthesis_routing,
+        "ANALYSIS_DEADLINE_SECONDS": str(args.deadline_ms / 1000) if args.deadline_ms else "",
+        "ADMISSION": args.admission,
+        "ADMISSION_MAX_CONCURRENCY": str(args.admission_limit),
+    })
+    from agents import ModelLimits, default_hedge_policy, default_rate_limiter
+
+    default_hedge_policy.enabled = args.hedge == "on"
+    # حدود المزود الحقيقي ليست موضوع القياس هنا؛ الأخطاء المحقونة تُعاد محاولتها بسرعة
+    for model in ("gpt-4o", "gpt-4o-mini"):
+        default_rate_limiter.configure(model, ModelLimits(requests_per_minute=10**7, tokens_per_minute=10**10))
+    default_rate_limiter.base_delay = 0.05
+
+
+def run(args):
+    latency = LatencyModel.parse(args.latency)
+    results = {"config": vars(args).copy(), "runs": []}
+    with MockOpenAIServer(
+        handshake_delay=args.handshake_ms / 1000,
+        latency=latency,
+        words_per_field=args.words_per_field,
+        error_rate=args.error_rate,
+    ) as server:
+        configure_environment(server, args)
+        ideas = Ideas()
+        for target in args.targets:
+            for concurrency in args.concurrency:
+                model_requests = server.stats["requests"]
+                hedges = hedged_requests()
+                start = time.perf_counter()
+                latencies, failures = RUNNERS[target](concurrency, args.requests, ideas)
+                elapsed = time.perf_counter() - start
+                results["runs"].append({
+                    "target": target,
+                    "concurrency": concurrency,
+                    "completed": len(latencies),
+                    "failed": len(failures),
+                    **(percentiles(latencies) if latencies else {}),
+                    "analyses_per_second": len(latencies) / elapsed,
+                    "model_requests_per_second": (server.stats["requests"] - model_requests) / elapsed,
+                    "hedge_rate": (hedged_requests() - hedges) / max(1, server.stats["requests"] - model_requests),
+                    "rss_mb": rss_mb(),
+                    "peak_rss_mb": peak_rss_mb(),
+                    "failure_samples": sorted(set(failures))[:3],
+                })
+                print_run(results["runs"][-1])
+        results["server"] = dict(server.stats)
+    return results
+
+
+def hedged_requests():
+    from agents.metrics import metrics
+
+    return sum(count for count, _ in metrics.hedge_counts().values())
+
+
+def print_run(r):
+    print(
+        f"{r['target']:<14}{r['concurrency']:>6}{r['completed']:>6}{r['failed']:>5}"
+        f"{r.get('p50_ms', 0):>9.0f}{r.get('p95_ms', 0):>9.0f}{r.get('p99_ms', 0):>9.0f}"
+        f"{r['analyses_per_second']:>8.2f}{r['model_requests_per_second']:>9.1f}"
+        f"{r['hedge_rate'] * 100:>7.1f}%{r['rss_mb'] or 0:>8.0f}{r['peak_rss_mb']:>8.0f}",
+        flush=True,
+    )
+
+
+def compare(results, baseline_path, tolerance):
+    """فروق كل تشغيل عن ملف نتائج سابق؛ ما تجاوز tolerance يُعلَّم REGRESSION"""
+    with open(baseline_path, encoding="utf-8") as f:
+        baseline = {(r["target"], r["concurrency"]): r for r in json.load(f)["runs"]}
+    regressions = 0
+    print(f"\ncompared with {baseline_path}")
+    for r in results["runs"]:
+        old = baseline.get((r["target"], r["concurrency"]))
+        if old is None or "p95_ms" not in old or "p95_ms" not in r:
+            continue
+        p95 = r["p95_ms"] / old["p95_ms"] - 1
+        rate = r["analyses_per_second"] / old["analyses_per_second"] - 1
+        flag = "REGRESSION" if p95 > tolerance or rate < -tolerance else ""
+        regressions += bool(flag)
+        print(f"{r['target']:<14}{r['concurrency']:>6}  p95 {p95 * 100:+6.1f}%  rate {rate * 100:+6.1f}%  {flag}")
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--targets", default=",".join(TARGETS))
+    parser.add_argument("--concurrency", default="1,4,16", help="مستويات التزامن مفصولة بفواصل")
+    parser.add_argument("--requests", type=int, default=32, help="عدد التحليلات لكل مستوى")
+    parser.add_argument("--latency", default="lognormal:400:0.5",
+                        help="توزيع زمن كل استدعاء نموذج: fixed:MS أو uniform:MS:SPREAD_MS أو lognormal:MS:SIGMA")
+    parser.add_argument("--handshake-ms", type=float, default=0.0)
+    parser.add_argument("--error-rate", type=float, default=0.0, help="نسبة استجابات 429/500 المحقونة")
+    parser.add_argument("--words-per-field", type=int, default=60, help="حجم كل حقل نصي في الاستجابة")
+    parser.add_argument("--job-workers", type=int, default=16)
+    parser.add_argument("--synthesis-routing", choices=("on", "off"), default="off",
+                        help="استجابات الخادم الوهمي متفقة دائماً، فالتوجيه يتجاوز gpt-4o في كل تحليل")
+    parser.add_argument("--hedge", choices=("on", "off"), default="on",
+                        help="طلب احتياطي لكل استدعاء تجاوز p95 الحديث لنموذجه")
+    parser.add_argument("--deadline-ms", type=float, default=0,
+                        help="مهلة التحليل الكلية؛ ما لم يكتمل ضمنها يُعاد كمذكرة احتياطية (0 بلا مهلة)")
+    parser.add_argument("--admission", choices=("on", "off"), default="on",
+                        help="التحكم في القبول أمام المسار: ما زاد عن الحد ينتظر أو يُرفض بـ 429")
+    parser.add_argument("--admission-limit", type=int, default=16, help="أقصى تحليلات جارية مع --admission on")
+    parser.add_argument("--output", help="حفظ النتائج في ملف JSON")
+    parser.add_argument("--compare", help="ملف نتائج سابق للمقارنة")
+    parser.add_argument("--tolerance", type=float, default=0.10)
+    args = parser.parse_args(argv)
+    args.targets = [t.strip() for t in args.targets.split(",") if t.strip()]
+    args.concurrency = [int(c) for c in args.concurrency.split(",")]
+    unknown = set(args.targets) - set(TARGETS)
+    if unknown:
+        parser.error(f"unknown targets: {', '.join(sorted(unknown))}")
+
+    print(f"{'target':<14}{'conc':>6}{'ok':>6}{'err':>5}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}"
+          f"{'an/s':>8}{'model/s':>9}{'hedge':>8}{'rss MB':>8}{'peak MB':>8}")
+    results = run(args)
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+    if args.compare:
+        return 1 if compare(results, args.compare, args.tolerance) else 0
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
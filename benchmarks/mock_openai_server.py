@@ -0,0 +1,180 @@
+"""خادم HTTP محلي يحاكي POST /v1/chat/completions لقياس الأداء بلا تكلفة API.
+
+- handshake_delay يُدفع مرة واحدة لكل اتصال جديد (يحاكي مصافحة TLS وجولة الشبكة)
+- latency لكل طلب: رقم ثابت أو توزيع من LatencyModel (ثابت، منتظم، لوغاريتمي طبيعي)
+- error_rate نسبة الطلبات التي تُرفض بـ 429 (مع Retry-After) أو 500 بالتساوي
+- words_per_field يتحكم في حجم الاستجابة
+الاستجابات من fake_payload بنفس شكل المزود الحقيقي، ومع stream=true تُرسل
+أجزاء SSE بنفس صيغة chat.completion.chunk.
+"""
+import json
+import math
+import random
+import sys
+import threading
+import time
+from dataclasses import dataclass
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from agents.tokens import estimate_tokens
+from benchmarks.fake_provider import fake_payload
+
+
+@dataclass
+class LatencyModel:
+    """زمن الاستجابة بالثواني. kind: fixed | uniform | lognormal"""
+    kind: str = "fixed"
+    median: float = 0.05
+    # uniform: [median - spread, median + spread]، lognormal: sigma
+    spread: float = 0.0
+
+    @classmethod
+    def parse(cls, spec: str) -> "LatencyModel":
+        """'fixed:50' أو 'uniform:50:20' أو 'lognormal:50:0.6' (الأزمنة بالميلي ثانية)"""
+        kind, *values = spec.split(":")
+        median = float(values[0]) / 1000 if values else cls.median
+        spread = float(values[1]) if len(values) > 1 else 0.0
+        if kind == "uniform":
+            spread /= 1000
+        elif kind not in ("fixed", "lognormal"):
+            raise ValueError(f"unknown latency distribution {kind!r}")
+        return cls(kind, median, spread)
+
+    def sample(self, rng: random.Random) -> float:
+        if self.kind == "uniform":
+            return max(0.0, rng.uniform(self.median - self.spread, self.median + self.spread))
+        if self.kind == "lognormal":
+            return rng.lognormvariate(math.log(self.median), self.spread) if self.median > 0 else 0.0
+        return self.median
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def setup(self):
+        super().setup()
+        self.server.count("connections")
+        time.sleep(self.server.handshake_delay)
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_POST(self):
+        body = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+        self.server.count("requests")
+        delay, error = self.server.draw()
+        time.sleep(delay)
+        if error:
+            self.server.count(f"errors_{error}")
+            self._send_json(error, {"error": {"message": "mock failure", "type": "server_error"}},
+                            {"retry-after-ms": "50"} if error == 429 else {})
+            return
+
+        prompt = "\n".join(message["content"] for message in body.get("messages", []))
+        content = json.dumps(fake_payload(prompt, self.server.words_per_field), ensure_ascii=False)
+        usage = {"prompt_tokens": estimate_tokens(prompt), "completion_tokens": estimate_tokens(content)}
+        usage["total_tokens"] = usage["prompt_tokens"] + usage["completion_tokens"]
+        model = body.get("model", "gpt-4o-mini")
+        if body.get("stream"):
+            self._send_stream(model, content, usage)
+            return
+        self._send_json(200, {
+            "id": "chatcmpl-mock",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": model,
+            "choices": [{
+                "index": 0,
+                "message": {"role": "assistant", "content": content},
+                "finish_reason": "stop",
+            }],
+            "usage": usage,
+        })
+
+    def _send_json(self, status, payload, headers=None):
+        data = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _send_stream(self, model, content, usage, pieces=8):
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+        size = max(1, len(content) // pieces + 1)
+        chunks = [
+            {"choices": [{"index": 0, "delta": {"content": content[i:i + size]}, "finish_reason": None}]}
+            for i in range(0, len(content), size)
+        ]
+        chunks.append({"choices": [], "usage": usage})
+        for chunk in chunks:
+            chunk.update(id="chatcmpl-mock", object="chat.completion.chunk", created=int(time.time()), model=model)
+            self._write_chunk(f"data: {json.dumps(chunk, ensure_ascii=False)}\n\n".encode("utf-8"))
+        self._write_chunk(b"data: [DONE]\n\n")
+        self._write_chunk(b"")
+
+    def _write_chunk(self, data: bytes):
+        self.wfile.write(f"{len(data):x}\r\n".encode("ascii") + data + b"\r\n")
+
+
+class MockOpenAIServer(ThreadingHTTPServer):
+    daemon_threads = True
+    request_queue_size = 1024
+
+    def __init__(
+        self,
+        handshake_delay: float = 0.1,
+        latency=0.05,
+        words_per_field: int = 60,
+        error_rate: float = 0.0,
+        seed: int = 7,
+    ):
+        super().__init__(("127.0.0.1", 0), _Handler)
+        self.handshake_delay = handshake_delay
+        self.latency = latency if isinstance(latency, LatencyModel) else LatencyModel(median=latency)
+        self.words_per_field = words_per_field
+        self.error_rate = error_rate
+        self.stats = {"connections": 0, "requests": 0, "errors_429": 0, "errors_500": 0, "disconnects": 0}
+        self._rng = random.Random(seed)
+        self._stats_lock = threading.Lock()
+        self._thread = None
+
+    def handle_error(self, request, client_address):
+        # العميل يغلق اتصاله عند إلغاء طلب (الطلب الخاسر بعد التحوط، أو مهلة التحليل)
+        if isinstance(sys.exc_info()[1], (BrokenPipeError, ConnectionResetError)):
+            self.count("disconnects")
+            return
+        super().handle_error(request, client_address)
+
+    def count(self, key: str) -> None:
+        with self._stats_lock:
+            self.stats[key] += 1
+
+    def draw(self):
+        """(زمن الاستجابة، رمز الخطأ أو None) للطلب التالي"""
+        with self._stats_lock:
+            delay = self.latency.sample(self._rng)
+            error = None
+            if self._rng.random() < self.error_rate:
+                error = self._rng.choice((429, 500))
+        return delay, error
+
+    @property
+    def base_url(self) -> str:
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}/v1"
+
+    def __enter__(self):
+        self._thread = threading.Thread(target=self.serve_forever, name="mock-openai", daemon=True)
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.shutdown()
+        self.server_close()
+        self._thread.join()
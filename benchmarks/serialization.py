@@ -0,0 +1,116 @@
+"""زمن ترميز استجابة /analyze وحجمها على الشبكة، قبل الترميز السريع وبعده.
+
+    python -m benchmarks.serialization --words 60 --repeat 2000
+
+قبل: asdict لكل قسم ثم jsonify (مزود Flask الافتراضي: \\uXXXX وفرز المفاتيح) بلا ضغط.
+بعد: result.to_json() مرة واحدة لكل نتيجة (أول طلب "cold"، وإصابة السجل أو
+الذاكرة المؤقتة "warm")، ملصوقة مع status و history_id، ثم gzip (و brotli إن وُجد).
+"""
+import argparse
+import json
+import statistics
+import time
+from dataclasses import asdict
+
+from flask import Flask
+
+from agents import MarketAnalysis, FinancialAnalysis, CompetitiveAnalysis, StrategicMemo
+from agents.serialization import merge, orjson
+from benchmarks.fake_provider import MEMO_FIELDS, _section, _text
+from compression import available_encodings, compress
+from pipeline import AnalysisResult
+
+
+def make_result(words):
+    memo = {field: _text(words) for field in MEMO_FIELDS}
+    memo.update(
+        detailed_analysis={
+            name: _text(words) for name in ("market_perspective", "financial_perspective", "competitive_perspective")
+        },
+        overall_risk_level="متوسط",
+        overall_confidence_score=0.7,
+    )
+    return AnalysisResult(
+        "منصة لتوصيل المخبوزات الطازجة في الرياض",
+        MarketAnalysis(**_section("market", words)),
+        FinancialAnalysis(**_section("financial", words)),
+        CompetitiveAnalysis(**_section("competitive", words)),
+        StrategicMemo(**memo),
+    )
+
+
+def baseline(flask_app, result, history_id):
+    body = {
+        "status": "success",
+        "history_id": history_id,
+        "market_analysis": asdict(result.market_analysis),
+        "financial_analysis": asdict(result.financial_analysis),
+        "competitive_analysis": asdict(result.competitive_analysis),
+        "strategic_memo": asdict(result.strategic_memo),
+    }
+    return flask_app.json.dumps(body).encode("utf-8")
+
+
+def fast(result, history_id):
+    return merge({"status": "success", "history_id": history_id}, result.to_json())
+
+
+def timed(fn, repeat):
+    samples = []
+    for i in range(repeat):
+        start = time.perf_counter()
+        body = fn(i)
+        samples.append(time.perf_counter() - start)
+    return statistics.median(samples) * 1e6, body
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--words", type=int, default=60, help="كلمات كل حقل نصي")
+    parser.add_argument("--repeat", type=int, default=2000)
+    parser.add_argument("--json", help="حفظ النتائج في ملف JSON")
+    args = parser.parse_args(argv)
+
+    flask_app = Flask(__name__)
+    result = make_result(args.words)
+    rows = []
+
+    micros, body = timed(lambda i: baseline(flask_app, result, i), args.repeat)
+    rows.append({"variant": "asdict + jsonify", "encode_us": micros, "bytes": len(body)})
+
+    micros, body = timed(lambda i: fast(_fresh(result), i), args.repeat)
+    rows.append({"variant": "to_json cold", "encode_us": micros, "bytes": len(body)})
+    micros, body = timed(lambda i: fast(result, i), args.repeat)
+    rows.append({"variant": "to_json warm", "encode_us": micros, "bytes": len(body)})
+
+    for encoding in available_encodings():
+        micros, compressed = timed(lambda i: compress(fast(result, i), encoding), args.repeat)
+        rows.append({"variant": f"to_json warm + {encoding}", "encode_us": micros, "bytes": len(compressed)})
+
+    print(f"encoder: {'orjson' if orjson is not None else 'json'}")
+    print(f"{'variant':<24}{'encode µs':>11}{'bytes':>9}")
+    for row in rows:
+        print(f"{row['variant']:<24}{row['encode_us']:>11.1f}{row['bytes']:>9}")
+    base = rows[0]
+    best = rows[-1]
+    print(f"wire bytes: {(1 - best['bytes'] / base['bytes']) * 100:.1f}% smaller, "
+          f"warm encode {base['encode_us'] / rows[2]['encode_us']:.1f}x faster")
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(rows, f, indent=2)
+
+
+def _fresh(result):
+    """نفس الأقسام بلا ترميز محفوظ، لقياس الترميز الأول"""
+    return AnalysisResult(
+        result.business_idea,
+        result.market_analysis,
+        result.financial_analysis,
+        result.competitive_analysis,
+        result.strategic_memo,
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,99 @@
+"""زمن البحث في فهرس الأفكار شبه المطابقة عند 100 ألف فكرة مخزنة.
+
+    python -m benchmarks.similar_ideas --ideas 100000 --queries 2000
+
+يولد أفكاراً عربية اصطناعية من مفردات مشتركة (فتتشارك أزواج كلمات كثيرة كما
+في الواقع)، ثم يقيس لكل نوع استعلام: p50/p99 للزمن ونسبة الإصابة.
+- paraphrase: فكرة مخزنة مع تشكيل وترقيم ومسافات وجمل معاد ترتيبها
+- novel: فكرة جديدة من نفس المفردات؛ إصاباتها القليلة أفكار لا تختلف عن
+  فكرة مخزنة إلا في الرقم المولد، أي أنها شبه مطابقة فعلاً
+"""
+import argparse
+import json
+import random
+import statistics
+import time
+
+from agents.similarity import SimilarityIndex
+
+
+PRODUCTS = ["منصة", "تطبيق", "متجر إلكتروني", "خدمة اشتراك", "سوق رقمي", "شبكة", "نظام", "مختبر"]
+ITEMS = ["المخبوزات", "القهوة المختصة", "الملابس المستعملة", "الكتب", "الأدوية", "قطع الغيار",
+         "الوجبات الصحية", "الأثاث", "النباتات", "العطور", "ألعاب الأطفال", "الدروس الخصوصية"]
+ACTIONS = ["لتوصيل", "لتأجير", "لبيع", "لإصلاح", "لتقييم", "لمقارنة أسعار", "لحجز", "لمشاركة"]
+AUDIENCES = ["للعائلات", "للطلاب", "للشركات الصغيرة", "لكبار السن", "للمطاعم", "للمستثمرين", "للمسافرين"]
+CITIES = ["الرياض", "جدة", "الدمام", "القاهرة", "دبي", "عمان", "الكويت", "الدوحة", "مسقط", "الرباط"]
+MODELS = ["باشتراك شهري", "بعمولة على كل طلب", "بإعلانات داخل التطبيق", "بخطة مجانية ومدفوعة", "بالدفع عند الاستلام"]
+EXTRAS = ["مع تتبع الطلب لحظياً", "مع تقييمات موثقة", "مع برنامج ولاء", "مع دعم فني على مدار الساعة",
+          "مع توصيل في نفس اليوم", "مع ضمان استرجاع", "مع تحليلات للبائعين"]
+HARAKAT = "\u064e\u064f\u0650\u0651\u0652"
+
+
+def make_idea(rng):
+    return (
+        f"{rng.choice(PRODUCTS)} {rng.choice(ACTIONS)} {rng.choice(ITEMS)} {rng.choice(AUDIENCES)} "
+        f"في {rng.choice(CITIES)} رقم {rng.randrange(10**6)}. "
+        f"الإيرادات {rng.choice(MODELS)}. {rng.choice(EXTRAS)} و{rng.choice(EXTRAS)}."
+    )
+
+
+def paraphrase(idea, rng):
+    """تعديلات تافهة: ترتيب الجمل، تشكيل عشوائي، ترقيم ومسافات"""
+    sentences = [s.strip() for s in idea.split(".") if s.strip()]
+    rng.shuffle(sentences)
+    text = "  ".join(s + rng.choice([".", "!", "؛", " ."]) for s in sentences)
+    return "".join(ch + (rng.choice(HARAKAT) if ch.isalpha() and rng.random() < 0.15 else "") for ch in text)
+
+
+def measure(index, queries):
+    latencies, hits = [], 0
+    for query in queries:
+        start = time.perf_counter()
+        hits += index.query(query) is not None
+        latencies.append(time.perf_counter() - start)
+    latencies.sort()
+    return {
+        "p50_ms": statistics.median(latencies) * 1000,
+        "p99_ms": latencies[int(0.99 * (len(latencies) - 1))] * 1000,
+        "hit_rate": hits / len(queries),
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--ideas", type=int, default=100_000)
+    parser.add_argument("--queries", type=int, default=2000)
+    parser.add_argument("--threshold", type=float, default=0.85)
+    parser.add_argument("--seed", type=int, default=7)
+    parser.add_argument("--json", help="حفظ النتائج في ملف JSON")
+    args = parser.parse_args(argv)
+
+    rng = random.Random(args.seed)
+    index = SimilarityIndex(threshold=args.threshold, max_entries=args.ideas)
+    stored = [make_idea(rng) for _ in range(args.ideas)]
+
+    start = time.perf_counter()
+    for position, idea in enumerate(stored):
+        index.add(idea, position)
+    build_seconds = time.perf_counter() - start
+
+    results = {
+        "ideas": args.ideas,
+        "build_seconds": build_seconds,
+        "paraphrase": measure(index, [paraphrase(rng.choice(stored), rng) for _ in range(args.queries)]),
+        "novel": measure(index, [make_idea(rng) for _ in range(args.queries)]),
+    }
+
+    print(f"indexed {args.ideas} ideas in {build_seconds:.1f}s")
+    print(f"{'query':<12}{'p50 ms':>9}{'p99 ms':>9}{'hit rate':>10}")
+    for kind in ("paraphrase", "novel"):
+        r = results[kind]
+        print(f"{kind:<12}{r['p50_ms']:>9.3f}{r['p99_ms']:>9.3f}{r['hit_rate'] * 100:>9.1f}%")
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,112 @@
+"""زمن البدء البارد: استيراد agents و orchestrator و app و cli وأول طلب بعده.
+
+    python -m benchmarks.startup --runs 5 --append benchmarks/startup_history.jsonl
+
+كل قياس في عملية Python جديدة:
+- import: الزمن التراكمي للوحدة من python -X importtime (بالميلي ثانية)
+- first_request: من بداية العملية حتى اكتمال أول تحليل، على خادم OpenAI وهمي
+  محلي بلا زمن استجابة، فيظهر ما يضيفه الاستيراد وبناء العملاء والوكلاء فقط
+--append يضيف سطراً لكل تشغيل (مع commit الحالي) لتتبع الاتجاه عبر الزمن.
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+from benchmarks.mock_openai_server import MockOpenAIServer
+
+
+MODULES = ["agents", "orchestrator", "app", "cli"]
+
+FIRST_REQUEST = {
+    "app": """
+import time
+started = time.perf_counter()
+import app
+response = app.app.test_client().post('/analyze', json={"idea": "منصة لتوصيل المخبوزات"})
+assert response.status_code == 200, response.get_data(as_text=True)
+print(time.perf_counter() - started)
+""",
+    "orchestrator": """
+import time
+started = time.perf_counter()
+from orchestrator import AIConsultantOrchestrator
+orchestrator = AIConsultantOrchestrator()
+orchestrator.pipeline.run("منصة لتوصيل المخبوزات")
+print(time.perf_counter() - started)
+""",
+}
+
+
+def import_ms(module, env):
+    """الزمن التراكمي لاستيراد الوحدة كما يطبعه -X importtime"""
+    completed = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        capture_output=True, text=True, env=env, check=True,
+    )
+    for line in reversed(completed.stderr.splitlines()):
+        parts = [part.strip() for part in line.split("|")]
+        if len(parts) == 3 and parts[2] == module:
+            return int(parts[1]) / 1000
+    raise RuntimeError(f"no importtime entry for {module}")
+
+
+def first_request_ms(script, env):
+    completed = subprocess.run([sys.executable, "-c", script], capture_output=True, text=True, env=env)
+    if completed.returncode:
+        raise RuntimeError(completed.stderr)
+    return float(completed.stdout.strip().splitlines()[-1]) * 1000
+
+
+def git_commit():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--json", help="حفظ النتائج في ملف JSON")
+    parser.add_argument("--append", help="إضافة النتائج كسطر إلى ملف JSONL لتتبعها عبر الزمن")
+    args = parser.parse_args(argv)
+
+    results = {"commit": git_commit(), "timestamp": time.time(), "import_ms": {}, "first_request_ms": {}}
+    with MockOpenAIServer(handshake_delay=0, latency=0) as server:
+        env = {
+            **os.environ,
+            "OPENAI_API_KEY": "mock-key",
+            "OPENAI_BASE_URL": server.base_url,
+            "RESULT_CACHE_PATH": "",
+            "HISTORY_DB_PATH": "",
+            "JOBS_DB_PATH": "",
+        }
+        for module in MODULES:
+            results["import_ms"][module] = statistics.median(import_ms(module, env) for _ in range(args.runs))
+        for name, script in FIRST_REQUEST.items():
+            results["first_request_ms"][name] = statistics.median(
+                first_request_ms(script, env) for _ in range(args.runs)
+            )
+
+    print(f"{'module':<14}{'import ms':>11}{'first request ms':>18}")
+    for module in MODULES:
+        first = results["first_request_ms"].get(module)
+        first = "-" if first is None else f"{first:.1f}"
+        print(f"{module:<14}{results['import_ms'][module]:>11.1f}{first:>18}")
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+    if args.append:
+        with open(args.append, "a", encoding="utf-8") as f:
+            f.write(json.dumps(results) + "\n")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,90 @@
+"""أثر ميزانية مدخلات وكيل التوليف على الرموز والزمن والتكلفة.
+
+    python -m benchmarks.synthesis_budget --ideas 20 --analysis-words 250
+
+يبني تحليلات مطولة (كما يكتبها gpt-4o-mini أحياناً) ثم يشغل التوليف على
+المزود الوهمي لكل ميزانية. زمن المزود هنا يشمل كلفة قراءة الإدخال
+(seconds_per_input_token) حتى يظهر أثر تقصير الطلب على الزمن.
+"""
+import argparse
+import json
+import statistics
+import time
+
+from agents import (
+    MarketAnalysis,
+    FinancialAnalysis,
+    CompetitiveAnalysis,
+    StrategicSynthesizerAgent,
+    ModelLimits,
+    RateLimiter,
+)
+from agents.metrics import collect_request_metrics, usage_cost
+from benchmarks.fake_provider import FakeProvider, _section
+
+
+def verbose_analyses(words: int):
+    return (
+        MarketAnalysis.from_dict(_section("market", words)),
+        FinancialAnalysis.from_dict(_section("financial", words)),
+        CompetitiveAnalysis.from_dict(_section("competitive", words)),
+    )
+
+
+def run_budget(budget, args):
+    provider = FakeProvider(
+        seconds_per_input_token=args.seconds_per_input_token,
+        latency_scale=args.latency_scale,
+    )
+    limiter = RateLimiter(limits={"gpt-4o": ModelLimits(requests_per_minute=10**6, tokens_per_minute=10**9)})
+    synthesizer = StrategicSynthesizerAgent(provider, rate_limiter=limiter, input_token_budget=budget)
+    analyses = verbose_analyses(args.analysis_words)
+
+    latencies, saved = [], []
+    for index in range(args.ideas):
+        start = time.perf_counter()
+        with collect_request_metrics() as collected:
+            synthesizer.synthesize(f"فكرة رقم {index}: منصة توصيل مخبوزات محلية عبر اشتراك شهري", *analyses)
+        latencies.append(time.perf_counter() - start)
+        saved.append(collected.compaction_saved_tokens)
+
+    prompt_tokens = provider.stats["prompt_tokens"] / args.ideas
+    completion_tokens = provider.stats["completion_tokens"] / args.ideas
+    return {
+        "budget": budget,
+        "prompt_tokens": prompt_tokens,
+        "saved_tokens": statistics.mean(saved),
+        "latency_p50": statistics.median(latencies),
+        "cost_per_idea_usd": usage_cost("gpt-4o", int(prompt_tokens), int(completion_tokens), 0),
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--ideas", type=int, default=20)
+    parser.add_argument("--analysis-words", type=int, default=250, help="طول كل حقل نصي في التحليلات المولدة")
+    parser.add_argument("--budgets", default="none,4000,2500,1500,1000", help="قائمة ميزانيات مفصولة بفواصل")
+    parser.add_argument("--seconds-per-input-token", type=float, default=0.0005)
+    parser.add_argument("--latency-scale", type=float, default=0.1)
+    parser.add_argument("--json", help="حفظ النتائج في ملف JSON")
+    args = parser.parse_args(argv)
+
+    budgets = [None if b.strip() == "none" else int(b) for b in args.budgets.split(",")]
+    results = [run_budget(budget, args) for budget in budgets]
+
+    baseline = results[0]
+    print(f"{'budget':>8}{'prompt tok':>12}{'saved':>8}{'p50 s':>8}{'latency':>9}{'$/idea':>10}{'cost':>8}")
+    for r in results:
+        print(
+            f"{str(r['budget'] or '-'):>8}{r['prompt_tokens']:>12.0f}{r['saved_tokens']:>8.0f}"
+            f"{r['latency_p50']:>8.3f}{(r['latency_p50'] / baseline['latency_p50'] - 1) * 100:>8.1f}%"
+            f"{r['cost_per_idea_usd']:>10.5f}{(r['cost_per_idea_usd'] / baseline['cost_per_idea_usd'] - 1) * 100:>7.1f}%"
+        )
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
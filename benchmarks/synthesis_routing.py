@@ -0,0 +1,126 @@
+"""أثر توجيه التوليف بحسب الخلاف على زمن المذكرة وكلفتها.
+
+    python -m benchmarks.synthesis_routing --ideas 200 --agreement 0.4,0.3,0.3
+
+يولد ثلاثيات تحليلات بمزيج من الحالات: اتفاق بثقة عالية، خلاف محدود، وتعارض
+حقيقي (--agreement نسبها بالترتيب)، ثم يكتب المذكرات على المزود الوهمي مرتين:
+كل شيء إلى gpt-4o، ثم مع SynthesisRouter. gpt-4o-mini أسرع بعامل --mini-speed.
+"""
+import argparse
+import json
+import random
+import statistics
+import time
+
+from agents import (
+    MarketAnalysis,
+    FinancialAnalysis,
+    CompetitiveAnalysis,
+    StrategicSynthesizerAgent,
+    ModelLimits,
+    RateLimiter,
+    SynthesisRouter,
+)
+from agents.metrics import collect_request_metrics
+from agents.routing import disagreement_score
+from benchmarks.fake_provider import FakeProvider, _section
+
+
+LEVELS = ["منخفض", "متوسط", "عالي"]
+
+
+def make_analyses(kind, rng, words):
+    """agree: نفس المخاطرة بثقة 0.85+، mild: فرق درجة واحدة، conflict: منخفض مقابل عالي"""
+    if kind == "agree":
+        level = rng.choice(LEVELS)
+        risks = [level] * 3
+        confidences = [rng.uniform(0.85, 0.95) for _ in range(3)]
+    elif kind == "mild":
+        level = rng.randrange(2)
+        risks = [LEVELS[level], LEVELS[level], LEVELS[level + 1]]
+        confidences = [rng.uniform(0.8, 0.9) for _ in range(3)]
+    else:
+        risks = ["منخفض", "متوسط", "عالي"]
+        confidences = [rng.uniform(0.5, 0.8) for _ in range(3)]
+    rng.shuffle(risks)
+    return tuple(
+        cls.from_dict({**_section(name, words), "risk_level": risk, "confidence_score": confidence})
+        for cls, name, risk, confidence in zip(
+            (MarketAnalysis, FinancialAnalysis, CompetitiveAnalysis),
+            ("market", "financial", "competitive"),
+            risks,
+            confidences,
+        )
+    )
+
+
+def run(cases, router, args):
+    provider = FakeProvider(latency_scale=args.latency_scale, model_latency={"gpt-4o-mini": args.mini_speed})
+    unlimited = ModelLimits(requests_per_minute=10**6, tokens_per_minute=10**9)
+    limiter = RateLimiter(limits={"gpt-4o": unlimited, "gpt-4o-mini": unlimited})
+    synthesizer = StrategicSynthesizerAgent(provider, rate_limiter=limiter, router=router)
+
+    latencies, cost, routes = [], 0.0, {}
+    for index, analyses in enumerate(cases):
+        start = time.perf_counter()
+        with collect_request_metrics() as collected:
+            memo = synthesizer.synthesize(f"فكرة رقم {index}: منصة توصيل مخبوزات محلية", *analyses)
+        latencies.append(time.perf_counter() - start)
+        cost += collected.cost_usd
+        routes[memo.synthesis_route] = routes.get(memo.synthesis_route, 0) + 1
+    latencies.sort()
+    return {
+        "routing": router is not None,
+        "routes": routes,
+        "p50_ms": statistics.median(latencies) * 1000,
+        "p95_ms": latencies[int(0.95 * (len(latencies) - 1))] * 1000,
+        "total_seconds": sum(latencies),
+        "cost_usd": cost,
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--ideas", type=int, default=200)
+    parser.add_argument("--agreement", default="0.4,0.3,0.3", help="نسب agree,mild,conflict")
+    parser.add_argument("--template-below", type=float, default=SynthesisRouter.template_below)
+    parser.add_argument("--cheap-below", type=float, default=SynthesisRouter.cheap_below)
+    parser.add_argument("--mini-speed", type=float, default=0.4, help="زمن gpt-4o-mini كنسبة من زمن gpt-4o")
+    parser.add_argument("--latency-scale", type=float, default=0.05)
+    parser.add_argument("--analysis-words", type=int, default=60)
+    parser.add_argument("--json", help="حفظ النتائج في ملف JSON")
+    args = parser.parse_args(argv)
+
+    rng = random.Random(5)
+    weights = [float(w) for w in args.agreement.split(",")]
+    kinds = rng.choices(["agree", "mild", "conflict"], weights=weights, k=args.ideas)
+    cases = [make_analyses(kind, rng, args.analysis_words) for kind in kinds]
+    scores = {kind: [] for kind in ("agree", "mild", "conflict")}
+    for kind, analyses in zip(kinds, cases):
+        scores[kind].append(disagreement_score(*analyses))
+
+    router = SynthesisRouter(template_below=args.template_below, cheap_below=args.cheap_below)
+    results = [run(cases, None, args), run(cases, router, args)]
+
+    print("disagreement score by case: " + ", ".join(
+        f"{kind} {min(values):.2f}-{max(values):.2f}" for kind, values in scores.items() if values
+    ))
+    print(f"{'routing':<9}{'p50 ms':>9}{'p95 ms':>9}{'total s':>9}{'cost $':>10}  routes")
+    for r in results:
+        print(
+            f"{'on' if r['routing'] else 'off':<9}{r['p50_ms']:>9.1f}{r['p95_ms']:>9.1f}"
+            f"{r['total_seconds']:>9.2f}{r['cost_usd']:>10.4f}  {r['routes']}"
+        )
+    baseline, routed = results
+    print(
+        f"saved: {(1 - routed['total_seconds'] / baseline['total_seconds']) * 100:.1f}% latency, "
+        f"{(1 - routed['cost_usd'] / baseline['cost_usd']) * 100:.1f}% cost"
+    )
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
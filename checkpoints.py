@@ -0,0 +1,126 @@
+"""نقاط حفظ لكل مرحلة من التحليل، مفهرسة بمعرف الطلب.
+
+كل مخرج عقدة يُحفظ فور اكتماله تحت request_id. فشل التوليف (JSON لم يُصلح، أو
+انتهاء مهلة gpt-4o) لا يضيع التحليلات الثلاثة المدفوعة: إعادة المحاولة بنفس
+المعرف تستعيدها وتعيد تنفيذ المرحلة الفاشلة وحدها (scheduler: initial).
+
+نقاط الحفظ تنتهي بعد ttl_seconds، وتُربط بنص الفكرة: نفس المعرف مع فكرة أخرى
+يبدأ من الصفر.
+"""
+import json
+import os
+import sqlite3
+import threading
+import time
+from typing import Any, Dict, Optional
+
+from agents.serialization import dumps
+
+
+DEFAULT_CHECKPOINT_PATH = os.path.join(
+    os.path.expanduser("~"), ".cache", "ai_consultant", "checkpoints.sqlite3"
+)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS checkpoint_requests (
+    request_id TEXT PRIMARY KEY,
+    business_idea TEXT NOT NULL,
+    attempts INTEGER NOT NULL,
+    expires_at REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS checkpoints (
+    request_id TEXT NOT NULL,
+    output TEXT NOT NULL,
+    type TEXT NOT NULL,
+    payload TEXT NOT NULL,
+    created_at REAL NOT NULL,
+    PRIMARY KEY (request_id, output)
+);
+CREATE INDEX IF NOT EXISTS checkpoint_requests_expires ON checkpoint_requests (expires_at);
+"""
+
+
+class CheckpointStore:
+    """مخرجات العقد المكتملة لكل request_id في SQLite. path=None يعطي قاعدة في الذاكرة"""
+
+    def __init__(self, path: Optional[str] = DEFAULT_CHECKPOINT_PATH, ttl_seconds: float = 24 * 3600):
+        if path:
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self.ttl_seconds = ttl_seconds
+        self._db = sqlite3.connect(path or ":memory:", check_same_thread=False, timeout=30)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.executescript(SCHEMA)
+        self._db.commit()
+        self._lock = threading.Lock()
+
+    def begin(self, request_id: str, business_idea: str) -> int:
+        """تسجيل محاولة جديدة للطلب؛ يعيد رقمها (1 للأولى). فكرة مختلفة تمحو ما سبق"""
+        now = time.time()
+        with self._lock, self._db:
+            self._purge(now)
+            row = self._db.execute(
+                "SELECT business_idea, attempts FROM checkpoint_requests WHERE request_id = ?", (request_id,)
+            ).fetchone()
+            attempt = row[1] + 1 if row is not None and row[0] == business_idea else 1
+            if attempt == 1:
+                self._db.execute("DELETE FROM checkpoints WHERE request_id = ?", (request_id,))
+            self._db.execute(
+                "INSERT OR REPLACE INTO checkpoint_requests (request_id, business_idea, attempts, expires_at)"
+                " VALUES (?, ?, ?, ?)",
+                (request_id, business_idea, attempt, now + self.ttl_seconds),
+            )
+        return attempt
+
+    def save(self, request_id: str, output: str, value) -> None:
+        with self._lock, self._db:
+            self._db.execute(
+                "INSERT OR REPLACE INTO checkpoints (request_id, output, type, payload, created_at)"
+                " VALUES (?, ?, ?, ?, ?)",
+                (request_id, output, type(value).__name__, dumps(value).decode("utf-8"), time.time()),
+            )
+
+    def load(self, request_id: str, types: Dict[str, type]) -> Dict[str, Any]:
+        """{اسم المخرج: القيمة} المحفوظة؛ types يحول اسم النوع المحفوظ إلى صنفه.
+
+        مخرج نوعه غير معروف (وكيل أُزيل من السجل مثلاً) يُهمل فتُعاد عقدته.
+        """
+        with self._lock:
+            rows = self._db.execute(
+                "SELECT output, type, payload FROM checkpoints WHERE request_id = ?", (request_id,)
+            ).fetchall()
+        values = {}
+        for output, type_name, payload in rows:
+            cls = types.get(type_name)
+            if cls is not None:
+                values[output] = cls(**json.loads(payload))
+        return values
+
+    def attempts(self, request_id: str) -> int:
+        with self._lock:
+            row = self._db.execute(
+                "SELECT attempts FROM checkpoint_requests WHERE request_id = ?", (request_id,)
+            ).fetchone()
+        return row[0] if row is not None else 0
+
+    def discard(self, request_id: str) -> None:
+        with self._lock, self._db:
+            self._db.execute("DELETE FROM checkpoints WHERE request_id = ?", (request_id,))
+            self._db.execute("DELETE FROM checkpoint_requests WHERE request_id = ?", (request_id,))
+
+    def _purge(self, now: float) -> None:
+        self._db.execute(
+            "DELETE FROM checkpoints WHERE request_id IN"
+            " (SELECT request_id FROM checkpoint_requests WHERE expires_at <= ?)",
+            (now,),
+        )
+        self._db.execute("DELETE FROM checkpoint_requests WHERE expires_at <= ?", (now,))
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            (requests,) = self._db.execute("SELECT COUNT(*) FROM checkpoint_requests").fetchone()
+            (outputs,) = self._db.execute("SELECT COUNT(*) FROM checkpoints").fetchone()
+            (retried,) = self._db.execute(
+                "SELECT COUNT(*) FROM checkpoint_requests WHERE attempts > 1"
+            ).fetchone()
+        return {"requests": requests, "outputs": outputs, "retried_requests": retried}
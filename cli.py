@@ -0,0 +1,288 @@
+import argparse
+import json
+import os
+import sys
+
+
+HISTORY_BATCH_SIZE = 100
+
+
+def read_ideas(stream):
+    """قراءة الأفكار من JSONL: كائن {"id", "idea"} أو نص JSON أو سطر نصي عادي.
+
+    JSON ليس كائناً ولا نصاً (رقم أو مصفوفة) يُقرأ كنص السطر نفسه. كائن بلا
+    "idea" نصية لا يوقف الدفعة: يُعاد بمفتاح "error" ليُكتب سطر خطأ له وحده.
+    """
+    for line_number, line in enumerate(stream, 1):
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            record = json.loads(line)
+        except json.JSONDecodeError:
+            record = line
+        if isinstance(record, str):
+            record = {"idea": record}
+        elif not isinstance(record, dict):
+            record = {"idea": line}
+        record.setdefault("id", str(line_number))
+        record["id"] = str(record["id"])
+        if not isinstance(record.get("idea"), str) or not record["idea"].strip():
+            record["error"] = 'missing "idea"'
+        yield record
+
+
+def load_completed_ids(output_path):
+    """المعرفات التي نجح تحليلها في ملف الإخراج، لاستئناف التشغيل من نقطة التوقف.
+
+    إذا انقطع التشغيل أثناء كتابة السطر الأخير يُحذف ذلك السطر الناقص حتى لا
+    يلتصق به أول سطر يُكتب بعد الاستئناف.
+    """
+    if not output_path or not os.path.exists(output_path):
+        return set()
+
+    completed = set()
+    with open(output_path, "rb+") as f:
+        data = f.read()
+        if data and not data.endswith(b"\n"):
+            f.truncate(data.rfind(b"\n") + 1)
+            data = data[:data.rfind(b"\n") + 1]
+
+    for line in data.decode("utf-8").splitlines():
+        try:
+            record = json.loads(line)
+        except json.JSONDecodeError:
+            continue
+        if record.get("status") == "success":
+            completed.add(str(record["id"]))
+    return completed
+
+
+def run_analyze(args):
+    from orchestrator import AIConsultantOrchestrator
+
+    source = sys.stdin if args.input == "-" else open(args.input, encoding="utf-8")
+    completed = load_completed_ids(args.output) if args.resume else set()
+    output = open(args.output, "a" if args.resume else "w", encoding="utf-8") if args.output else sys.stdout
+
+    in_flight = {}
+    succeeded = failed = 0
+
+    def write(record, line):
+        output.write(json.dumps(line, ensure_ascii=False) + "\n")
+        output.flush()
+        print(f"[{succeeded + failed}] {record['id']}: {line['status']}", file=sys.stderr)
+
+    def pending_ideas():
+        nonlocal failed
+        index = 0
+        for record in read_ideas(source):
+            if record["id"] in completed:
+                continue
+            if "error" in record:
+                failed += 1
+                write(record, {"id": record["id"], "idea": record.get("idea"), "status": "error",
+                               "message": record["error"]})
+                continue
+            in_flight[index] = record
+            index += 1
+            yield record["idea"]
+
+    orchestrator = AIConsultantOrchestrator(max_workers=3 * args.concurrency, history=_history_store())
+    # النتائج تُحفظ في السجل على دفعات: معاملة واحدة لكل HISTORY_BATCH_SIZE نتيجة
+    pending_history = []
+    try:
+        for index, result in orchestrator.analyze_many(
+            pending_ideas(), max_concurrency=args.concurrency, return_exceptions=True
+        ):
+            record = in_flight.pop(index)
+            if isinstance(result, Exception):
+                failed += 1
+                line = {"id": record["id"], "idea": record["idea"], "status": "error", "message": str(result)}
+            else:
+                succeeded += 1
+                line = {"id": record["id"], "idea": record["idea"], "status": "success", **result.to_dict()}
+                pending_history.append(result)
+                if len(pending_history) >= HISTORY_BATCH_SIZE:
+                    orchestrator.history.add_many(pending_history)
+                    pending_history.clear()
+            write(record, line)
+    finally:
+        if pending_history:
+            orchestrator.history.add_many(pending_history)
+        if source is not sys.stdin:
+            source.close()
+        if output is not sys.stdout:
+            output.close()
+
+    print(
+        f"done: {succeeded} succeeded, {failed} failed, {len(completed)} skipped (already completed)",
+        file=sys.stderr,
+    )
+    return 1 if failed else 0
+
+
+def _offline_agents():
+    """وكلاء بدون عميل OpenAI: يكفي بناء الطلبات وتحليل الاستجابات لوضع Batch API.
+
+    النتائج المستوردة تُحفظ في نفس الذاكرة المؤقتة التي يستخدمها التحليل المباشر.
+    """
+    from agents import (
+        MarketLogicAgent,
+        FinancialSustainabilityAgent,
+        CompetitiveDurabilityAgent,
+        StrategicSynthesizerAgent,
+        ResultCache,
+    )
+    from agents.cache import DEFAULT_CACHE_PATH
+
+    cache = ResultCache(path=os.getenv("RESULT_CACHE_PATH", DEFAULT_CACHE_PATH) or None)
+    divergence_agents = {
+        "market": MarketLogicAgent(None, cache=cache),
+        "financial": FinancialSustainabilityAgent(None, cache=cache),
+        "competitive": CompetitiveDurabilityAgent(None, cache=cache),
+    }
+    return divergence_agents, StrategicSynthesizerAgent(None, cache=cache)
+
+
+def _history_store():
+    """سجل التحليلات كما في app.py: HISTORY_DB_PATH فارغ يعني قاعدة في الذاكرة فقط"""
+    from history import DEFAULT_HISTORY_PATH, AnalysisStore
+
+    return AnalysisStore(os.getenv("HISTORY_DB_PATH", DEFAULT_HISTORY_PATH) or None)
+
+
+def _load_ideas(path):
+    """الأفكار الصالحة فقط؛ سطر بلا فكرة يُذكر في stderr ولا يدخل الدفعة"""
+    records = []
+    with open(path, encoding="utf-8") as f:
+        for record in read_ideas(f):
+            if "error" in record:
+                print(f"{record['id']}: {record['error']}", file=sys.stderr)
+            else:
+                records.append(record)
+    return records
+
+
+def run_batch_compile(args):
+    import batch_api
+
+    agents, _ = _offline_agents()
+    count = batch_api.compile_divergence_batch(_load_ideas(args.ideas), agents, args.output)
+    print(f"wrote {count} divergence requests to {args.output}", file=sys.stderr)
+    return 0
+
+
+def run_batch_synthesize(args):
+    import batch_api
+
+    agents, synthesizer = _offline_agents()
+    records = _load_ideas(args.ideas)
+    analyses, failures = batch_api.ingest_divergence_results(args.divergence_results, records, agents)
+    count = batch_api.compile_synthesis_batch(records, analyses, synthesizer, args.output)
+    for idea_id, message in failures.items():
+        print(f"{idea_id}: {message}", file=sys.stderr)
+    print(f"wrote {count} synthesis requests to {args.output} ({len(failures)} ideas failed)", file=sys.stderr)
+    return 0
+
+
+def run_batch_ingest(args):
+    import batch_api
+
+    agents, synthesizer = _offline_agents()
+    records = _load_ideas(args.ideas)
+    analyses, failures = batch_api.ingest_divergence_results(args.divergence_results, records, agents)
+    results, synthesis_failures = batch_api.ingest_synthesis_results(
+        args.synthesis_results, records, analyses, synthesizer
+    )
+    failures.update(synthesis_failures)
+
+    with open(args.output, "w", encoding="utf-8") as output:
+        for record in records:
+            if record["id"] in results:
+                line = {"id": record["id"], "idea": record["idea"], "status": "success",
+                        **results[record["id"]].to_dict()}
+            else:
+                message = failures.get(record["id"], "missing from batch results")
+                line = {"id": record["id"], "idea": record["idea"], "status": "error", "message": message}
+            output.write(json.dumps(line, ensure_ascii=False) + "\n")
+
+    _history_store().add_many(results[record["id"]] for record in records if record["id"] in results)
+
+    print(f"done: {len(results)} succeeded, {len(records) - len(results)} failed", file=sys.stderr)
+    return 1 if len(results) < len(records) else 0
+
+
+def run_batch_submit(args):
+    import batch_api
+    from openai import OpenAI
+
+    batch = batch_api.submit_batch(OpenAI(), args.requests)
+    print(batch.id)
+    return 0
+
+
+def run_batch_fetch(args):
+    import batch_api
+    from openai import OpenAI
+
+    batch = batch_api.download_batch_output(OpenAI(), args.batch_id, args.output)
+    print(f"{batch.id}: {batch.status}", file=sys.stderr)
+    return 0 if batch.status == "completed" else 2
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(
+        description="تحليل الأفكار دفعة واحدة بدون لوحة العرض / Headless bulk analysis"
+    )
+    subcommands = parser.add_subparsers(dest="command", required=True)
+
+    analyze = subcommands.add_parser("analyze", help="تحليل أفكار من ملف JSONL أو stdin")
+    analyze.add_argument("input", help='ملف JSONL بالأفكار، أو "-" للقراءة من stdin')
+    analyze.add_argument("-o", "--output", help="ملف JSONL للنتائج (الافتراضي stdout)")
+    analyze.add_argument("-c", "--concurrency", type=int, default=4, help="عدد الأفكار قيد التنفيذ في آن واحد")
+    analyze.add_argument(
+        "--no-resume",
+        dest="resume",
+        action="store_false",
+        help="إعادة تحليل كل الأفكار بدلاً من تخطي ما نجح سابقاً في ملف الإخراج",
+    )
+    analyze.set_defaults(handler=run_analyze)
+
+    # وضع Batch API: تحويل بلا اتصال بين ملفات الأفكار وملفات الدفعات
+    compile_cmd = subcommands.add_parser("batch-compile", help="ملف طلبات الدفعة الأولى (الوكلاء الثلاثة)")
+    compile_cmd.add_argument("ideas")
+    compile_cmd.add_argument("-o", "--output", required=True)
+    compile_cmd.set_defaults(handler=run_batch_compile)
+
+    synthesize_cmd = subcommands.add_parser("batch-synthesize", help="ملف طلبات دفعة التوليف من نتائج الدفعة الأولى")
+    synthesize_cmd.add_argument("ideas")
+    synthesize_cmd.add_argument("divergence_results")
+    synthesize_cmd.add_argument("-o", "--output", required=True)
+    synthesize_cmd.set_defaults(handler=run_batch_synthesize)
+
+    ingest_cmd = subcommands.add_parser("batch-ingest", help="تجميع نتائج الدفعتين في JSONL بنفس شكل analyze")
+    ingest_cmd.add_argument("ideas")
+    ingest_cmd.add_argument("divergence_results")
+    ingest_cmd.add_argument("synthesis_results")
+    ingest_cmd.add_argument("-o", "--output", required=True)
+    ingest_cmd.set_defaults(handler=run_batch_ingest)
+
+    submit_cmd = subcommands.add_parser("batch-submit", help="رفع ملف طلبات وإنشاء دفعة لدى المزود")
+    submit_cmd.add_argument("requests")
+    submit_cmd.set_defaults(handler=run_batch_submit)
+
+    fetch_cmd = subcommands.add_parser("batch-fetch", help="تنزيل نتائج دفعة مكتملة")
+    fetch_cmd.add_argument("batch_id")
+    fetch_cmd.add_argument("-o", "--output", required=True)
+    fetch_cmd.set_defaults(handler=run_batch_fetch)
+    return parser
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    return args.handler(args)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
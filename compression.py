@@ -0,0 +1,54 @@
+"""ضغط استجابات JSON حسب Accept-Encoding: brotli إن كان مثبتاً، ثم gzip.
+
+المستويات متوسطة عمداً: الاستجابة تُضغط مرة لكل طلب، ومستوى أعلى يوفر بايتات
+قليلة مقابل زمن معالج أكبر بكثير. ما دون MIN_SIZE يُرسل كما هو.
+"""
+import gzip
+from typing import Optional
+
+try:
+    import brotli
+except ImportError:  # اعتماد اختياري: بدونه يبقى gzip وحده
+    brotli = None
+
+
+MIN_SIZE = 1024
+GZIP_LEVEL = 6
+BROTLI_QUALITY = 5
+
+
+def available_encodings():
+    """الترميزات المدعومة بترتيب التفضيل عند تساوي q"""
+    return ("br", "gzip") if brotli is not None else ("gzip",)
+
+
+def negotiate(accept_encoding: Optional[str]) -> Optional[str]:
+    """أفضل ترميز يقبله العميل، أو None لإرسال الجسم بلا ضغط"""
+    if not accept_encoding:
+        return None
+    accepted = {}
+    for part in accept_encoding.split(","):
+        name, _, params = part.partition(";")
+        quality = 1.0
+        params = params.strip().replace(" ", "")
+        if params.startswith("q="):
+            try:
+                quality = float(params[2:])
+            except ValueError:
+                quality = 0.0
+        accepted[name.strip().lower()] = quality
+    best, best_quality = None, 0.0
+    for encoding in available_encodings():
+        quality = accepted.get(encoding, accepted.get("*", 0.0))
+        if quality > best_quality:
+            best, best_quality = encoding, quality
+    return best
+
+
+def compress(body: bytes, encoding: str) -> bytes:
+    if encoding == "br":
+        return brotli.compress(body, quality=BROTLI_QUALITY)
+    if encoding == "gzip":
+        # mtime=0 يجعل الناتج حتمياً لنفس الجسم
+        return gzip.compress(body, compresslevel=GZIP_LEVEL, mtime=0)
+    raise ValueError(f"unsupported content encoding {encoding!r}")
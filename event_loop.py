@@ -0,0 +1,53 @@
+import asyncio
+import threading
+from concurrent.futures import Future
+
+
+class BackgroundEventLoop:
+    """حلقة asyncio واحدة في خيط خلفي تستضيف كل استدعاءات AsyncOpenAI.
+
+    عميل AsyncOpenAI مرتبط بالحلقة التي أُنشئ فيها مجمّع اتصالاته، لذلك
+    نوجّه كل الاستدعاءات غير المتزامنة في العملية إلى حلقة واحدة طويلة العمر
+    بدلاً من حلقة جديدة لكل طلب.
+    """
+
+    def __init__(self, name: str = "agents-event-loop"):
+        self.loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(target=self._run, name=name, daemon=True)
+        self._thread.start()
+
+    def _run(self):
+        asyncio.set_event_loop(self.loop)
+        self.loop.run_forever()
+
+    def submit(self, coro) -> Future:
+        return asyncio.run_coroutine_threadsafe(coro, self.loop)
+
+    def run(self, coro, timeout: float = None):
+        return self.submit(coro).result(timeout)
+
+    async def run_async(self, coro):
+        """انتظار coroutine على الحلقة الخلفية من داخل حلقة أخرى (مثل عرض Flask غير متزامن)"""
+        return await asyncio.wrap_future(self.submit(coro))
+
+    def close(self):
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self._thread.join()
+        self.loop.close()
+
+
+_shared = None
+_shared_lock = threading.Lock()
+
+
+def shared_event_loop() -> BackgroundEventLoop:
+    """حلقة العملية المشتركة، تُبنى عند أول طلب.
+
+    عميل AsyncOpenAI المشترك (agents.shared_clients) يرتبط بأول حلقة يُستخدم فيها،
+    فأي حلقة ثانية تستدعيه تفشل؛ app.py ودفعات المنسق تتشارك هذه الحلقة لذلك.
+    """
+    global _shared
+    with _shared_lock:
+        if _shared is None:
+            _shared = BackgroundEventLoop()
+        return _shared
@@ -0,0 +1,215 @@
+"""سجل دائم لكل تحليل مكتمل: المذكرة والتحليلات الثلاثة في SQLite مع بحث FTS5.
+
+الصفحات تعتمد keyset pagination على id (before=آخر id في الصفحة السابقة) بدلاً
+من OFFSET، فتبقى كلفة الصفحة ثابتة مهما بلغ عدد الصفوف. النصوص العربية توحد
+(حذف التشكيل وتوحيد الألف والياء والتاء المربوطة) قبل الفهرسة وقبل البحث.
+"""
+import json
+import os
+import sqlite3
+import threading
+import time
+from typing import Any, Dict, Iterable, List, Optional
+
+from agents.serialization import dumps, merge
+from agents.similarity import normalize_arabic
+from pipeline import AnalysisResult
+
+
+DEFAULT_HISTORY_PATH = os.path.join(
+    os.path.expanduser("~"), ".cache", "ai_consultant", "history.sqlite3"
+)
+MAX_PAGE_SIZE = 100
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS analyses (
+    id INTEGER PRIMARY KEY,
+    created_at REAL NOT NULL,
+    business_idea TEXT NOT NULL,
+    risk_level TEXT NOT NULL,
+    confidence REAL NOT NULL,
+    payload TEXT NOT NULL,
+    content_hash TEXT
+);
+CREATE INDEX IF NOT EXISTS analyses_risk ON analyses (risk_level, id);
+CREATE INDEX IF NOT EXISTS analyses_confidence ON analyses (confidence, id);
+CREATE VIRTUAL TABLE IF NOT EXISTS analyses_fts USING fts5(
+    business_idea, memo, market, financial, competitive,
+    content='', tokenize='unicode61'
+);
+"""
+
+
+def _section_text(section: Dict[str, Any]) -> str:
+    parts = []
+    for value in section.values():
+        if isinstance(value, dict):
+            parts.append(_section_text(value))
+        elif isinstance(value, str):
+            parts.append(value)
+    return normalize_arabic(" ".join(parts))
+
+
+def fts_query(text: str) -> str:
+    """تحويل نص المستخدم إلى استعلام FTS5 آمن: كل كلمة بين علامتي تنصيص، وكلها مطلوبة"""
+    return " ".join('"%s"' % word.replace('"', '""') for word in normalize_arabic(text).split())
+
+
+class AnalysisStore:
+    """تخزين AnalysisResult واسترجاعها بصفحات وبحث نصي. path=None يعطي قاعدة في الذاكرة"""
+
+    def __init__(self, path: Optional[str] = DEFAULT_HISTORY_PATH):
+        if path:
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._db = sqlite3.connect(path or ":memory:", check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.executescript(SCHEMA)
+        # قواعد أُنشئت قبل عناوين /results بلا عمود content_hash
+        columns = {row[1] for row in self._db.execute("PRAGMA table_info(analyses)")}
+        if "content_hash" not in columns:
+            self._db.execute("ALTER TABLE analyses ADD COLUMN content_hash TEXT")
+        self._db.execute("CREATE INDEX IF NOT EXISTS analyses_content_hash ON analyses (content_hash)")
+        self._db.commit()
+        self._lock = threading.Lock()
+
+    def _rows(self, results: Iterable[AnalysisResult], now: float):
+        for result in results:
+            sections = result.to_dict()
+            memo = sections["strategic_memo"]
+            yield (
+                (now, result.business_idea, memo["overall_risk_level"],
+                 float(memo["overall_confidence_score"]), result.to_json().decode("utf-8"), result.content_hash),
+                (normalize_arabic(result.business_idea), _section_text(memo),
+                 _section_text(sections["market_analysis"]), _section_text(sections["financial_analysis"]),
+                 _section_text(sections["competitive_analysis"])),
+            )
+
+    def add(self, result: AnalysisResult) -> int:
+        return self.add_many([result])[0]
+
+    def add_many(self, results: Iterable[AnalysisResult]) -> List[int]:
+        """إدراج دفعة كاملة في معاملة واحدة؛ يعيد المعرفات بنفس الترتيب"""
+        ids = []
+        with self._lock, self._db:
+            for row, fts_row in self._rows(results, time.time()):
+                cursor = self._db.execute(
+                    "INSERT INTO analyses (created_at, business_idea, risk_level, confidence, payload, content_hash)"
+                    " VALUES (?, ?, ?, ?, ?, ?)",
+                    row,
+                )
+                self._db.execute(
+                    "INSERT INTO analyses_fts (rowid, business_idea, memo, market, financial, competitive)"
+                    " VALUES (?, ?, ?, ?, ?, ?)",
+                    (cursor.lastrowid, *fts_row),
+                )
+                ids.append(cursor.lastrowid)
+        return ids
+
+    def get(self, analysis_id: int) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            row = self._db.execute(
+                "SELECT id, created_at, business_idea, payload, content_hash FROM analyses WHERE id = ?", (analysis_id,)
+            ).fetchone()
+        return _record(row) if row else None
+
+    def has(self, content_hash: str) -> bool:
+        """نتيجة مخزنة بهذه البصمة، بلا قراءة الوثيقة نفسها"""
+        with self._lock:
+            (exists,) = self._db.execute(
+                "SELECT EXISTS (SELECT 1 FROM analyses WHERE content_hash = ?)", (content_hash,)
+            ).fetchone()
+        return bool(exists)
+
+    def document(self, content_hash: str) -> Optional[bytes]:
+        """وثيقة AnalysisResult.document() لنتيجة مخزنة، بنفس البايتات التي حُسبت منها البصمة"""
+        with self._lock:
+            row = self._db.execute(
+                "SELECT business_idea, payload FROM analyses WHERE content_hash = ? ORDER BY id DESC LIMIT 1",
+                (content_hash,),
+            ).fetchone()
+        if row is None:
+            return None
+        business_idea, payload = row
+        return merge({"business_idea": business_idea}, payload.encode("utf-8"))
+
+    def page(
+        self,
+        limit: int = 20,
+        before: Optional[int] = None,
+        risk_level: Optional[str] = None,
+        min_confidence: Optional[float] = None,
+        encoded: bool = False,
+    ):
+        """أحدث التحليلات أولاً. next_before يُمرر كـ before لجلب الصفحة التالية.
+
+        encoded=True يعيد الصفحة JSON جاهزاً (bytes) مبنياً من الحمولات المخزنة كما هي.
+        """
+        clauses, params = [], []
+        if before is not None:
+            clauses.append("id < ?")
+            params.append(before)
+        if risk_level:
+            clauses.append("risk_level = ?")
+            params.append(risk_level)
+        if min_confidence is not None:
+            clauses.append("confidence >= ?")
+            params.append(min_confidence)
+        where = f"WHERE {' AND '.join(clauses)}" if clauses else ""
+        return self._page(
+            f"SELECT id, created_at, business_idea, payload, content_hash FROM analyses {where} ORDER BY id DESC LIMIT ?",
+            params, limit, encoded,
+        )
+
+    def search(self, text: str, limit: int = 20, before: Optional[int] = None, encoded: bool = False):
+        """بحث نصي في الفكرة والمذكرة والتحليلات، الأحدث أولاً"""
+        query = fts_query(text)
+        if not query:
+            page = {"items": [], "next_before": None}
+            return dumps(page) if encoded else page
+        params: List[Any] = [query]
+        keyset = ""
+        if before is not None:
+            keyset = "AND analyses_fts.rowid < ?"
+            params.append(before)
+        return self._page(
+            "SELECT a.id, a.created_at, a.business_idea, a.payload, a.content_hash"
+            " FROM analyses_fts JOIN analyses a ON a.id = analyses_fts.rowid"
+            f" WHERE analyses_fts MATCH ? {keyset}"
+            " ORDER BY analyses_fts.rowid DESC LIMIT ?",
+            params, limit, encoded,
+        )
+
+    def _page(self, sql: str, params: List[Any], limit: int, encoded: bool = False):
+        limit = max(1, min(limit, MAX_PAGE_SIZE))
+        with self._lock:
+            # صف إضافي واحد يكفي لمعرفة وجود صفحة تالية دون COUNT(*)
+            rows = self._db.execute(sql, (*params, limit + 1)).fetchall()
+        next_before = rows[limit - 1][0] if len(rows) > limit else None
+        if encoded:
+            # الحمولة مخزنة JSON أصلاً: تُلصق كما هي بدل فكها ثم إعادة ترميزها
+            items = b",".join(_encoded_record(row) for row in rows[:limit])
+            return b'{"items":[' + items + b'],"next_before":' + dumps(next_before) + b"}"
+        return {"items": [_record(row) for row in rows[:limit]], "next_before": next_before}
+
+    def count(self) -> int:
+        with self._lock:
+            return self._db.execute("SELECT COUNT(*) FROM analyses").fetchone()[0]
+
+
+def _head(row) -> Dict[str, Any]:
+    analysis_id, created_at, business_idea, _, content_hash = row
+    return {
+        "id": analysis_id,
+        "created_at": created_at,
+        "business_idea": business_idea,
+        "result_url": f"/results/{content_hash}" if content_hash else None,
+    }
+
+
+def _record(row) -> Dict[str, Any]:
+    return {**_head(row), **json.loads(row[3])}
+
+
+def _encoded_record(row) -> bytes:
+    return merge(_head(row), row[3].encode("utf-8"))
@@ -0,0 +1,269 @@
+"""طابور مهام التحليل: POST /jobs يعيد معرفاً فوراً وعمال في الخلفية ينفذون المسار.
+
+حالة كل مهمة في SQLite، فلا تضيع المهام بإعادة تشغيل العملية: المهمة التي
+توقف نبض عاملها (heartbeat) أكثر من lease_seconds تعود للطابور تلقائياً، حتى لو
+كان العامل في عملية أخرى تشارك نفس الملف.
+"""
+import json
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from functools import partial
+from typing import Any, Dict, Optional
+
+from agents.metrics import metrics
+
+
+DEFAULT_JOBS_PATH = os.path.join(
+    os.path.expanduser("~"), ".cache", "ai_consultant", "jobs.sqlite3"
+)
+# مراحل المسار الافتراضي؛ JobQueue يأخذ مراحله من مخرجات registry المسار
+STAGES = ("market", "financial", "competitive", "synthesis")
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id TEXT PRIMARY KEY,
+    business_idea TEXT NOT NULL,
+    status TEXT NOT NULL,
+    stages TEXT NOT NULL,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    result TEXT,
+    history_id INTEGER,
+    error TEXT,
+    created_at REAL NOT NULL,
+    started_at REAL,
+    finished_at REAL,
+    heartbeat_at REAL
+);
+CREATE INDEX IF NOT EXISTS jobs_status ON jobs (status, created_at);
+"""
+
+
+class JobStore:
+    """حالة المهام في SQLite. path=None يعطي قاعدة في الذاكرة (لا تنجو من إعادة التشغيل)"""
+
+    def __init__(self, path: Optional[str] = DEFAULT_JOBS_PATH, lease_seconds: float = 600.0, max_attempts: int = 3):
+        if path:
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self.lease_seconds = lease_seconds
+        self.max_attempts = max_attempts
+        self._db = sqlite3.connect(path or ":memory:", check_same_thread=False, timeout=30)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.executescript(SCHEMA)
+        self._db.commit()
+        self._lock = threading.Lock()
+
+    def create(self, business_idea: str, stages=STAGES) -> str:
+        job_id = uuid.uuid4().hex
+        stages = json.dumps({stage: "pending" for stage in stages})
+        with self._lock, self._db:
+            self._db.execute(
+                "INSERT INTO jobs (id, business_idea, status, stages, created_at) VALUES (?, ?, 'queued', ?, ?)",
+                (job_id, business_idea, stages, time.time()),
+            )
+        return job_id
+
+    def claim(self) -> Optional[Dict[str, Any]]:
+        """أقدم مهمة منتظرة (أو مهمة انتهت مهلة عاملها) تصبح running لهذا العامل"""
+        now = time.time()
+        stale = now - self.lease_seconds
+        with self._lock, self._db:
+            # مهمة أسقطت عمالها max_attempts مرة لا تعود للطابور مجدداً
+            self._db.execute(
+                "UPDATE jobs SET status = 'failed', error = 'worker lost too many times', finished_at = ?"
+                " WHERE status = 'running' AND heartbeat_at < ? AND attempts >= ?",
+                (now, stale, self.max_attempts),
+            )
+            row = self._db.execute(
+                "UPDATE jobs SET status = 'running', attempts = attempts + 1,"
+                " started_at = ?, heartbeat_at = ?,"
+                " stages = (SELECT json_group_object(key, 'pending') FROM json_each(jobs.stages))"
+                " WHERE id = (SELECT id FROM jobs WHERE status = 'queued'"
+                "             OR (status = 'running' AND heartbeat_at < ?)"
+                "             ORDER BY created_at LIMIT 1)"
+                " RETURNING id, business_idea",
+                (now, now, stale),
+            ).fetchone()
+        if row is None:
+            return None
+        return {"id": row[0], "business_idea": row[1]}
+
+    def update_stage(self, job_id: str, stage: str, state: str) -> None:
+        with self._lock, self._db:
+            self._db.execute(
+                "UPDATE jobs SET stages = json_set(stages, '$.' || ?, ?), heartbeat_at = ? WHERE id = ?",
+                (stage, state, time.time(), job_id),
+            )
+
+    def finish(self, job_id: str, result: Dict[str, Any], history_id: Optional[int] = None) -> None:
+        with self._lock, self._db:
+            self._db.execute(
+                "UPDATE jobs SET status = 'succeeded', result = ?, history_id = ?, finished_at = ? WHERE id = ?",
+                (json.dumps(result, ensure_ascii=False), history_id, time.time(), job_id),
+            )
+
+    def fail(self, job_id: str, error: str) -> None:
+        with self._lock, self._db:
+            self._db.execute(
+                "UPDATE jobs SET status = 'failed', error = ?, finished_at = ? WHERE id = ?",
+                (error, time.time(), job_id),
+            )
+
+    def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            row = self._db.execute(
+                "SELECT id, status, stages, attempts, result, history_id, error, created_at, started_at, finished_at"
+                " FROM jobs WHERE id = ?",
+                (job_id,),
+            ).fetchone()
+        if row is None:
+            return None
+        job_id, status, stages, attempts, result, history_id, error, created_at, started_at, finished_at = row
+        job = {
+            "job_id": job_id,
+            "status": status,
+            "stages": json.loads(stages),
+            "attempts": attempts,
+            "created_at": created_at,
+            "started_at": started_at,
+            "finished_at": finished_at,
+        }
+        if result is not None:
+            job["result"] = json.loads(result)
+            job["history_id"] = history_id
+        if error is not None:
+            job["error"] = error
+        return job
+
+    def counts(self) -> Dict[str, int]:
+        with self._lock:
+            rows = self._db.execute("SELECT status, COUNT(*) FROM jobs GROUP BY status").fetchall()
+        counts = {status: 0 for status in ("queued", "running", "succeeded", "failed")}
+        counts.update(dict(rows))
+        return counts
+
+
+class JobQueue:
+    """عمال خلفيون يسحبون المهام من JobStore ويشغلون AnalysisPipeline.
+
+    loop (BackgroundEventLoop) اختياري: معه يُشغل run_async على الحلقة المشتركة
+    فيتشارك العمال عميل AsyncOpenAI، وبدونه يُستدعى run المتزامن في خيط العامل.
+    مع admission (AdmissionController) تنتظر المهام دورها في مسار bulk بلا مهلة،
+    فلا تزاحم طلبات الواجهة.
+    """
+
+    def __init__(
+        self,
+        store: JobStore,
+        pipeline,
+        history=None,
+        loop=None,
+        workers: int = 4,
+        poll_interval: float = 0.5,
+        admission=None,
+    ):
+        self.store = store
+        self.pipeline = pipeline
+        self.history = history
+        self.loop = loop
+        self.admission = admission
+        # كل مخرج مسجل في registry مرحلة، فالعقد المضافة تظهر في حالة المهمة
+        self.stages = tuple(pipeline.registry.outputs())
+        self.workers = workers
+        self.poll_interval = poll_interval
+        self._wakeup = threading.Condition()
+        self._stopping = False
+        self._busy = 0
+        self._threads = []
+        metrics.gauge("analysis_jobs", "المهام حسب الحالة", "status", self.store.counts)
+        metrics.gauge("job_workers", "عمال طابور المهام المشغولون والكلي", "state", self._worker_counts)
+
+    def start(self) -> "JobQueue":
+        for index in range(self.workers):
+            thread = threading.Thread(target=self._work, name=f"job-worker-{index}", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+        return self
+
+    def stop(self, timeout: Optional[float] = None) -> None:
+        with self._wakeup:
+            self._stopping = True
+            self._wakeup.notify_all()
+        for thread in self._threads:
+            thread.join(timeout)
+        self._threads.clear()
+
+    def submit(self, business_idea: str) -> str:
+        job_id = self.store.create(business_idea, self.stages)
+        with self._wakeup:
+            self._wakeup.notify()
+        return job_id
+
+    def _work(self) -> None:
+        while not self._stopping:
+            job = self.store.claim()
+            if job is None:
+                with self._wakeup:
+                    if not self._stopping:
+                        self._wakeup.wait(self.poll_interval)
+                continue
+            with self._wakeup:
+                self._busy += 1
+            try:
+                self._run(job)
+            finally:
+                with self._wakeup:
+                    self._busy -= 1
+
+    def _run(self, job: Dict[str, Any]) -> None:
+        job_id = job["id"]
+        remaining = {stage for stage in self.stages if stage != "synthesis"}
+
+        def on_complete(name, analysis):
+            remaining.discard(name)
+            self.store.update_stage(job_id, name, "done")
+            if name != "synthesis" and not remaining and "synthesis" in self.stages:
+                self.store.update_stage(job_id, "synthesis", "running")
+
+        for stage in self.stages:
+            if stage in remaining:
+                self.store.update_stage(job_id, stage, "running")
+        try:
+            result = self._analyze(job_id, job["business_idea"], on_complete)
+            history_id = self.history.add(result) if self.history is not None else None
+        except Exception as e:
+            self.store.fail(job_id, str(e))
+            return
+        self.store.update_stage(job_id, "synthesis", "done")
+        self.store.finish(job_id, result.to_dict(), history_id)
+
+    def _analyze(self, job_id: str, business_idea: str, on_complete):
+        # مكان القبول لمن يشغل المسار فعلاً، لا لفكرة شبه مطابقة ولا لتابع تحليل جارٍ
+        admit = None
+        if self.admission is not None:
+            slot = self.admission.slot_async if self.loop is not None else self.admission.slot
+            admit = partial(slot, "bulk", deadline_seconds=None)
+        # معرف المهمة معرف نقاط الحفظ: مهمة عاد بها الطابور بعد سقوط عاملها تكمل من حيث توقف
+        if self.loop is not None:
+            return self.loop.run(
+                self.pipeline.run_async(business_idea, on_complete=on_complete, request_id=job_id, admit=admit)
+            )
+        return self.pipeline.run(business_idea, on_complete=on_complete, request_id=job_id, admit=admit)
+
+    def stats(self) -> Dict[str, Any]:
+        counts = self.store.counts()
+        with self._wakeup:
+            busy = self._busy
+        return {
+            **counts,
+            "queue_depth": counts["queued"],
+            "workers": self.workers,
+            "busy_workers": busy,
+            "utilization": busy / self.workers if self.workers else 0.0,
+        }
+
+    def _worker_counts(self) -> Dict[str, int]:
+        with self._wakeup:
+            return {"busy": self._busy, "total": self.workers}
@@ -1,34 +1,254 @@
 import os
-from openai import OpenAI
+from concurrent.futures import FIRST_COMPLETED, wait
+from functools import cached_property
 from dotenv import load_dotenv
 from agents import (
     MarketLogicAgent,
     FinancialSustainabilityAgent,
     CompetitiveDurabilityAgent,
     StrategicSynthesizerAgent,
+    FusedDivergenceAgent,
+    ResultCache,
+    SimilarityIndex,
+    SynthesisRouter,
+    shared_clients,
 )
-from rich.console import Console
-from rich.panel import Panel
-from rich.markdown import Markdown
-from rich.layout import Layout
-from rich.table import Table
+from event_loop import shared_event_loop
+from history import AnalysisStore
+from pipeline import DIVERGENCE_MODES, AnalysisPipeline, DivergenceStage, default_registry
+
+
+COMPLETED_MESSAGES = {
+    "market": "✓ [green]تم التحليل السوقي (Market Logic)[/green]",
+    "financial": "✓ [blue]تم التحليل المالي (Financial Sustainability)[/blue]",
+    "competitive": "✓ [magenta]تم التحليل التنافسي (Competitive Durability)[/magenta]",
+    "synthesis": "✓ [yellow]تم إنشاء المذكرة الاستراتيجية (Strategic Memo)[/yellow]",
+}
 
 
 class AIConsultantOrchestrator:
-    def __init__(self, api_key: str = None):
-        if api_key:
-            self.client = OpenAI(api_key=api_key)
-        else:
+    def __init__(
+        self,
+        api_key: str = None,
+        max_workers: int = 3,
+        cache: ResultCache = None,
+        divergence_mode: str = "split",
+        synthesis_token_budget: int = None,
+        similarity_threshold: float = 0.85,
+        history: AnalysisStore = None,
+        node_timeout: float = None,
+        synthesis_routing: bool = True,
+        deadline_seconds: float = None,
+    ):
+        if divergence_mode not in DIVERGENCE_MODES:
+            raise ValueError(f"divergence_mode must be one of {DIVERGENCE_MODES}, got {divergence_mode!r}")
+        if not api_key:
             load_dotenv()
-            self.client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
-        
-        self.market_agent = MarketLogicAgent(self.client)
-        self.financial_agent = FinancialSustainabilityAgent(self.client)
-        self.competitive_agent = CompetitiveDurabilityAgent(self.client)
-        self.synthesizer = StrategicSynthesizerAgent(self.client)
-        self.console = Console()
+            api_key = os.getenv("OPENAI_API_KEY")
+        self.api_key = api_key
+        self.max_workers = max_workers
+        self.divergence_mode = divergence_mode
+        self.synthesis_token_budget = synthesis_token_budget
+        self.similarity_threshold = similarity_threshold
+        self.node_timeout = node_timeout
+        self.synthesis_routing = synthesis_routing
+        self.deadline_seconds = deadline_seconds
+        # الممررة تحل محل الافتراضية قبل أول وصول إليها
+        if cache is not None:
+            self.cache = cache
+        if history is not None:
+            self.history = history
+    
+    # الذاكرة المؤقتة والسجل والعملاء والوكلاء ولوحة rich تُبنى عند أول استخدام:
+    # أوامر cli التي لا تستدعي النماذج لا تفتح ملفات ~/.cache ولا تستورد openai و rich
+    @cached_property
+    def cache(self):
+        return ResultCache()
+    
+    @cached_property
+    def history(self):
+        # كل نتيجة تُحفظ في السجل حتى لا يُعاد تحليل فكرة لمجرد رؤية مذكرتها
+        return AnalysisStore()
+    
+    @cached_property
+    def client(self):
+        return shared_clients(self.api_key)[0]
+    
+    @cached_property
+    def async_client(self):
+        return shared_clients(self.api_key)[1]
+    
+    @cached_property
+    def market_agent(self):
+        return MarketLogicAgent(self.client, self.async_client, self.cache)
+    
+    @cached_property
+    def financial_agent(self):
+        return FinancialSustainabilityAgent(self.client, self.async_client, self.cache)
+    
+    @cached_property
+    def competitive_agent(self):
+        return CompetitiveDurabilityAgent(self.client, self.async_client, self.cache)
+    
+    @cached_property
+    def synthesizer(self):
+        # المذكرات قليلة الخلاف تُكتب بقالب أو gpt-4o-mini بدل gpt-4o (حدود SYNTHESIS_* في البيئة)
+        return StrategicSynthesizerAgent(
+            self.client,
+            self.async_client,
+            self.cache,
+            input_token_budget=self.synthesis_token_budget,
+            router=SynthesisRouter.from_env() if self.synthesis_routing else None,
+        )
+    
+    @cached_property
+    def fused_agent(self):
+        if self.divergence_mode != "fused":
+            return None
+        return FusedDivergenceAgent(self.client, self.async_client, self.cache)
+    
+    @cached_property
+    def divergence(self):
+        return DivergenceStage(
+            self.market_agent,
+            self.financial_agent,
+            self.competitive_agent,
+            max_workers=self.max_workers,
+            fused_agent=self.fused_agent,
+        )
+    
+    @cached_property
+    def registry(self):
+        # وكلاء إضافيون يُسجلون هنا قبل أول تحليل: orchestrator.registry.register(agent)
+        return default_registry(self.divergence, self.synthesizer, timeout=self.node_timeout)
+    
+    @cached_property
+    def pipeline(self):
+        # similarity_threshold=None يعطل إعادة استخدام نتائج الأفكار شبه المطابقة
+        threshold = self.similarity_threshold
+        similar = SimilarityIndex(threshold=threshold) if threshold is not None else None
+        # deadline_seconds يقسم زمن التحليل على المراحل ويعيد مذكرة احتياطية عند تجاوزه
+        return AnalysisPipeline(
+            self.divergence,
+            self.synthesizer,
+            similar=similar,
+            registry=self.registry,
+            deadline_seconds=self.deadline_seconds,
+        )
+    
+    @cached_property
+    def console(self):
+        from rich.console import Console
+        return Console()
     
     def analyze(self, business_idea: str):
+        self._print_header(business_idea)
+        
+        similar = self.pipeline.lookup_similar(business_idea)
+        if similar is not None:
+            return self._show_similar(similar)
+        
+        with self.console.status("[bold green]جاري التحليل السوقي والمالي والتنافسي...") as status:
+            result = self.pipeline.compute(business_idea, on_complete=self._progress(status))
+        
+        self.history.add(result)
+        self._display_result(result)
+        return result.strategic_memo
+    
+    async def analyze_async(self, business_idea: str):
+        """مثل analyze لكن استدعاءات النماذج تتم عبر AsyncOpenAI.
+
+        المسار يعمل على حلقة العملية المشتركة لا على حلقة المستدعي: العميل غير
+        المتزامن المشترك مرتبط بحلقة واحدة، وكل asyncio.run ينشئ حلقة جديدة.
+        """
+        self._print_header(business_idea)
+        
+        similar = self.pipeline.lookup_similar(business_idea)
+        if similar is not None:
+            return self._show_similar(similar)
+        
+        result = await shared_event_loop().run_async(
+            self.pipeline.compute_async(business_idea, on_complete=self._progress())
+        )
+        self.history.add(result)
+        self._display_result(result)
+        return result.strategic_memo
+    
+    def _show_similar(self, result):
+        self.console.print("✓ [cyan]فكرة شبه مطابقة حُللت سابقاً: عرض نتيجتها بدون استدعاء النماذج[/cyan]")
+        self.history.add(result)
+        self._display_result(result)
+        return result.strategic_memo
+    
+    def _progress(self, status=None):
+        """on_complete للمجدول: سطر لكل عقدة تكتمل، وعنوان التوليف حين لا يبقى غيره"""
+        remaining = set(self.registry.outputs())
+        
+        def on_node_complete(name, analysis):
+            remaining.discard(name)
+            self.console.print(COMPLETED_MESSAGES.get(name, f"✓ [green]تم تحليل {name}[/green]"))
+            if remaining == {"synthesis"}:
+                self._print_synthesis_header()
+                if status is not None:
+                    status.update("[bold yellow]جاري التوليف الاستراتيجي...")
+            elif remaining and status is not None:
+                status.update(f"[bold green]بانتظار {len(remaining)} من الوكلاء...")
+        
+        return on_node_complete
+    
+    def _display_result(self, result):
+        self._display_dashboard(
+            result.business_idea,
+            result.market_analysis,
+            result.financial_analysis,
+            result.competitive_analysis,
+            result.strategic_memo
+        )
+    
+    def analyze_many(self, ideas, max_concurrency: int = 4, return_exceptions: bool = False):
+        """تحليل مجموعة أفكار بدون لوحة العرض، مع توليد النتائج بترتيب الاكتمال.
+        
+        يولّد (index, AnalysisResult) حيث index موقع الفكرة في ideas. لا يُقرأ من
+        ideas إلا ما يكفي لإبقاء max_concurrency فكرة قيد التنفيذ، واستدعاءات
+        الوكلاء لكل الأفكار الجارية تتداخل على حلقة asyncio واحدة.
+        مع return_exceptions=True يُولَّد الاستثناء مكان النتيجة بدل إيقاف الدفعة.
+        """
+        # حلقة العملية المشتركة لا حلقة خاصة: العميل غير المتزامن المشترك مرتبط بحلقة واحدة
+        loop = shared_event_loop()
+        remaining = iter(enumerate(ideas))
+        in_flight = {}
+        
+        def submit_next():
+            for index, business_idea in remaining:
+                future = loop.submit(self.pipeline.run_async(business_idea))
+                in_flight[future] = index
+                return True
+            return False
+        
+        for _ in range(max_concurrency):
+            if not submit_next():
+                break
+        
+        try:
+            while in_flight:
+                done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+                for future in done:
+                    index = in_flight.pop(future)
+                    submit_next()
+                    try:
+                        result = future.result()
+                    except Exception as e:
+                        if not return_exceptions:
+                            raise
+                        result = e
+                    yield index, result
+        finally:
+            for future in in_flight:
+                future.cancel()
+    
+    def _print_header(self, business_idea):
+        from rich.panel import Panel
+        
         self.console.print("\n[bold cyan]═══════════════════════════════════════════════════[/bold cyan]")
         self.console.print("[bold cyan]   نظام التحليل الاستراتيجي متعدد الوكلاء[/bold cyan]")
         self.console.print("[bold cyan]   AI Strategic Consultant System[/bold cyan]")
@@ -42,40 +262,10 @@ class AIConsultantOrchestrator:
         
         self.console.print("\n[bold green]● المرحلة 1: طبقة التباعد (The Divergence Layer)[/bold green]")
         self.console.print("[dim]تشغيل ثلاثة وكلاء متوازيين للتحليل...[/dim]\n")
-        
-        with self.console.status("[bold green]جاري التحليل السوقي...") as status:
-            market_analysis = self.market_agent.analyze(business_idea)
-            self.console.print("✓ [green]تم التحليل السوقي (Market Logic)[/green]")
-            
-            status.update("[bold blue]جاري التحليل المالي...")
-            financial_analysis = self.financial_agent.analyze(business_idea)
-            self.console.print("✓ [blue]تم التحليل المالي (Financial Sustainability)[/blue]")
-            
-            status.update("[bold magenta]جاري التحليل التنافسي...")
-            competitive_analysis = self.competitive_agent.analyze(business_idea)
-            self.console.print("✓ [magenta]تم التحليل التنافسي (Competitive Durability)[/magenta]")
-        
+    
+    def _print_synthesis_header(self):
         self.console.print("\n[bold yellow]● المرحلة 2: عقدة التوليف (The Synthesis Node)[/bold yellow]")
         self.console.print("[dim]جاري حل التعارضات وإنشاء المذكرة الاستراتيجية...[/dim]\n")
-        
-        with self.console.status("[bold yellow]جاري التوليف الاستراتيجي..."):
-            strategic_memo = self.synthesizer.synthesize(
-                business_idea,
-                market_analysis,
-                financial_analysis,
-                competitive_analysis
-            )
-            self.console.print("✓ [yellow]تم إنشاء المذكرة الاستراتيجية (Strategic Memo)[/yellow]")
-        
-        self._display_dashboard(
-            business_idea,
-            market_analysis,
-            financial_analysis,
-            competitive_analysis,
-            strategic_memo
-        )
-        
-        return strategic_memo
     
     def _display_dashboard(
         self,
@@ -85,6 +275,10 @@ class AIConsultantOrchestrator:
         competitive_analysis,
         strategic_memo
     ):
+        from rich.columns import Columns
+        from rich.panel import Panel
+        from rich.table import Table
+        
         self.console.print("\n\n")
         self.console.print("[bold cyan]═══════════════════════════════════════════════════[/bold cyan]")
         self.console.print("[bold cyan]           لوحة التحكم الاستراتيجية[/bold cyan]")
@@ -174,7 +368,6 @@ class AIConsultantOrchestrator:
             width=50
         )
         
-        from rich.columns import Columns
         self.console.print(Columns([risk_panel, confidence_panel]))
         
         self.console.print("\n[bold]🎯 التوصية النهائية / Final Recommendation[/bold]\n")
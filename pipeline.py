@@ -0,0 +1,423 @@
+import hashlib
+import json
+from contextlib import nullcontext
+from dataclasses import dataclass, field
+from typing import Any, Dict, Optional
+
+from agents import MarketAnalysis, FinancialAnalysis, CompetitiveAnalysis, StrategicMemo
+from agents.cache import normalize_idea
+from agents.metrics import metrics
+from agents.registry import AgentRegistry
+from agents.routing import degraded_memo
+from agents.serialization import SLOTS, dumps, merge, plain
+from scheduler import DAGScheduler, Deadline
+
+
+# طول AnalysisResult.content_hash: أول 32 حرفاً ست عشرياً من sha256
+CONTENT_HASH_LENGTH = 32
+
+
+@dataclass(**SLOTS)
+class AnalysisResult:
+    business_idea: str
+    market_analysis: MarketAnalysis
+    financial_analysis: FinancialAnalysis
+    competitive_analysis: CompetitiveAnalysis
+    strategic_memo: StrategicMemo
+    # مخرجات عقد إضافية مسجلة في AgentRegistry: {اسم المخرج: التحليل}
+    extra_analyses: Dict[str, Any] = field(default_factory=dict)
+    # to_json() مرمزة مرة واحدة: السجل والاستجابة ونتائج الأفكار شبه المطابقة تعيد استخدامها
+    _encoded: Optional[bytes] = field(default=None, init=False, repr=False, compare=False)
+    _content_hash: Optional[str] = field(default=None, init=False, repr=False, compare=False)
+
+    def to_dict(self) -> Dict[str, Any]:
+        """الأقسام الأربعة بنفس الشكل الذي تعيده /analyze، ثم قسم لكل عقدة إضافية.
+
+        قواميس سطحية: القيم المتداخلة (detailed_analysis مثلاً) هي نفسها في النتيجة، لا نسخ منها.
+        """
+        body = {
+            "market_analysis": plain(self.market_analysis),
+            "financial_analysis": plain(self.financial_analysis),
+            "competitive_analysis": plain(self.competitive_analysis),
+            "strategic_memo": plain(self.strategic_memo),
+        }
+        for name, analysis in self.extra_analyses.items():
+            body[f"{name}_analysis"] = plain(analysis)
+        return body
+
+    def to_json(self) -> bytes:
+        """to_dict() كـ JSON بترميز UTF-8، يُحسب عند أول طلب ثم يُعاد كما هو"""
+        if self._encoded is None:
+            self._encoded = dumps(self.to_dict())
+        return self._encoded
+
+    def document(self) -> bytes:
+        """الوثيقة التي تقدمها /results/<content_hash>: نص الفكرة ثم الأقسام"""
+        return merge({"business_idea": self.business_idea}, self.to_json())
+
+    @property
+    def content_hash(self) -> str:
+        """بصمة document(): نفس الفكرة بنفس الأقسام تعطي نفس العنوان دائماً"""
+        if self._content_hash is None:
+            self._content_hash = hashlib.sha256(self.document()).hexdigest()[:CONTENT_HASH_LENGTH]
+        return self._content_hash
+
+    @property
+    def url(self) -> str:
+        return f"/results/{self.content_hash}"
+
+    def for_idea(self, business_idea: str) -> "AnalysisResult":
+        """نفس الأقسام (وترميزها) تحت نص فكرة آخر"""
+        result = AnalysisResult(
+            business_idea,
+            self.market_analysis,
+            self.financial_analysis,
+            self.competitive_analysis,
+            self.strategic_memo,
+            dict(self.extra_analyses),
+        )
+        result._encoded = self._encoded
+        return result
+
+
+# مخرجات العقد التي تملك حقولاً ثابتة في AnalysisResult
+CORE_OUTPUTS = ("market", "financial", "competitive", "synthesis")
+# أنواع التحليلات الأساسية، لبناء بديل فارغ بثقة 0 لما لم يكتمل ضمن المهلة
+ANALYSIS_TYPES = {"market": MarketAnalysis, "financial": FinancialAnalysis, "competitive": CompetitiveAnalysis}
+
+
+DIVERGENCE_MODES = ("split", "fused")
+
+
+class DivergenceStage:
+    """طبقة التباعد: الوكلاء الثلاثة (أو وكيل fused واحد) التي تُسجل عقداً في المسار.
+
+    التشغيل نفسه يتولاه DAGScheduler؛ max_workers يحدد حجم منفذه.
+    مع fused_agent يعمل في وضع "fused": استدعاء واحد يعيد التحليلات الثلاثة.
+    """
+
+    def __init__(
+        self,
+        market_agent,
+        financial_agent,
+        competitive_agent,
+        max_workers: int = 3,
+        fused_agent=None,
+    ):
+        self.agents = {
+            "market": market_agent,
+            "financial": financial_agent,
+            "competitive": competitive_agent,
+        }
+        self.fused_agent = fused_agent
+        self.mode = "fused" if fused_agent is not None else "split"
+        self.max_workers = max_workers
+
+
+def divergence_registry(divergence: DivergenceStage, timeout: Optional[float] = None) -> AgentRegistry:
+    """عقد طبقة التباعد وحدها: الوكلاء الثلاثة، أو وكيل fused"""
+    registry = AgentRegistry()
+    if divergence.fused_agent is not None:
+        registry.register(divergence.fused_agent, timeout=timeout)
+    else:
+        for name, agent in divergence.agents.items():
+            registry.register(agent, name=name, timeout=timeout)
+    return registry
+
+
+def default_registry(divergence: DivergenceStage, synthesizer, timeout: Optional[float] = None) -> AgentRegistry:
+    """العقد الافتراضية: الوكلاء الثلاثة (أو وكيل fused) ثم التوليف"""
+    registry = divergence_registry(divergence, timeout)
+    registry.register(synthesizer, timeout=timeout)
+    return registry
+
+
+class AnalysisPipeline:
+    """المسار الكامل لفكرة واحدة: عقد AgentRegistry عبر DAGScheduler، بدون أي عرض.
+
+    بدون registry تُبنى العقد الافتراضية من divergence و synthesizer. مع similar
+    (SimilarityIndex) تُعاد نتيجة فكرة سابقة شبه مطابقة بدل استدعاء النماذج،
+    وتُزرع في الذاكرة المؤقتة تحت النص الجديد.
+
+    مع deadline_seconds يُقسم زمن التحليل على المراحل (scheduler.Deadline)، وما
+    لم يكتمل ضمنها يُستبدل بمذكرة احتياطية من التحليلات المكتملة (synthesis_route
+    "degraded") بدل انتظار ذيل زمن النماذج.
+
+    مع checkpoints (CheckpointStore) وطلب له request_id يُحفظ كل مخرج فور اكتماله،
+    وإعادة المحاولة بنفس المعرف تشغل العقد التي لم تكتمل فقط. نقاط طلب اكتملت
+    كل مخرجاته تُمحى فوراً.
+
+    مع single_flight (singleflight.SingleFlight) تنتظر الطلبات المتطابقة المتزامنة
+    تشغيلاً واحداً للفكرة وتأخذ كلها نتيجته.
+    """
+
+    def __init__(
+        self,
+        divergence: DivergenceStage,
+        synthesizer,
+        similar=None,
+        registry: Optional[AgentRegistry] = None,
+        node_timeout: Optional[float] = None,
+        deadline_seconds: Optional[float] = None,
+        checkpoints=None,
+        single_flight=None,
+    ):
+        self.divergence = divergence
+        self.synthesizer = synthesizer
+        self.similar = similar
+        self.registry = registry if registry is not None else default_registry(divergence, synthesizer)
+        self.scheduler = DAGScheduler(
+            self.registry, max_workers=max(divergence.max_workers, len(self.registry)), default_timeout=node_timeout
+        )
+        self.deadline = Deadline(deadline_seconds) if deadline_seconds else None
+        self.checkpoints = checkpoints
+        self.single_flight = single_flight
+
+    def lookup_similar(self, business_idea: str) -> Optional[AnalysisResult]:
+        if self.similar is None:
+            return None
+        with metrics.phase("similar_lookup"):
+            match = self.similar.query(business_idea)
+        if match is None:
+            return None
+
+        _, stored = match
+        result = stored.for_idea(business_idea)
+        self._seed_cache(result)
+        return result
+
+    def join_flight(self, business_idea: str):
+        """singleflight.Flight للفكرة، أو None بلا single_flight"""
+        if self.single_flight is None:
+            return None
+        return self.single_flight.join(normalize_idea(business_idea), runs=len(self.registry))
+
+    def coalesced(self, business_idea: str, result: AnalysisResult) -> AnalysisResult:
+        """نتيجة القائد تحت نص فكرة التابع، إن اختلف عنه بالمسافات وحدها"""
+        return result if result.business_idea == business_idea else result.for_idea(business_idea)
+
+    def remember_similar(self, result: AnalysisResult) -> None:
+        if self.similar is not None:
+            self.similar.add(result.business_idea, result)
+
+    def _seed_cache(self, result: AnalysisResult) -> None:
+        """حفظ النتيجة تحت مفاتيح النص الجديد حتى تصيبه الذاكرة المؤقتة العادية لاحقاً"""
+        values = self._values(result)
+        for node in self.registry:
+            if all(name in values for name in node.inputs + node.outputs):
+                node.remember(result.business_idea, values)
+
+    def _report_all(self, result: AnalysisResult, on_complete) -> AnalysisResult:
+        if on_complete:
+            for name, value in self._values(result).items():
+                on_complete(name, value)
+        return result
+
+    @staticmethod
+    def _values(result: AnalysisResult) -> Dict[str, Any]:
+        return {
+            "market": result.market_analysis,
+            "financial": result.financial_analysis,
+            "competitive": result.competitive_analysis,
+            **result.extra_analyses,
+            "synthesis": result.strategic_memo,
+        }
+
+    def encode_shared(self, result: AnalysisResult) -> bytes:
+        """النتيجة لعمليات أخرى تنتظر نفس الفكرة: كل مخرج مع اسم نوعه كما في نقاط الحفظ"""
+        return dumps({
+            "business_idea": result.business_idea,
+            "values": {name: [type(value).__name__, value] for name, value in self._values(result).items()},
+        })
+
+    def decode_shared(self, data: bytes) -> Optional[AnalysisResult]:
+        """عكس encode_shared؛ None إن كان نوع مخرج غير معروف هنا فيُشغل المسار"""
+        document = json.loads(data)
+        types = self._result_types()
+        values = {}
+        for name, (type_name, payload) in document["values"].items():
+            if type_name not in types:
+                return None
+            values[name] = types[type_name](**payload)
+        memo = values.pop("synthesis")
+        return AnalysisResult(
+            document["business_idea"],
+            values.pop("market"),
+            values.pop("financial"),
+            values.pop("competitive"),
+            memo,
+            values,
+        )
+
+    def result_from(self, business_idea: str, values: Dict[str, Any]) -> AnalysisResult:
+        """AnalysisResult من مخرجات المجدول، مع حفظها في فهرس الأفكار شبه المطابقة.
+
+        مخرجات ناقصة (تجاوزت المهلة) تعطي نتيجة احتياطية لا تُحفظ في الفهرس.
+        """
+        missing = tuple(name for name in CORE_OUTPUTS if name not in values)
+        analyses = {
+            name: values[name] if name in values else cls.from_dict({"confidence_score": 0.0})
+            for name, cls in ANALYSIS_TYPES.items()
+        }
+        memo = values["synthesis"] if not missing else degraded_memo(business_idea, analyses, missing)
+        result = AnalysisResult(
+            business_idea,
+            analyses["market"],
+            analyses["financial"],
+            analyses["competitive"],
+            memo,
+            {name: value for name, value in values.items() if name not in CORE_OUTPUTS},
+        )
+        if not missing:
+            self.remember_similar(result)
+        return result
+
+    def resume(self, business_idea: str, request_id: Optional[str]) -> Dict[str, Any]:
+        """بدء محاولة للطلب: المخرجات المحفوظة من محاولاته السابقة، مع عدّ ما يُستعاد وما يُعاد"""
+        if self.checkpoints is None or request_id is None:
+            return {}
+        attempt = self.checkpoints.begin(request_id, business_idea)
+        if attempt == 1:
+            return {}
+        initial = self.checkpoints.load(request_id, self._result_types())
+        for node in self.registry:
+            if all(name in initial for name in node.outputs):
+                metrics.stage_restored(node.name)
+            else:
+                metrics.stage_reexecuted(node.name)
+        return initial
+
+    def checkpoint(self, request_id: Optional[str], name: str, value) -> None:
+        if self.checkpoints is not None and request_id is not None:
+            self.checkpoints.save(request_id, name, value)
+
+    def completed_stages(self, request_id: Optional[str]):
+        """أسماء المخرجات المحفوظة للطلب، لإبلاغ العميل بما لن يُعاد عند إعادة المحاولة"""
+        if self.checkpoints is None or request_id is None:
+            return []
+        return sorted(self.checkpoints.load(request_id, self._result_types()))
+
+    def _finish(self, request_id: Optional[str], values: Dict[str, Any]) -> None:
+        """الطلب اكتمل بكل مخرجاته: لا إعادة محاولة تحتاج نقاطه. النتيجة الاحتياطية تبقيها"""
+        if self.checkpoints is None or request_id is None:
+            return
+        if all(name in values for name in self.registry.outputs()):
+            self.checkpoints.discard(request_id)
+
+    def _result_types(self) -> Dict[str, type]:
+        types = {cls.__name__: cls for cls in (*ANALYSIS_TYPES.values(), StrategicMemo)}
+        for node in self.registry:
+            result_type = getattr(node.agent, "result_type", None)
+            if result_type is not None:
+                types.setdefault(result_type.__name__, result_type)
+        return types
+
+    def _checkpointed(self, request_id: Optional[str], initial: Dict[str, Any], on_complete):
+        """on_complete يحفظ كل مخرج جديد قبل إبلاغ المستدعي"""
+        if self.checkpoints is None or request_id is None:
+            return on_complete
+
+        def save(name, value):
+            if name not in initial:
+                self.checkpoints.save(request_id, name, value)
+            if on_complete:
+                on_complete(name, value)
+
+        return save
+
+    def iter_events(self, business_idea: str, request_id: Optional[str] = None, **kwargs):
+        """scheduler.iter_events مع استعادة نقاط حفظ الطلب وحفظ كل مخرج جديد"""
+        initial = self.resume(business_idea, request_id)
+        produced = set()
+        for kind, name, value in self.scheduler.iter_events(
+            business_idea, deadline=self.deadline, initial=initial, **kwargs
+        ):
+            if kind == "result":
+                produced.add(name)
+                if name not in initial:
+                    self.checkpoint(request_id, name, value)
+            yield kind, name, value
+        self._finish(request_id, produced)
+
+    def compute(self, business_idea: str, on_complete=None, request_id: Optional[str] = None) -> AnalysisResult:
+        """تشغيل كل العقد بلا فحص الأفكار شبه المطابقة. on_complete(name, value) لكل مخرج"""
+        initial = self.resume(business_idea, request_id)
+        values = self.scheduler.run(
+            business_idea,
+            on_complete=self._checkpointed(request_id, initial, on_complete),
+            deadline=self.deadline,
+            initial=initial,
+        )
+        self._finish(request_id, values)
+        return self.result_from(business_idea, values)
+
+    async def compute_async(
+        self, business_idea: str, on_complete=None, request_id: Optional[str] = None
+    ) -> AnalysisResult:
+        initial = self.resume(business_idea, request_id)
+        values = await self.scheduler.run_async(
+            business_idea,
+            on_complete=self._checkpointed(request_id, initial, on_complete),
+            deadline=self.deadline,
+            initial=initial,
+        )
+        self._finish(request_id, values)
+        return self.result_from(business_idea, values)
+
+    async def _admitted(self, admit, business_idea: str, on_complete, request_id: Optional[str]) -> AnalysisResult:
+        if admit is None:
+            return await self.compute_async(business_idea, on_complete=on_complete, request_id=request_id)
+        async with admit():
+            return await self.compute_async(business_idea, on_complete=on_complete, request_id=request_id)
+
+    def run(
+        self, business_idea: str, on_complete=None, request_id: Optional[str] = None, admit=None
+    ) -> AnalysisResult:
+        """admit: دالة تعيد context manager يدخله من يشغل المسار فعلاً قبل استدعاء
+        النماذج (حجز مكان القبول مثلاً)؛ الفكرة شبه المطابقة والتابع لا يدخلانه.
+        """
+        similar = self.lookup_similar(business_idea)
+        if similar is not None:
+            return self._report_all(similar, on_complete)
+        # القائد يُبلغ on_complete بكل عقدة فور اكتمالها؛ التابع لا يرى تلك الأحداث،
+        # فيُبلغ بها كلها عند وصول النتيجة
+        led = []
+
+        def compute():
+            led.append(True)
+            with admit() if admit is not None else nullcontext():
+                return self.compute(business_idea, on_complete=on_complete, request_id=request_id)
+
+        if self.single_flight is None:
+            return compute()
+
+        result = self.single_flight.do(
+            normalize_idea(business_idea), compute, runs=len(self.registry),
+            encode=self.encode_shared, decode=self.decode_shared,
+        )
+        if led:
+            return result
+        return self._report_all(self.coalesced(business_idea, result), on_complete)
+
+    async def run_async(
+        self, business_idea: str, on_complete=None, request_id: Optional[str] = None, admit=None
+    ) -> AnalysisResult:
+        """مثل run لكن admit تعيد async context manager"""
+        similar = self.lookup_similar(business_idea)
+        if similar is not None:
+            return self._report_all(similar, on_complete)
+        if self.single_flight is None:
+            return await self._admitted(admit, business_idea, on_complete, request_id)
+        led = []
+
+        def compute():
+            led.append(True)
+            return self._admitted(admit, business_idea, on_complete, request_id)
+
+        result = await self.single_flight.do_async(
+            normalize_idea(business_idea), compute, runs=len(self.registry),
+            encode=self.encode_shared, decode=self.decode_shared,
+        )
+        if led:
+            return result
+        return self._report_all(self.coalesced(business_idea, result), on_complete)
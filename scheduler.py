@@ -0,0 +1,363 @@
+"""مجدول رسم الاعتماديات: كل عقدة تبدأ فور اكتمال العقد التي تنتج مدخلاتها.
+
+لا مراحل ثابتة: وكيل يحتاج تحليل السوق وحده يبدأ عند اكتماله دون انتظار
+التحليلين الآخرين. كل تشغيل يُنتج ScheduleReport بتوقيت كل عقدة والمسار
+الحرج (سلسلة العقد التي حددت الزمن الكلي)، ويُسجل في قياسات الطلب الحالي.
+
+مع Deadline تُقسم مهلة التشغيل الكلية على المراحل: عقدة لم تنته قبل نهاية حصة
+مرحلتها تُترك (وتُترك معها العقد المعتمدة عليها) ويعيد التشغيل ما اكتمل فقط.
+
+initial يحمل مخرجات معروفة مسبقاً (نقاط حفظ محاولة سابقة، checkpoints.py): العقدة
+التي كل مخرجاتها فيه لا تُشغل، وتُعاد قيمها كأنها اكتملت للتو.
+"""
+import asyncio
+import contextvars
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional, Set, Tuple
+
+from agents.metrics import metrics
+from agents.registry import AgentRegistry
+
+
+class NodeTimeout(TimeoutError):
+    """عقدة تجاوزت مهلتها؛ العقد المعتمدة عليها لا تُشغل"""
+
+    def __init__(self, node: str, timeout: float):
+        super().__init__(f"agent node {node!r} exceeded its {timeout:g}s timeout")
+        self.node = node
+        self.timeout = timeout
+
+
+@dataclass(frozen=True)
+class Deadline:
+    """مهلة تشغيل كلية بالثواني، مقسمة على المراحل بالترتيب حسب shares.
+
+    حصص تراكمية: مع 10 ثوانٍ والحصص الافتراضية تنتهي مرحلة التباعد عند 6 ثوانٍ
+    والتوليف عند 10، فتوفير التباعد يذهب إلى التوليف. مرحلة غير مذكورة تأخذ
+    المهلة كلها.
+    """
+    seconds: float
+    shares: Tuple[Tuple[str, float], ...] = (("divergence", 0.6), ("synthesis", 0.4))
+
+    def phase_ends(self) -> Dict[str, float]:
+        """{المرحلة: ثوانٍ منذ بداية التشغيل يجب أن تنتهي قبلها}"""
+        ends, elapsed = {}, 0.0
+        for phase, share in self.shares:
+            elapsed += share
+            ends[phase] = self.seconds * min(1.0, elapsed)
+        return ends
+
+    def end(self, phase: str) -> float:
+        return self.phase_ends().get(phase, self.seconds)
+
+
+@dataclass
+class ScheduleReport:
+    # ثوانٍ منذ بداية التشغيل
+    started: Dict[str, float]
+    finished: Dict[str, float]
+    dependencies: Dict[str, Set[str]]
+    wall_seconds: float
+    # عقد تُركت لتجاوز حصة مرحلتها من Deadline، أو لاعتمادها على عقدة تُركت
+    dropped: Set[str] = field(default_factory=set)
+    # عقد أُخذت مخرجاتها من initial بدل تشغيلها
+    restored: Set[str] = field(default_factory=set)
+
+    def critical_path(self) -> List[str]:
+        """من آخر عقدة انتهت رجوعاً عبر أبطأ اعتمادية في كل خطوة"""
+        if not self.finished:
+            return []
+        path = [max(self.finished, key=self.finished.get)]
+        while True:
+            deps = [name for name in self.dependencies.get(path[-1], ()) if name in self.finished]
+            if not deps:
+                return path[::-1]
+            path.append(max(deps, key=self.finished.get))
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "wall_seconds": round(self.wall_seconds, 4),
+            "nodes": {
+                name: {
+                    "start": round(start, 4),
+                    "end": round(self.finished[name], 4),
+                    "seconds": round(self.finished[name] - start, 4),
+                }
+                for name, start in self.started.items()
+                if name in self.finished
+            },
+            "critical_path": self.critical_path(),
+            "dropped": sorted(self.dropped),
+            "restored": sorted(self.restored),
+        }
+
+
+class DAGScheduler:
+    """تشغيل عقد AgentRegistry بأقصى توازٍ تسمح به الاعتماديات.
+
+    default_timeout يُطبق على العقد المسجلة بلا مهلة خاصة، وتجاوزه يرفع
+    NodeTimeout. تجاوز حصة Deadline لا يرفع شيئاً: تُترك العقدة وتعيد التشغيلة
+    المخرجات المكتملة. في المسار المتزامن لا يمكن إيقاف خيط عالق، فتُترك العقدة
+    تكمل في الخلفية وتُهمل نتيجتها.
+    """
+
+    def __init__(self, registry: AgentRegistry, max_workers: int = 8, default_timeout: Optional[float] = None):
+        self.registry = registry
+        self.default_timeout = default_timeout
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="agent-node")
+
+    def _timeout(self, node) -> Optional[float]:
+        return node.timeout if node.timeout is not None else self.default_timeout
+
+    def run(
+        self,
+        business_idea: str,
+        on_complete=None,
+        deadline: Optional[Deadline] = None,
+        initial: Optional[Dict[str, Any]] = None,
+    ) -> Dict[str, Any]:
+        """{اسم المخرج: القيمة} لكل العقد. on_complete(name, value) لكل مخرج بترتيب الاكتمال"""
+        values = {}
+        for kind, name, value in self.iter_events(business_idea, deadline=deadline, initial=initial):
+            if kind == "result":
+                values[name] = value
+                if on_complete:
+                    on_complete(name, value)
+        return values
+
+    def iter_events(
+        self,
+        business_idea: str,
+        heartbeat: Optional[float] = None,
+        stream: bool = False,
+        deadline: Optional[Deadline] = None,
+        initial: Optional[Dict[str, Any]] = None,
+    ):
+        """توليد (kind, name, value) أثناء التشغيل:
+
+        - ("result", اسم المخرج, القيمة) فور اكتمال كل عقدة
+        - ("token", اسم العقدة, نص) مع stream=True لعقد النهاية التي تدعم البث،
+          وتُشغل في خيط المستدعي حتى تصل أجزاؤها بلا وسيط
+        - ("heartbeat", None, None) كلما مرت heartbeat ثانية بلا حدث
+        """
+        order = self.registry.order()
+        nodes = {node.name: node for node in order}
+        dependencies = self.registry.dependencies()
+        waiting = {name: set(deps) for name, deps in dependencies.items()}
+        dependents = {name: [other for other, deps in dependencies.items() if name in deps] for name in nodes}
+        values, started, finished, dropped = {}, {}, {}, set()
+        running, inline = {}, deque()
+        clock = time.perf_counter()
+        last_event = clock
+        ends = deadline.phase_ends() if deadline is not None else {}
+        restored = _restored(order, initial)
+
+        def budget_end(name):
+            if deadline is None:
+                return None
+            return clock + ends.get(nodes[name].phase, deadline.seconds)
+
+        def launch(name):
+            node = nodes[name]
+            if deadline is not None and time.perf_counter() >= budget_end(name):
+                drop(name)
+                return
+            started[name] = time.perf_counter() - clock
+            inputs = {key: values[key] for key in node.inputs}
+            if stream and node.streams and not dependents[name]:
+                inline.append((node, inputs))
+                return
+            # نسخ السياق حتى تصل قياسات الطلب الحالي إلى خيوط المنفذ
+            future = self._executor.submit(contextvars.copy_context().run, node.run, business_idea, inputs)
+            timeout = self._timeout(node)
+            running[future] = (name, None if timeout is None else time.perf_counter() + timeout, budget_end(name))
+
+        def drop(name):
+            if nodes[name].phase not in {nodes[other].phase for other in dropped}:
+                metrics.deadline_exceeded(nodes[name].phase)
+            pending = [name]
+            while pending:
+                current = pending.pop()
+                if current not in dropped:
+                    dropped.add(current)
+                    pending.extend(dependents[current])
+
+        def complete(name, outputs):
+            finished[name] = time.perf_counter() - clock
+            values.update(outputs)
+            for dependent in dependents[name]:
+                waiting[dependent].discard(name)
+                if not waiting[dependent] and dependent not in restored:
+                    launch(dependent)
+
+        for name in restored:
+            for output in nodes[name].outputs:
+                values[output] = initial[output]
+            for dependent in dependents[name]:
+                waiting[dependent].discard(name)
+        for node in order:
+            if not waiting[node.name] and node.name not in restored:
+                launch(node.name)
+        try:
+            for name in restored:
+                for output in nodes[name].outputs:
+                    yield "result", output, initial[output]
+            while running or inline:
+                if inline:
+                    node, inputs = inline.popleft()
+                    outputs = None
+                    end = budget_end(node.name)
+                    events = node.stream(business_idea, inputs)
+                    try:
+                        for kind, value in events:
+                            if kind == "token":
+                                yield "token", node.name, value
+                            else:
+                                outputs = value
+                            if end is not None and outputs is None and time.perf_counter() >= end:
+                                break
+                    finally:
+                        # إغلاق المولد يغلق اتصال البث عند قطعه قبل نهايته
+                        events.close()
+                    if outputs is None:
+                        drop(node.name)
+                        continue
+                    complete(node.name, outputs)
+                    for name, value in outputs.items():
+                        yield "result", name, value
+                    last_event = time.perf_counter()
+                    continue
+
+                now = time.perf_counter()
+                waits = [
+                    max(0.0, end - now)
+                    for _, node_end, phase_end in running.values()
+                    for end in (node_end, phase_end)
+                    if end is not None
+                ]
+                if heartbeat is not None:
+                    waits.append(max(0.0, last_event + heartbeat - now))
+                done, _ = wait(running, timeout=min(waits) if waits else None, return_when=FIRST_COMPLETED)
+                if not done:
+                    now = time.perf_counter()
+                    for future, (name, node_end, phase_end) in list(running.items()):
+                        if node_end is not None and now >= node_end:
+                            raise NodeTimeout(name, self._timeout(nodes[name]))
+                        if phase_end is not None and now >= phase_end:
+                            del running[future]
+                            future.cancel()
+                            drop(name)
+                    if heartbeat is not None and now - last_event >= heartbeat:
+                        last_event = now
+                        yield "heartbeat", None, None
+                    continue
+                for future in done:
+                    name = running.pop(future)[0]
+                    outputs = future.result()
+                    complete(name, outputs)
+                    for output, value in outputs.items():
+                        yield "result", output, value
+                last_event = time.perf_counter()
+        finally:
+            for future in running:
+                future.cancel()
+            report = ScheduleReport(
+                started, finished, dependencies, time.perf_counter() - clock, dropped, set(restored)
+            )
+            self._record(report, nodes)
+
+    async def run_async(
+        self,
+        business_idea: str,
+        on_complete=None,
+        deadline: Optional[Deadline] = None,
+        initial: Optional[Dict[str, Any]] = None,
+    ) -> Dict[str, Any]:
+        """مثل run لكن كل عقدة مهمة asyncio على الحلقة الحالية، والعقدة المتروكة تُلغى"""
+        order = self.registry.order()
+        nodes = {node.name: node for node in order}
+        dependencies = self.registry.dependencies()
+        values, started, finished, tasks, dropped = {}, {}, {}, {}, set()
+        clock = time.perf_counter()
+        restored = _restored(order, initial)
+
+        def drop(node):
+            if node.phase not in {nodes[other].phase for other in dropped}:
+                metrics.deadline_exceeded(node.phase)
+            dropped.add(node.name)
+
+        async def run_node(node):
+            if node.name in restored:
+                outputs = {name: initial[name] for name in node.outputs}
+                values.update(outputs)
+                if on_complete:
+                    for name, value in outputs.items():
+                        on_complete(name, value)
+                return
+            if dependencies[node.name]:
+                await asyncio.gather(*(tasks[name] for name in dependencies[node.name]))
+                if dropped & dependencies[node.name]:
+                    dropped.add(node.name)
+                    return
+            timeout = self._timeout(node)
+            remaining = None
+            if deadline is not None:
+                remaining = deadline.end(node.phase) - (time.perf_counter() - clock)
+                if remaining <= 0:
+                    drop(node)
+                    return
+            started[node.name] = time.perf_counter() - clock
+            inputs = {key: values[key] for key in node.inputs}
+            limits = [limit for limit in (timeout, remaining) if limit is not None]
+            limit = min(limits) if limits else None
+            try:
+                outputs = await asyncio.wait_for(node.run_async(business_idea, inputs), limit)
+            except asyncio.TimeoutError:
+                if timeout is not None and timeout <= limit:
+                    raise NodeTimeout(node.name, timeout) from None
+                drop(node)
+                return
+            finished[node.name] = time.perf_counter() - clock
+            values.update(outputs)
+            if on_complete:
+                for name, value in outputs.items():
+                    on_complete(name, value)
+
+        # الترتيب الطوبولوجي يضمن وجود مهام الاعتماديات قبل المهام التي تنتظرها
+        for node in order:
+            tasks[node.name] = asyncio.ensure_future(run_node(node))
+        try:
+            await asyncio.gather(*tasks.values())
+        except BaseException:
+            for task in tasks.values():
+                task.cancel()
+            raise
+        finally:
+            report = ScheduleReport(
+                started, finished, dependencies, time.perf_counter() - clock, dropped, set(restored)
+            )
+            self._record(report, nodes)
+        return values
+
+    def _record(self, report: ScheduleReport, nodes) -> None:
+        """زمن كل مرحلة (من أول عقدة بدأت فيها حتى آخر عقدة انتهت) وتقرير الطلب الحالي"""
+        phases = {}
+        for name, end in report.finished.items():
+            start, stop = phases.get(nodes[name].phase, (report.started[name], end))
+            phases[nodes[name].phase] = (min(start, report.started[name]), max(stop, end))
+        for phase, (start, stop) in phases.items():
+            metrics.observe_phase(phase, stop - start)
+        metrics.schedule(report.to_dict())
+
+    def shutdown(self, wait: bool = True):
+        self._executor.shutdown(wait=wait)
+
+
+def _restored(order, initial: Optional[Dict[str, Any]]) -> List[str]:
+    """أسماء العقد (بالترتيب الطوبولوجي) التي كل مخرجاتها موجودة في initial"""
+    if not initial:
+        return []
+    return [node.name for node in order if all(output in initial for output in node.outputs)]
@@ -0,0 +1,233 @@
+"""دمج التحليلات المتطابقة الجارية في وقت واحد (single-flight).
+
+رابط مشارك أو نقرة مزدوجة ترسل نفس الفكرة عدة مرات خلال ثوانٍ. أول طلب لكل
+فكرة (بعد normalize_idea) يصبح القائد ويشغل المسار، وكل طلب مطابق يصل أثناء
+تشغيله ينتظر نتيجته نفسها بلا أي استدعاء للنماذج.
+
+بين العمليات على نفس الجهاز (عدة عمال gunicorn) يحجز القائد قفل ملف لكل فكرة
+(fcntl.flock)، ويكتب نتيجته المرمزة بجانب القفل (<digest>.result) قبل تحريره.
+عملية وجدت القفل محجوزاً تنتظر تحرره ثم تقرأ تلك النتيجة بدل تشغيل المسار،
+وتُحسب استدعاءاتها الموفرة في agent_runs_saved. إن لم تُنشر نتيجة (قائد فشل
+أو لم يمرر encode) تشغل المسار، ولا يوفر عليها الاستدعاءات حينها إلا الذاكرة
+المؤقتة للنتائج على القرص (RESULT_CACHE_PATH). ملفات الأقفال لا تُحذف: حذفها
+أثناء انتظار عملية أخرى عليها يكسر الاستبعاد المتبادل.
+"""
+import asyncio
+import hashlib
+import os
+import threading
+import time
+from concurrent.futures import Future
+from typing import Any, Callable, Dict, Optional
+
+try:
+    import fcntl
+except ImportError:  # غير متاح على Windows: الدمج يبقى داخل العملية وحدها
+    fcntl = None
+
+
+DEFAULT_LOCK_DIR = os.path.join(os.path.expanduser("~"), ".cache", "ai_consultant", "inflight")
+# فترة فحص قفل عملية أخرى أثناء انتظاره
+POLL_SECONDS = 0.05
+
+
+class Flight:
+    """تشغيل واحد لمفتاح: القائد يكمله بـ finish، والتابعون ينتظرون future"""
+
+    def __init__(self, owner: "SingleFlight", key: str, leader: bool, future: Future, runs: int = 0):
+        self.owner = owner
+        self.key = key
+        self.leader = leader
+        self.future = future
+        self.runs = runs
+        self._lock_file = None
+        # وقت بدء انتظار عملية أخرى: نتيجتها المنشورة بعده هي نتيجة ذلك التشغيل
+        self._waited_since = None
+
+    def _path(self, suffix: str) -> str:
+        digest = hashlib.sha256(self.key.encode("utf-8")).hexdigest()[:32]
+        return os.path.join(self.owner.lock_dir, f"{digest}.{suffix}")
+
+    def acquire_process_lock(self, timeout: Optional[float] = None) -> bool:
+        """حجز قفل الملف للقائد؛ False إن بقيت عملية أخرى تحجزه حتى انتهاء timeout.
+
+        انتظار عملية أخرى يُحسب في remote_waits، وبعد انتهاء المهلة يعمل القائد
+        بلا القفل بدل أن يعلق خلف عملية بطيئة.
+        """
+        if self._lock_file is not None or self.owner.lock_dir is None:
+            return True
+        lock_file = open(self._path("lock"), "a+b")
+        if _try_lock(lock_file):
+            self._lock_file = lock_file
+            return True
+
+        self.owner._count("remote_waits")
+        self._waited_since = time.time()
+        give_up = None if timeout is None else time.monotonic() + timeout
+        while give_up is None or time.monotonic() < give_up:
+            time.sleep(POLL_SECONDS)
+            if _try_lock(lock_file):
+                self._lock_file = lock_file
+                return True
+        lock_file.close()
+        return False
+
+    def reuse(self, decode: Callable[[bytes], Any]) -> Any:
+        """نتيجة عملية أخرى انتظرها هذا القائد، كما نشرتها قبل تحرير القفل، وإلا None.
+
+        decode يعيد None لنتيجة لا يمكن استخدامها هنا. النتيجة المستخدمة توفر كل
+        استدعاءات الوكلاء وتُحسب في remote_results.
+        """
+        if self._lock_file is None or self._waited_since is None:
+            return None
+        try:
+            with open(self._path("result"), "rb") as f:
+                if os.fstat(f.fileno()).st_mtime < self._waited_since:
+                    return None  # من تشغيل أقدم من الذي انتظرناه
+                data = f.read()
+        except FileNotFoundError:
+            return None
+        result = decode(data)
+        if result is not None:
+            self.owner._count("remote_results")
+            self.owner._count("agent_runs_saved", self.runs)
+        return result
+
+    def finish(
+        self, result: Any = None, error: Optional[BaseException] = None, published: Optional[bytes] = None
+    ) -> None:
+        """إبلاغ التابعين بالنتيجة أو الخطأ، وتحرير المفتاح وقفل الملف.
+
+        published: النتيجة مرمزة لعمليات تنتظر القفل، تُكتب قبل تحريره.
+        """
+        with self.owner._lock:
+            if self.owner._flights.get(self.key) is self.future:
+                del self.owner._flights[self.key]
+        if self._lock_file is not None:
+            if published is not None and error is None:
+                path = self._path("result")
+                with open(f"{path}.{os.getpid()}", "wb") as f:
+                    f.write(published)
+                os.replace(f"{path}.{os.getpid()}", path)
+            fcntl.flock(self._lock_file, fcntl.LOCK_UN)
+            self._lock_file.close()
+            self._lock_file = None
+        if not self.future.done():
+            if error is not None:
+                self.future.set_exception(error)
+            else:
+                self.future.set_result(result)
+
+
+class SingleFlight:
+    """تشغيلات جارية مفهرسة بالمفتاح. lock_dir=None يقصر الدمج على العملية الحالية.
+
+    process_wait_seconds حد انتظار قفل عملية أخرى، ثم يعمل القائد بدونه.
+    """
+
+    def __init__(self, lock_dir: Optional[str] = DEFAULT_LOCK_DIR, process_wait_seconds: float = 120.0):
+        if fcntl is None:
+            lock_dir = None
+        if lock_dir:
+            os.makedirs(lock_dir, exist_ok=True)
+        self.lock_dir = lock_dir or None
+        self.process_wait_seconds = process_wait_seconds
+        self._lock = threading.Lock()
+        self._flights: Dict[str, Future] = {}
+        self._counters = {
+            "leaders": 0, "followers": 0, "remote_waits": 0, "remote_results": 0, "agent_runs_saved": 0,
+        }
+
+    def join(self, key: str, runs: int = 0) -> Flight:
+        """الانضمام إلى تشغيل المفتاح الجاري، أو بدء تشغيل جديد (flight.leader).
+
+        runs: استدعاءات الوكلاء التي يوفرها كل تابع، لعداد agent_runs_saved.
+        """
+        with self._lock:
+            future = self._flights.get(key)
+            if future is not None:
+                self._counters["followers"] += 1
+                self._counters["agent_runs_saved"] += runs
+                return Flight(self, key, False, future, runs)
+            future = self._flights[key] = Future()
+            self._counters["leaders"] += 1
+        return Flight(self, key, True, future, runs)
+
+    def do(
+        self,
+        key: str,
+        fn: Callable[[], Any],
+        runs: int = 0,
+        encode: Optional[Callable[[Any], bytes]] = None,
+        decode: Optional[Callable[[bytes], Any]] = None,
+    ) -> Any:
+        """fn() مرة واحدة لكل المستدعين المتزامنين بنفس المفتاح.
+
+        encode/decode يتبادلان النتيجة مع العمليات الأخرى؛ decode يعيد None
+        لنتيجة منشورة لا يمكن استخدامها فتُشغل fn.
+        """
+        flight = self.join(key, runs)
+        if not flight.leader:
+            return flight.future.result()
+        try:
+            flight.acquire_process_lock(self.process_wait_seconds)
+            result = flight.reuse(decode) if decode is not None else None
+            if result is not None:
+                flight.finish(result)
+                return result
+            result = fn()
+        except BaseException as e:
+            flight.finish(error=e)
+            raise
+        flight.finish(result, published=encode(result) if encode is not None else None)
+        return result
+
+    async def do_async(
+        self,
+        key: str,
+        fn: Callable[[], Any],
+        runs: int = 0,
+        encode: Optional[Callable[[Any], bytes]] = None,
+        decode: Optional[Callable[[bytes], Any]] = None,
+    ) -> Any:
+        """مثل do لكن fn تعيد coroutine، والانتظار لا يحجز الحلقة"""
+        flight = self.join(key, runs)
+        if not flight.leader:
+            return await asyncio.wrap_future(flight.future)
+        try:
+            await asyncio.to_thread(flight.acquire_process_lock, self.process_wait_seconds)
+            result = flight.reuse(decode) if decode is not None else None
+            if result is not None:
+                flight.finish(result)
+                return result
+            result = await fn()
+        except BaseException as e:
+            flight.finish(error=e)
+            raise
+        flight.finish(result, published=encode(result) if encode is not None else None)
+        return result
+
+    def _count(self, name: str, value: int = 1) -> None:
+        with self._lock:
+            self._counters[name] += value
+
+    def counts(self) -> Dict[str, int]:
+        with self._lock:
+            return dict(self._counters)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            stats = dict(self._counters)
+            stats["in_flight"] = len(self._flights)
+        requests = stats["leaders"] + stats["followers"]
+        stats["coalesced_ratio"] = stats["followers"] / requests if requests else 0.0
+        stats["cross_process"] = self.lock_dir is not None
+        return stats
+
+
+def _try_lock(lock_file) -> bool:
+    try:
+        fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except BlockingIOError:
+        return False
+    return True
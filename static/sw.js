@@ -5,6 +5,11 @@ const urlsToCache = [
   '/manifest.json'
 ];
 
+// Finished analyses at /results/<content-hash> never change, so they are served
+// cache-first. The cache keeps the MAX_RESULTS most recently used ones.
+const RESULTS_CACHE = 'ai-strat-results-v1';
+const MAX_RESULTS = 50;
+
 self.addEventListener('install', event => {
   event.waitUntil(
     caches.open(CACHE_NAME)
@@ -12,9 +17,39 @@ self.addEventListener('install', event => {
   );
 });
 
+async function trimResults(cache) {
+  // cache.keys() lists entries in insertion order: the oldest use comes first
+  const keys = await cache.keys();
+  for (let i = 0; i < keys.length - MAX_RESULTS; i++) {
+    await cache.delete(keys[i]);
+  }
+}
+
+async function cachedResult(request) {
+  const cache = await caches.open(RESULTS_CACHE);
+  const hit = await cache.match(request);
+  if (hit) {
+    // Re-insert to mark it as most recently used
+    await cache.delete(request);
+    await cache.put(request, hit.clone());
+    return hit;
+  }
+  const response = await fetch(request);
+  if (response.ok) {
+    await cache.put(request, response.clone());
+    await trimResults(cache);
+  }
+  return response;
+}
+
 self.addEventListener('fetch', event => {
+  const url = new URL(event.request.url);
+  if (event.request.method === 'GET' && url.origin === self.location.origin && url.pathname.startsWith('/results/')) {
+    event.respondWith(cachedResult(event.request));
+    return;
+  }
   event.respondWith(
     caches.match(event.request)
       .then(response => response || fetch(event.request))
   );
-});
\ No newline at end of file
+});
@@ -1,7 +1,114 @@
+import asyncio
+import gzip
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import threading
+import time
 import unittest
-from unittest.mock import Mock, patch
-from agents import MarketLogicAgent, FinancialSustainabilityAgent, CompetitiveDurabilityAgent
+from unittest.mock import AsyncMock, Mock, patch
+from agents import (
+    MarketLogicAgent,
+    FinancialSustainabilityAgent,
+    CompetitiveDurabilityAgent,
+    StrategicSynthesizerAgent,
+    MarketAnalysis,
+    FinancialAnalysis,
+    CompetitiveAnalysis,
+)
 from orchestrator import AIConsultantOrchestrator
+from pipeline import AnalysisPipeline, AnalysisResult, DivergenceStage, divergence_registry
+from scheduler import DAGScheduler, Deadline, NodeTimeout
+from history import AnalysisStore
+from jobs import JobQueue, JobStore
+from singleflight import SingleFlight
+from admission import AdmissionController, Rejected
+import cli
+import openai
+from agents import ModelLimits, RateLimiter, FusedDivergenceAgent, FusedAnalysis
+from agents import AgentRegistry, BaseAgent, ResultCache, SimilarityIndex, StrategicMemo
+from agents import HedgePolicy, SynthesisRouter, synthesis_routing_stats
+from agents.routing import disagreement_score
+from agents.cache import make_key
+from agents.serialization import merge
+from compression import negotiate
+from agents.http_client import ConnectionStats, HTTPSettings, create_clients
+from agents.prompts import PromptCacheStats
+from agents.metrics import collect_request_metrics, metrics
+from agents.tokens import estimate_tokens
+
+
+def fake_completion(payload):
+    response = Mock()
+    response.choices = [Mock(message=Mock(content=json.dumps(payload, ensure_ascii=False)))]
+    return response
+
+
+MARKET_PAYLOAD = {
+    "market_demand": "طلب مرتفع",
+    "customer_segments": "العائلات",
+    "market_trends": "نمو",
+    "demand_gaps": "الجودة",
+    "risk_level": "متوسط",
+    "confidence_score": 0.8,
+}
+FINANCIAL_PAYLOAD = {
+    "unit_economics": "هامش جيد",
+    "operational_costs": "توصيل",
+    "revenue_streams": "اشتراكات",
+    "financial_stability": "مستقر",
+    "risk_level": "متوسط",
+    "confidence_score": 0.7,
+}
+COMPETITIVE_PAYLOAD = {
+    "entry_barriers": "منخفضة",
+    "moat_strength": "ضعيفة",
+    "ease_of_replication": "سهل",
+    "unique_value_proposition": "الطازجية",
+    "risk_level": "عالي",
+    "confidence_score": 0.6,
+}
+MEMO_PAYLOAD = {
+    "executive_summary": "ملخص",
+    "detailed_analysis": {"market_perspective": "سوق"},
+    "overall_risk_level": "متوسط",
+    "overall_confidence_score": 0.7,
+    "final_recommendation": "المضي بحذر",
+    "conflicts_identified": "لا شيء",
+    "resolution_rationale": "مبرر",
+}
+
+
+def payload_for_prompt(**kwargs):
+    """اختيار استجابة وهمية بحسب نوع الوكيل الظاهر في نص الطلب"""
+    prompt = "\n".join(message["content"] for message in kwargs["messages"])
+    if '"market": {' in prompt:
+        return fake_completion({
+            "market": MARKET_PAYLOAD,
+            "financial": FINANCIAL_PAYLOAD,
+            "competitive": COMPETITIVE_PAYLOAD,
+        })
+    for marker, payload in (
+        ("General Partner", MEMO_PAYLOAD),
+        ("Market Logic Analyst", MARKET_PAYLOAD),
+        ("Financial Sustainability Analyst", FINANCIAL_PAYLOAD),
+        ("Competitive Durability Analyst", COMPETITIVE_PAYLOAD),
+    ):
+        if marker in prompt:
+            return fake_completion(payload)
+    raise AssertionError("unexpected prompt")
+
+
+def fake_stream(payload, pieces=4):
+    """تقسيم الاستجابة إلى أجزاء كما تصل من واجهة البث"""
+    content = json.dumps(payload, ensure_ascii=False)
+    size = len(content) // pieces + 1
+    return [
+        Mock(choices=[Mock(delta=Mock(content=content[i:i + size]))])
+        for i in range(0, len(content), size)
+    ]
 
 
 class TestAgents(unittest.TestCase):
@@ -42,6 +149,367 @@ class TestAgents(unittest.TestCase):
         self.assertIsNotNone(result.market_demand)
         self.assertIsNotNone(result.confidence_score)
 
+    
+    def test_sync_analyze_parses_completion(self):
+        self.mock_client.chat.completions.create.return_value = fake_completion(MARKET_PAYLOAD)
+        result = MarketLogicAgent(self.mock_client).analyze(self.test_idea)
+        self.assertIsInstance(result, MarketAnalysis)
+        self.assertEqual(result.confidence_score, 0.8)
+    
+    def test_analyze_async_uses_async_client(self):
+        async_client = Mock()
+        async_client.chat.completions.create = AsyncMock(return_value=fake_completion(MARKET_PAYLOAD))
+        agent = MarketLogicAgent(self.mock_client, async_client)
+        
+        result = asyncio.run(agent.analyze_async(self.test_idea))
+        
+        self.assertEqual(result.market_demand, "طلب مرتفع")
+        async_client.chat.completions.create.assert_awaited_once()
+        self.mock_client.chat.completions.create.assert_not_called()
+    
+    def test_analyze_async_falls_back_to_sync_client(self):
+        self.mock_client.chat.completions.create.return_value = fake_completion(MARKET_PAYLOAD)
+        result = asyncio.run(MarketLogicAgent(self.mock_client).analyze_async(self.test_idea))
+        self.assertEqual(result.risk_level, "متوسط")
+    
+    def test_synthesize_stream_yields_tokens_then_memo(self):
+        self.mock_client.chat.completions.create.return_value = fake_stream(MEMO_PAYLOAD)
+        synthesizer = StrategicSynthesizerAgent(self.mock_client)
+        events = list(synthesizer.synthesize_stream(
+            self.test_idea,
+            MarketAnalysis(**MARKET_PAYLOAD),
+            FinancialAnalysis(**FINANCIAL_PAYLOAD),
+            CompetitiveAnalysis(**COMPETITIVE_PAYLOAD),
+        ))
+        
+        kinds = [kind for kind, _ in events]
+        self.assertEqual(kinds[-1], "result")
+        self.assertEqual(kinds.count("token"), 4)
+        self.assertEqual(events[-1][1].final_recommendation, "المضي بحذر")
+        self.assertTrue(self.mock_client.chat.completions.create.call_args.kwargs["stream"])
+
+    def test_prompts_share_static_prefix_and_end_with_idea(self):
+        agent = MarketLogicAgent(self.mock_client)
+        first = agent.build_request("فكرة أولى")["messages"]
+        second = agent.build_request("فكرة ثانية مختلفة")["messages"]
+
+        self.assertEqual(first[0], second[0])
+        self.assertEqual(first[0]["role"], "system")
+        self.assertTrue(second[1]["content"].endswith("فكرة ثانية مختلفة"))
+
+        memo_messages = StrategicSynthesizerAgent(self.mock_client).build_request(
+            "فكرة أولى",
+            MarketAnalysis(**MARKET_PAYLOAD),
+            FinancialAnalysis(**FINANCIAL_PAYLOAD),
+            CompetitiveAnalysis(**COMPETITIVE_PAYLOAD),
+        )["messages"]
+        self.assertIn("نسبة الثقة: 80.0%", memo_messages[1]["content"])
+        self.assertTrue(memo_messages[1]["content"].endswith("فكرة أولى"))
+
+    def test_cached_prompt_tokens_are_recorded(self):
+        response = fake_completion(MARKET_PAYLOAD)
+        response.usage = Mock(prompt_tokens=1200, total_tokens=1500, prompt_tokens_details=Mock(cached_tokens=1024))
+        self.mock_client.chat.completions.create.return_value = response
+
+        with patch("agents.base.prompt_cache_stats", PromptCacheStats()) as stats:
+            MarketLogicAgent(self.mock_client, rate_limiter=RateLimiter()).analyze(self.test_idea)
+
+        snapshot = stats.snapshot()["gpt-4o-mini"]
+        self.assertEqual(snapshot["cached_tokens"], 1024)
+        self.assertAlmostEqual(snapshot["cached_fraction"], 1024 / 1200)
+
+    def test_synthesizer_compacts_inputs_to_token_budget(self):
+        verbose = dict(MARKET_PAYLOAD, market_demand="طلب مرتفع جداً في المدن الكبرى. " * 200)
+        analyses = (
+            MarketAnalysis(**verbose),
+            FinancialAnalysis(**FINANCIAL_PAYLOAD),
+            CompetitiveAnalysis(**COMPETITIVE_PAYLOAD),
+        )
+        unbounded = StrategicSynthesizerAgent(self.mock_client)
+        bounded = StrategicSynthesizerAgent(self.mock_client, input_token_budget=900)
+
+        with collect_request_metrics() as collected:
+            messages = bounded.build_request(self.test_idea, *analyses)["messages"]
+
+        prompt_tokens = sum(estimate_tokens(message["content"]) for message in messages)
+        self.assertLessEqual(prompt_tokens, 900)
+        self.assertIn("مستوى المخاطرة: عالي", messages[1]["content"])
+        self.assertIn("نسبة الثقة: 80.0%", messages[1]["content"])
+        self.assertIn("الطازجية", messages[1]["content"])
+        self.assertGreater(collected.compaction_saved_tokens, 1000)
+        self.assertNotEqual(bounded.prompt_version, unbounded.prompt_version)
+
+    def test_invalid_json_counts_as_parse_failure(self):
+        response = Mock()
+        response.choices = [Mock(message=Mock(content="ليس JSON"))]
+        self.mock_client.chat.completions.create.return_value = response
+
+        with collect_request_metrics() as collected:
+            with self.assertRaises(json.JSONDecodeError):
+                MarketLogicAgent(self.mock_client, rate_limiter=RateLimiter()).analyze(self.test_idea)
+
+        self.assertEqual(collected.to_dict()["parse_failures"], 1)
+        self.assertIn("MarketLogicAgent", collected.to_dict()["agents_seconds"])
+        self.assertIn('llm_parse_failures_total{agent="MarketLogicAgent"}', metrics.render())
+
+    def test_malformed_responses_are_repaired_and_coerced(self):
+        payload = json.dumps(dict(MARKET_PAYLOAD, confidence_score="85%", risk_level="High"), ensure_ascii=False)
+        fenced = "```json\n" + payload[:-1] + ",}\n```"
+        truncated = payload[:payload.index("الجودة") + 3]
+        response = Mock()
+        self.mock_client.chat.completions.create.return_value = response
+        agent = MarketLogicAgent(self.mock_client, rate_limiter=RateLimiter())
+
+        with collect_request_metrics() as collected:
+            response.choices = [Mock(message=Mock(content=fenced))]
+            repaired = agent.analyze(self.test_idea)
+            response.choices = [Mock(message=Mock(content=truncated))]
+            cut = agent.analyze("فكرة أخرى")
+
+        self.assertEqual((repaired.confidence_score, repaired.risk_level), (0.85, "عالي"))
+        self.assertEqual(repaired.demand_gaps, "الجودة")
+        self.assertEqual(cut.demand_gaps, "الج")
+        self.assertEqual((cut.risk_level, cut.confidence_score), ("متوسط", 0.5))
+        self.assertEqual(collected.to_dict()["repaired_responses"], 2)
+        self.assertEqual(collected.to_dict()["parse_failures"], 0)
+
+        response_format = agent.build_request(self.test_idea)["response_format"]
+        schema = response_format["json_schema"]["schema"]
+        self.assertEqual(response_format["type"], "json_schema")
+        self.assertFalse(schema["additionalProperties"])
+        self.assertEqual(set(schema["required"]), set(MARKET_PAYLOAD))
+        with patch.dict('os.environ', {'STRUCTURED_OUTPUTS': 'off'}):
+            self.assertEqual(agent.build_request(self.test_idea)["response_format"], {"type": "json_object"})
+
+    def test_confidence_is_rescaled_only_when_it_reads_as_a_percentage(self):
+        from agents.schemas import decode
+        
+        cases = {
+            0: 0.0, 0.85: 0.85, 1: 1.0, 1.5: 1.0, 1.99: 1.0, 2: 0.02, 85: 0.85, "85": 0.85,
+            100: 1.0, 150: 1.0, -0.2: 0.0, "1.5%": 0.015, "عالية": 0.5,
+        }
+        for raw, expected in cases.items():
+            data, _ = decode(json.dumps({"confidence_score": raw}), "market_analysis")
+            self.assertAlmostEqual(data["confidence_score"], expected, msg=repr(raw))
+
+
+class TestResultCache(unittest.TestCase):
+    
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmpdir.name, "cache.sqlite3")
+    
+    def tearDown(self):
+        self.tmpdir.cleanup()
+    
+    def test_agent_hit_skips_model_call(self):
+        client = Mock()
+        client.chat.completions.create.return_value = fake_completion(MARKET_PAYLOAD)
+        agent = MarketLogicAgent(client, cache=ResultCache(path=self.path))
+        
+        first = agent.analyze("منصة   توصيل")
+        second = agent.analyze("منصة توصيل")
+        
+        self.assertEqual(first, second)
+        self.assertEqual(client.chat.completions.create.call_count, 1)
+        self.assertEqual(agent.cache.stats()["memory_hits"], 1)
+    
+    def test_disk_tier_survives_new_instance(self):
+        market = MarketAnalysis(**MARKET_PAYLOAD)
+        ResultCache(path=self.path).put("k", market)
+        
+        cache = ResultCache(path=self.path)
+        self.assertEqual(cache.get("k", MarketAnalysis), market)
+        self.assertEqual(cache.stats()["disk_hits"], 1)
+    
+    def test_ttl_and_size_eviction(self):
+        market = MarketAnalysis(**MARKET_PAYLOAD)
+        expired = ResultCache(path=self.path, ttl_seconds=-1)
+        expired.put("old", market)
+        self.assertIsNone(expired.get("old", MarketAnalysis))
+        
+        cache = ResultCache(path=self.path, max_memory_entries=2, max_disk_entries=3)
+        for i in range(5):
+            cache.put(str(i), market)
+        stats = cache.stats()
+        self.assertEqual(stats["memory_entries"], 2)
+        self.assertEqual(stats["disk_entries"], 3)
+        self.assertIsNone(cache.get("0", MarketAnalysis))
+    
+    def test_prompt_version_is_part_of_key(self):
+        agent = MarketLogicAgent(Mock(), cache=ResultCache(path=None))
+        key = agent._cache_key("فكرة")
+        self.assertNotEqual(key, make_key("MarketLogicAgent", agent.model, "other-version", "فكرة"))
+        with patch.object(MarketLogicAgent, "_prompt_fingerprint", return_value="changed"):
+            self.assertNotEqual(agent._cache_key("فكرة"), key)
+
+
+
+class TestRateLimiter(unittest.TestCase):
+    
+    def setUp(self):
+        self.now = 0.0
+        self.sleeps = []
+        
+        def sleep(seconds):
+            self.sleeps.append(seconds)
+            self.now += seconds
+        
+        self.limiter = RateLimiter(
+            limits={"gpt-4o-mini": ModelLimits(requests_per_minute=2, tokens_per_minute=100_000, expected_completion_tokens=100)},
+            clock=lambda: self.now,
+            sleep=sleep,
+        )
+    
+    def _error(self, error_type, status, headers=None):
+        return error_type("err", response=Mock(status_code=status, headers=headers or {}), body=None)
+    
+    def test_burst_is_queued_by_request_budget(self):
+        for _ in range(3):
+            self.limiter.call("gpt-4o-mini", "prompt", lambda: Mock(usage=None))
+        
+        self.assertEqual(len(self.sleeps), 1)
+        self.assertAlmostEqual(self.sleeps[0], 30.0)
+        self.assertEqual(self.limiter.snapshot()["gpt-4o-mini"]["requests"], 3)
+    
+    def test_rate_limit_error_retried_after_retry_after(self):
+        responses = [self._error(openai.RateLimitError, 429, {"retry-after": "7"}), Mock(usage=None)]
+        
+        def fn():
+            result = responses.pop(0)
+            if isinstance(result, Exception):
+                raise result
+            return result
+        
+        self.limiter.call("gpt-4o-mini", "prompt", fn)
+        
+        self.assertGreaterEqual(self.sleeps[0], 7)
+        state = self.limiter.snapshot()["gpt-4o-mini"]
+        self.assertEqual(state["retries"], 1)
+        self.assertEqual(state["rate_limited"], 1)
+        self.assertEqual(state["in_flight"], 0)
+    
+    def test_non_retryable_error_raised_immediately(self):
+        fn = Mock(side_effect=self._error(openai.BadRequestError, 400))
+        with self.assertRaises(openai.BadRequestError):
+            self.limiter.call("gpt-4o-mini", "prompt", fn)
+        self.assertEqual(fn.call_count, 1)
+        self.assertEqual(self.limiter.snapshot()["gpt-4o-mini"]["failures"], 1)
+    
+    def test_actual_usage_replaces_estimate(self):
+        self.limiter.call("gpt-4o-mini", "prompt", lambda: Mock(usage=Mock(total_tokens=40)))
+        state = self.limiter.snapshot()["gpt-4o-mini"]
+        self.assertEqual(state["actual_tokens"], 40)
+        self.assertAlmostEqual(state["available_tokens"], 100_000 - 40)
+    
+    def test_async_calls_share_the_budget(self):
+        async_sleeps = []
+        
+        async def async_sleep(seconds):
+            async_sleeps.append(seconds)
+        
+        self.limiter._async_sleep = async_sleep
+        
+        async def fn():
+            return Mock(usage=None)
+        
+        async def burst():
+            await asyncio.gather(*(self.limiter.call_async("gpt-4o-mini", "p", fn) for _ in range(3)))
+        
+        asyncio.run(burst())
+        self.assertEqual(async_sleeps, [30.0])
+
+
+class TestHTTPClient(unittest.TestCase):
+    
+    def test_settings_from_environment(self):
+        env = {'OPENAI_HTTP_MAX_KEEPALIVE_CONNECTIONS': '7', 'OPENAI_HTTP_HTTP2': 'false',
+               'OPENAI_HTTP_READ_TIMEOUT': '45'}
+        with patch.dict('os.environ', env):
+            settings = HTTPSettings.from_env()
+        self.assertEqual(settings.max_keepalive_connections, 7)
+        self.assertFalse(settings.http2)
+        self.assertEqual(settings.timeout().read, 45.0)
+        self.assertEqual(settings.max_connections, HTTPSettings().max_connections)
+    
+    def test_sequential_calls_reuse_one_connection(self):
+        from benchmarks.mock_openai_server import MockOpenAIServer
+        
+        stats = ConnectionStats()
+        with MockOpenAIServer(handshake_delay=0, latency=0) as server:
+            client, _ = create_clients("test_key", HTTPSettings(http2=False), stats=stats, base_url=server.base_url)
+            agent = MarketLogicAgent(client, rate_limiter=RateLimiter())
+            for idea in ("فكرة 1", "فكرة 2", "فكرة 3"):
+                agent.analyze(idea)
+            client.close()
+        
+        self.assertEqual((server.stats["connections"], server.stats["requests"]), (1, 3))
+        snapshot = stats.snapshot()
+        self.assertEqual((snapshot["requests"], snapshot["connections_opened"], snapshot["reused"]), (3, 1, 2))
+
+
+class TestMockOpenAIServer(unittest.TestCase):
+    
+    def test_latency_specs(self):
+        from benchmarks.mock_openai_server import LatencyModel
+        
+        self.assertEqual(LatencyModel.parse("fixed:50"), LatencyModel("fixed", 0.05, 0.0))
+        self.assertEqual(LatencyModel.parse("uniform:50:20"), LatencyModel("uniform", 0.05, 0.02))
+        self.assertEqual(LatencyModel.parse("lognormal:400:0.5"), LatencyModel("lognormal", 0.4, 0.5))
+        with self.assertRaises(ValueError):
+            LatencyModel.parse("pareto:50")
+    
+    def test_streaming_and_injected_errors(self):
+        from benchmarks.mock_openai_server import MockOpenAIServer
+        
+        messages = [{"role": "system", "content": "You are a Market Logic Analyst."},
+                    {"role": "user", "content": "منصة لتوصيل المخبوزات"}]
+        with MockOpenAIServer(handshake_delay=0, latency=0) as server:
+            client, _ = create_clients("test_key", HTTPSettings(http2=False), base_url=server.base_url)
+            stream = client.chat.completions.create(model="gpt-4o-mini", messages=messages, stream=True)
+            content = "".join(chunk.choices[0].delta.content or "" for chunk in stream if chunk.choices)
+            self.assertIn("market_demand", json.loads(content))
+            
+            server.error_rate = 1.0
+            with self.assertRaises((openai.RateLimitError, openai.InternalServerError)):
+                client.chat.completions.create(model="gpt-4o-mini", messages=messages)
+            client.close()
+        self.assertEqual(server.stats["errors_429"] + server.stats["errors_500"], 1)
+    
+    def test_app_and_batches_share_one_event_loop(self):
+        # العميل غير المتزامن المشترك مرتبط بحلقة واحدة؛ حلقة ثانية تفشل باستثناء من httpx
+        import app as app_module
+        from event_loop import shared_event_loop
+        
+        self.assertIs(app_module.services.agents_loop, shared_event_loop())
+
+
+class TestStartup(unittest.TestCase):
+    
+    def _run(self, code, **env):
+        environ = {key: value for key, value in os.environ.items() if key != 'OPENAI_API_KEY'}
+        completed = subprocess.run(
+            [sys.executable, "-c", code], capture_output=True, text=True,
+            env={**environ, 'RESULT_CACHE_PATH': '', 'HISTORY_DB_PATH': '', 'JOBS_DB_PATH': '', 'CHECKPOINT_DB_PATH': '', **env},
+            cwd=os.path.dirname(os.path.abspath(__file__)),
+        )
+        self.assertEqual(completed.returncode, 0, completed.stderr)
+        return completed.stdout.split()
+    
+    def test_imports_defer_openai_and_rich(self):
+        loaded = self._run(
+            "import sys, agents, orchestrator, cli; "
+            "print('openai' in sys.modules, 'rich' in sys.modules, 'pydantic' in sys.modules)"
+        )
+        self.assertEqual(loaded, ["False", "False", "False"])
+    
+    def test_app_serves_without_api_key_until_a_model_is_needed(self):
+        output = self._run(
+            "import app; client = app.app.test_client(); "
+            "print(client.get('/').status_code, client.get('/history').status_code, 'clients' in app.services.__dict__)"
+        )
+        self.assertEqual(output, ["200", "200", "False"])
+
 
 class TestOrchestrator(unittest.TestCase):
     
@@ -52,6 +520,1221 @@ class TestOrchestrator(unittest.TestCase):
         self.assertIsNotNone(orchestrator.financial_agent)
         self.assertIsNotNone(orchestrator.competitive_agent)
         self.assertIsNotNone(orchestrator.synthesizer)
+    
+    def test_analyze_async_runs_on_the_shared_loop_and_reuses_similar_ideas(self):
+        from event_loop import shared_event_loop
+        
+        orchestrator = AIConsultantOrchestrator(
+            api_key="test_key", cache=ResultCache(path=None), history=AnalysisStore(None)
+        )
+        orchestrator._print_header = orchestrator._display_result = Mock()
+        orchestrator.console = Mock()
+        loops = []
+        
+        async def compute_async(idea, on_complete=None):
+            loops.append(asyncio.get_running_loop())
+            return make_result(idea)
+        
+        orchestrator.pipeline = Mock(compute_async=compute_async)
+        orchestrator.pipeline.lookup_similar.return_value = None
+        # كل asyncio.run حلقة جديدة، والعميل غير المتزامن المشترك مرتبط بحلقة واحدة
+        for idea in ("فكرة أولى", "فكرة ثانية"):
+            asyncio.run(orchestrator.analyze_async(idea))
+        self.assertEqual(loops, [shared_event_loop().loop] * 2)
+        
+        orchestrator.pipeline.lookup_similar.return_value = make_result("فكرة ثالثة", risk_level="عالي")
+        memo = asyncio.run(orchestrator.analyze_async("فكرة ثالثة"))
+        self.assertEqual(len(loops), 2)
+        self.assertEqual(memo.overall_risk_level, "عالي")
+        self.assertEqual(orchestrator.history.count(), 3)
+
+
+
+class TestSynthesisRouting(unittest.TestCase):
+    
+    def setUp(self):
+        synthesis_routing_stats.reset()
+        self.client = Mock()
+        self.client.chat.completions.create.side_effect = payload_for_prompt
+        self.synthesizer = StrategicSynthesizerAgent(
+            self.client, cache=ResultCache(path=None), rate_limiter=RateLimiter(), router=SynthesisRouter()
+        )
+    
+    def _analyses(self, risks, confidence):
+        return (
+            MarketAnalysis(**{**MARKET_PAYLOAD, "risk_level": risks[0], "confidence_score": confidence}),
+            FinancialAnalysis(**{**FINANCIAL_PAYLOAD, "risk_level": risks[1], "confidence_score": confidence}),
+            CompetitiveAnalysis(**{**COMPETITIVE_PAYLOAD, "risk_level": risks[2], "confidence_score": confidence}),
+        )
+    
+    def test_route_follows_disagreement(self):
+        agree = self._analyses(("متوسط", "متوسط", "متوسط"), 0.9)
+        mild = self._analyses(("متوسط", "متوسط", "عالي"), 0.9)
+        conflict = self._analyses(("منخفض", "متوسط", "عالي"), 0.6)
+        self.assertLess(disagreement_score(*agree), disagreement_score(*mild))
+        self.assertLess(disagreement_score(*mild), disagreement_score(*conflict))
+        
+        memo = self.synthesizer.synthesize("فكرة", *agree)
+        self.assertEqual(memo.synthesis_route, "template")
+        self.assertEqual(memo.overall_risk_level, "متوسط")
+        self.client.chat.completions.create.assert_not_called()
+        
+        self.assertEqual(self.synthesizer.synthesize("فكرة", *mild).synthesis_route, "gpt-4o-mini")
+        self.assertEqual(self.client.chat.completions.create.call_args.kwargs["model"], "gpt-4o-mini")
+        memo = self.synthesizer.synthesize("فكرة", *conflict)
+        self.assertEqual((memo.synthesis_route, memo.disagreement_score), ("gpt-4o", 0.62))
+        self.assertEqual(self.client.chat.completions.create.call_args.kwargs["model"], "gpt-4o")
+        
+        stats = synthesis_routing_stats.snapshot()
+        self.assertEqual({route: r["count"] for route, r in stats["routes"].items()},
+                         {"template": 1, "gpt-4o-mini": 1, "gpt-4o": 1})
+        self.assertGreater(stats["cost_saved_usd"], 0)
+        self.assertIsNotNone(stats["latency_saved_seconds"])
+    
+    def test_template_route_streams_the_memo_without_tokens(self):
+        events = list(self.synthesizer.synthesize_stream("فكرة", *self._analyses(("عالي",) * 3, 0.95)))
+        self.assertEqual([kind for kind, _ in events], ["result"])
+        self.assertEqual(events[0][1].synthesis_route, "template")
+
+
+class TestHedgedRequests(unittest.TestCase):
+    
+    def setUp(self):
+        self.policy = HedgePolicy(min_samples=5, min_delay=0.05)
+        for _ in range(5):
+            self.policy.observe("gpt-4o", 0.01)
+    
+    def test_no_hedge_before_enough_samples(self):
+        self.assertIsNone(HedgePolicy().delay("gpt-4o"))
+        self.assertEqual(self.policy.delay("gpt-4o"), 0.05)
+        self.assertIsNone(HedgePolicy(enabled=False).delay("gpt-4o"))
+    
+    def test_slow_call_is_hedged_and_first_answer_wins(self):
+        calls = []
+        
+        def call():
+            calls.append(1)
+            time.sleep(1.0 if len(calls) == 1 else 0.01)
+            return len(calls)
+        
+        with collect_request_metrics() as collected:
+            start = time.perf_counter()
+            self.assertEqual(self.policy.call("gpt-4o", call), 2)
+        self.assertLess(time.perf_counter() - start, 0.5)
+        self.assertEqual(collected.hedges, 1)
+        self.assertIn('llm_hedge_wins_total{model="gpt-4o"}', metrics.render())
+    
+    def test_async_loser_is_cancelled(self):
+        cancelled = []
+        
+        async def call():
+            first = not cancelled
+            cancelled.append(False)
+            try:
+                await asyncio.sleep(1.0 if first else 0.01)
+            except asyncio.CancelledError:
+                cancelled[0] = True
+                raise
+            return "backup" if not first else "primary"
+        
+        self.assertEqual(asyncio.run(self.policy.call_async("gpt-4o", call)), "backup")
+        self.assertEqual(cancelled, [True, False])
+    
+    def test_failed_attempt_waits_for_the_other(self):
+        calls = []
+        
+        def call():
+            calls.append(1)
+            if len(calls) == 1:
+                time.sleep(0.1)
+                raise RuntimeError("primary failed")
+            time.sleep(0.2)
+            return "backup"
+        
+        self.assertEqual(self.policy.call("gpt-4o", call), "backup")
+    
+    def test_rate_limiter_wait_neither_hedges_nor_counts_as_latency(self):
+        client = Mock()
+        client.chat.completions.create.side_effect = payload_for_prompt
+        limiter = RateLimiter()
+        agent = MarketLogicAgent(client, cache=ResultCache(path=None), rate_limiter=limiter, hedge_policy=self.policy)
+        for _ in range(5):
+            self.policy.observe(agent.model, 0.01)
+        
+        # الطابور في المحدد أطول من مهلة التحوط (0.05)
+        with patch.object(limiter, "_reserve", return_value=0.2):
+            agent.analyze("فكرة")
+        self.assertEqual(client.chat.completions.create.call_count, 1)
+        self.assertLess(max(self.policy._latencies[agent.model]), 0.1)
+    
+    def test_success_wins_when_both_attempts_finish_together(self):
+        from concurrent.futures import ALL_COMPLETED, wait as wait_all
+        
+        gate = threading.Event()
+        
+        def call(failing_primary):
+            calls.append(1)
+            primary = len(calls) == 1
+            if not primary:
+                gate.set()
+            gate.wait()
+            if primary == failing_primary:
+                raise RuntimeError("attempt failed")
+            return "ok"
+        
+        # الطلبان يكتملان في نفس wait، وترتيب done غير محدد: كل ترتيب يُجرب عدة مرات
+        together = lambda fs, timeout=None, return_when=ALL_COMPLETED: wait_all(fs, timeout)
+        for failing_primary in (True, False, True, False, True, False):
+            calls = []
+            gate.clear()
+            with patch("agents.hedging.wait", side_effect=together):
+                self.assertEqual(self.policy.call("gpt-4o", lambda: call(failing_primary)), "ok")
+
+
+class TestDivergenceStage(unittest.TestCase):
+    
+    def _scheduler(self, *agents):
+        stage = DivergenceStage(*agents)
+        scheduler = DAGScheduler(divergence_registry(stage), max_workers=3)
+        self.addCleanup(scheduler.shutdown)
+        return scheduler
+    
+    def test_agents_run_concurrently(self):
+        scheduler = self._scheduler(
+            SleepyAgent("market", 0.2), SleepyAgent("financial", 0.2), SleepyAgent("competitive", 0.2)
+        )
+        start = time.perf_counter()
+        values = scheduler.run("فكرة")
+        elapsed = time.perf_counter() - start
+        
+        self.assertLess(elapsed, 0.45)
+        self.assertEqual(values, {"market": "market()", "financial": "financial()", "competitive": "competitive()"})
+    
+    def test_on_complete_called_in_completion_order(self):
+        scheduler = self._scheduler(
+            SleepyAgent("market", 0.15), SleepyAgent("financial", 0.0), SleepyAgent("competitive", 0.05)
+        )
+        completed = []
+        scheduler.run("فكرة", on_complete=lambda name, analysis: completed.append(name))
+        
+        self.assertEqual(completed, ["financial", "competitive", "market"])
+    
+    def test_agent_error_propagates(self):
+        failing = SleepyAgent("market", 0)
+        failing.invoke = Mock(side_effect=ValueError("bad json"))
+        scheduler = self._scheduler(failing, SleepyAgent("financial", 0), SleepyAgent("competitive", 0))
+        with self.assertRaises(ValueError):
+            scheduler.run("فكرة")
+    
+    def test_compute_async_gathers_all_agents(self):
+        client = Mock()
+        client.chat.completions.create.side_effect = payload_for_prompt
+        async_client = Mock()
+        async_client.chat.completions.create = AsyncMock(side_effect=payload_for_prompt)
+        stage = DivergenceStage(
+            MarketLogicAgent(client, async_client),
+            FinancialSustainabilityAgent(client, async_client),
+            CompetitiveDurabilityAgent(client, async_client),
+        )
+        pipeline = AnalysisPipeline(stage, StrategicSynthesizerAgent(client, async_client))
+        self.addCleanup(pipeline.scheduler.shutdown)
+        completed = []
+        result = asyncio.run(pipeline.compute_async("فكرة", on_complete=lambda name, a: completed.append(name)))
+        
+        self.assertEqual(sorted(completed[:3]), ["competitive", "financial", "market"])
+        self.assertEqual(completed[3], "synthesis")
+        self.assertEqual(result.competitive_analysis.risk_level, "عالي")
+        self.assertEqual(async_client.chat.completions.create.await_count, 4)
+        client.chat.completions.create.assert_not_called()
+    
+    def test_fused_mode_makes_one_call_and_splits_results(self):
+        client = Mock()
+        client.chat.completions.create.side_effect = payload_for_prompt
+        split_agents = [Mock(), Mock(), Mock()]
+        stage = DivergenceStage(
+            *split_agents,
+            fused_agent=FusedDivergenceAgent(client, cache=ResultCache(path=None)),
+        )
+        scheduler = DAGScheduler(divergence_registry(stage))
+        self.addCleanup(scheduler.shutdown)
+        completed = []
+        
+        values = scheduler.run("فكرة", on_complete=lambda name, a: completed.append(name))
+        async_values = asyncio.run(scheduler.run_async("فكرة"))
+        
+        self.assertEqual(stage.mode, "fused")
+        self.assertEqual(sorted(completed), ["competitive", "financial", "market"])
+        self.assertEqual(values["financial"].unit_economics, "هامش جيد")
+        self.assertEqual(async_values, values)
+        self.assertEqual(client.chat.completions.create.call_count, 1)
+        for agent in split_agents:
+            agent.analyze.assert_not_called()
+    
+    def test_fused_analysis_survives_cache_round_trip(self):
+        fused = FusedAnalysis(
+            MarketAnalysis(**MARKET_PAYLOAD),
+            FinancialAnalysis(**FINANCIAL_PAYLOAD),
+            CompetitiveAnalysis(**COMPETITIVE_PAYLOAD),
+        )
+        cache = ResultCache(path=None)
+        cache.put("k", fused)
+        self.assertEqual(cache.get("k", FusedAnalysis), fused)
+
+
+class SleepyAgent(BaseAgent):
+    """عقدة اختبار تنام delay ثم تعيد اسمها ومدخلاتها"""
+    
+    def __init__(self, name, delay, inputs=()):
+        super().__init__(None)
+        self.node_name, self.delay, self.inputs = name, delay, inputs
+    
+    def invoke(self, business_idea, *inputs):
+        time.sleep(self.delay)
+        return f"{self.node_name}({','.join(inputs)})"
+    
+    async def invoke_async(self, business_idea, *inputs):
+        await asyncio.sleep(self.delay)
+        return f"{self.node_name}({','.join(inputs)})"
+
+
+class TestAgentScheduler(unittest.TestCase):
+    
+    def _registry(self, **timeouts):
+        registry = AgentRegistry()
+        registry.register(SleepyAgent("market", 0.1))
+        registry.register(SleepyAgent("regulatory", 0.25))
+        registry.register(SleepyAgent("pricing", 0.1, inputs=("market",)))
+        registry.register(SleepyAgent("synthesis", 0.05, inputs=("pricing", "regulatory")))
+        for name, timeout in timeouts.items():
+            node = registry.unregister(name)
+            registry.register(node.agent, timeout=timeout)
+        return registry
+    
+    def test_nodes_start_as_soon_as_their_inputs_are_ready(self):
+        scheduler = DAGScheduler(self._registry())
+        completed = []
+        with collect_request_metrics() as collected:
+            start = time.perf_counter()
+            values = scheduler.run("فكرة", on_complete=lambda name, value: completed.append(name))
+            elapsed = time.perf_counter() - start
+        scheduler.shutdown()
+        
+        # pricing لا ينتظر regulatory، فالزمن الكلي = أطول سلسلة (0.25 + 0.05) لا مجموع المراحل
+        self.assertLess(elapsed, 0.4)
+        self.assertEqual(completed, ["market", "pricing", "regulatory", "synthesis"])
+        self.assertEqual(values["synthesis"], "synthesis(pricing(market()),regulatory())")
+        self.assertEqual(collected.schedule["critical_path"], ["regulatory", "synthesis"])
+        self.assertEqual(set(collected.phases), {"divergence"})
+    
+    def test_run_async_matches_sync_results(self):
+        scheduler = DAGScheduler(self._registry())
+        values = asyncio.run(scheduler.run_async("فكرة"))
+        self.assertEqual(values, scheduler.run("فكرة"))
+        scheduler.shutdown()
+    
+    def test_invalid_graphs_are_rejected(self):
+        registry = AgentRegistry()
+        registry.register(SleepyAgent("a", 0, inputs=("b",)))
+        with self.assertRaisesRegex(ValueError, "no registered node produces"):
+            registry.order()
+        registry.register(SleepyAgent("b", 0, inputs=("a",)))
+        with self.assertRaisesRegex(ValueError, "cycle"):
+            registry.order()
+        with self.assertRaisesRegex(ValueError, "already registered"):
+            registry.register(SleepyAgent("a", 0))
+    
+    def test_node_timeout_stops_the_run(self):
+        scheduler = DAGScheduler(self._registry(regulatory=0.05))
+        with self.assertRaises(NodeTimeout) as raised:
+            scheduler.run("فكرة")
+        self.assertEqual(raised.exception.node, "regulatory")
+        with self.assertRaises(NodeTimeout):
+            asyncio.run(scheduler.run_async("فكرة"))
+        scheduler.shutdown()
+    
+    def test_deadline_drops_late_nodes_and_their_dependents(self):
+        registry = AgentRegistry()
+        registry.register(SleepyAgent("market", 0.05))
+        registry.register(SleepyAgent("regulatory", 1.0))
+        registry.register(SleepyAgent("pricing", 0.05, inputs=("market",)))
+        registry.register(SleepyAgent("synthesis", 0.05, inputs=("pricing", "regulatory")), phase="synthesis")
+        scheduler = DAGScheduler(registry)
+        # حصة التباعد 0.24 ثانية: regulatory يُترك، ومعه synthesis الذي يعتمد عليه
+        deadline = Deadline(0.4)
+        with collect_request_metrics() as collected:
+            values = scheduler.run("فكرة", deadline=deadline)
+        self.assertEqual(set(values), {"market", "pricing"})
+        self.assertEqual(collected.schedule["dropped"], ["regulatory", "synthesis"])
+        self.assertEqual(collected.deadline_exceeded, ["divergence"])
+        
+        values = asyncio.run(scheduler.run_async("فكرة", deadline=deadline))
+        self.assertEqual(set(values), {"market", "pricing"})
+        scheduler.shutdown(wait=False)
+    
+    def test_pipeline_degrades_to_a_memo_from_completed_analyses(self):
+        def slow_synthesis(**request):
+            if request["model"] == "gpt-4o":
+                time.sleep(0.6)
+            return payload_for_prompt(**request)
+        
+        client = Mock()
+        client.chat.completions.create.side_effect = slow_synthesis
+        stage = DivergenceStage(
+            MarketLogicAgent(client, rate_limiter=RateLimiter()),
+            FinancialSustainabilityAgent(client, rate_limiter=RateLimiter()),
+            CompetitiveDurabilityAgent(client, rate_limiter=RateLimiter()),
+        )
+        pipeline = AnalysisPipeline(
+            stage, StrategicSynthesizerAgent(client, rate_limiter=RateLimiter()), deadline_seconds=0.3
+        )
+        
+        start = time.perf_counter()
+        result = pipeline.compute("فكرة")
+        self.assertLess(time.perf_counter() - start, 0.5)
+        self.assertEqual(result.market_analysis.market_demand, MARKET_PAYLOAD["market_demand"])
+        self.assertEqual(result.strategic_memo.synthesis_route, "degraded")
+        self.assertEqual(result.strategic_memo.overall_risk_level, "عالي")
+        self.assertIn("synthesis", result.strategic_memo.executive_summary)
+        pipeline.scheduler.shutdown(wait=False)
+    
+    def test_registered_perspective_joins_the_pipeline_result(self):
+        client = Mock()
+        client.chat.completions.create.side_effect = payload_for_prompt
+        stage = DivergenceStage(
+            MarketLogicAgent(client, rate_limiter=RateLimiter()),
+            FinancialSustainabilityAgent(client, rate_limiter=RateLimiter()),
+            CompetitiveDurabilityAgent(client, rate_limiter=RateLimiter()),
+        )
+        pipeline = AnalysisPipeline(stage, StrategicSynthesizerAgent(client, rate_limiter=RateLimiter()))
+        operations = SleepyAgent("operations", 0, inputs=("market",))
+        operations.invoke = lambda idea, market: MarketAnalysis(**{**MARKET_PAYLOAD, "demand_gaps": market.demand_gaps})
+        pipeline.registry.register(operations)
+        
+        result = pipeline.run("فكرة")
+        pipeline.scheduler.shutdown()
+        
+        self.assertEqual(result.to_dict()["operations_analysis"]["demand_gaps"], MARKET_PAYLOAD["demand_gaps"])
+        self.assertEqual(client.chat.completions.create.call_count, 4)
+
+
+class TestSimilarIdeas(unittest.TestCase):
+    
+    IDEA = "منصة لتوصيل المخبوزات الطازجة من المخابز المحلية إلى المنازل. الاشتراك شهري ويشمل التوصيل."
+    
+    def test_trivial_edits_match_and_different_ideas_do_not(self):
+        index = SimilarityIndex(threshold=0.85)
+        index.add(self.IDEA, "stored")
+        
+        paraphrase = "الاشتراكُ شهريٌّ ويشمل التوصيل!   مُنصّة لتوصيل المخبوزات الطازجه من المخابز المحليه الى المنازل"
+        self.assertEqual(index.query(paraphrase), (1.0, "stored"))
+        self.assertIsNone(index.query("تطبيق لحجز مواعيد الحلاقة في الأحياء السكنية"))
+        self.assertEqual(index.stats()["hits"], 1)
+        
+        # نص بلا شرائح لا يطابق أي نص آخر بلا شرائح
+        index.add("؟؟", "punctuation")
+        self.assertIsNone(index.query("!!"))
+        self.assertEqual(len(index), 1)
+    
+    def test_pipeline_serves_paraphrase_and_seeds_exact_cache(self):
+        client = Mock()
+        client.chat.completions.create.side_effect = payload_for_prompt
+        cache = ResultCache(path=None)
+        agents = [
+            agent_type(client, cache=cache, rate_limiter=RateLimiter())
+            for agent_type in (MarketLogicAgent, FinancialSustainabilityAgent, CompetitiveDurabilityAgent)
+        ]
+        synthesizer = StrategicSynthesizerAgent(client, cache=cache, rate_limiter=RateLimiter())
+        stage = DivergenceStage(*agents)
+        pipeline = AnalysisPipeline(stage, synthesizer, similar=SimilarityIndex())
+        
+        first = pipeline.run(self.IDEA)
+        paraphrase = self.IDEA.replace("المنازل.", "المنازل،")
+        second = pipeline.run(paraphrase)
+        pipeline.scheduler.shutdown()
+        
+        self.assertEqual(client.chat.completions.create.call_count, 4)
+        self.assertEqual(second.business_idea, paraphrase)
+        self.assertEqual(second.strategic_memo, first.strategic_memo)
+        self.assertEqual(agents[0].analyze(paraphrase), first.market_analysis)
+        self.assertEqual(client.chat.completions.create.call_count, 4)
+
+
+def make_result(idea, risk_level="متوسط", confidence=0.7):
+    return AnalysisResult(
+        idea,
+        MarketAnalysis(**MARKET_PAYLOAD),
+        FinancialAnalysis(**FINANCIAL_PAYLOAD),
+        CompetitiveAnalysis(**COMPETITIVE_PAYLOAD),
+        StrategicMemo(**{**MEMO_PAYLOAD, "overall_risk_level": risk_level, "overall_confidence_score": confidence}),
+    )
+
+
+class TestAnalysisStore(unittest.TestCase):
+    
+    def setUp(self):
+        self.store = AnalysisStore(None)
+        self.ids = self.store.add_many(
+            make_result(f"مَخبزٌ رقم {i}" if i % 2 else f"تطبيق حجز رقم {i}", "عالي" if i % 3 == 0 else "متوسط")
+            for i in range(7)
+        )
+    
+    def test_keyset_pages_walk_all_rows_newest_first(self):
+        seen, before = [], None
+        while True:
+            page = self.store.page(limit=3, before=before)
+            seen.extend(item["id"] for item in page["items"])
+            before = page["next_before"]
+            if before is None:
+                break
+        self.assertEqual(seen, sorted(self.ids, reverse=True))
+        
+        high = self.store.page(risk_level="عالي")["items"]
+        self.assertEqual([item["business_idea"] for item in high], ["تطبيق حجز رقم 6", "مَخبزٌ رقم 3", "تطبيق حجز رقم 0"])
+        self.assertEqual(high[0]["strategic_memo"]["final_recommendation"], "المضي بحذر")
+    
+    def test_search_ignores_tashkeel_and_paginates(self):
+        first = self.store.search("مخبز", limit=2)
+        self.assertEqual([item["business_idea"] for item in first["items"]], ["مَخبزٌ رقم 5", "مَخبزٌ رقم 3"])
+        rest = self.store.search("مخبز", limit=2, before=first["next_before"])
+        self.assertEqual([item["business_idea"] for item in rest["items"]], ["مَخبزٌ رقم 1"])
+        self.assertIsNone(rest["next_before"])
+        # الحقول العربية في التحليلات مفهرسة أيضاً، والاستعلام لا يُفسر كصيغة FTS5
+        self.assertEqual(len(self.store.search("الطازجية")["items"]), 7)
+        self.assertEqual(self.store.search('" OR *')["items"], [])
+    
+    def test_encoded_pages_splice_stored_payloads(self):
+        self.assertEqual(json.loads(self.store.page(limit=3, encoded=True)), self.store.page(limit=3))
+        self.assertEqual(json.loads(self.store.search("مخبز", encoded=True)), self.store.search("مخبز"))
+        self.assertEqual(json.loads(self.store.search("", encoded=True)), {"items": [], "next_before": None})
+        self.assertEqual(json.loads(merge({}, b"{}", {"a": 1})), {"a": 1})
+        self.assertEqual(json.loads(merge({"a": 1}, b'{"b":2}', {"c": 3})), {"a": 1, "b": 2, "c": 3})
+
+
+class TestSingleFlight(unittest.TestCase):
+    
+    def test_concurrent_callers_share_one_run_and_its_error(self):
+        flights = SingleFlight(lock_dir=None)
+        calls, results = [], []
+        release = threading.Event()
+        
+        def slow(value):
+            calls.append(value)
+            release.wait(5)
+            if value == "سيئة":
+                raise ValueError("bad json")
+            return value
+        
+        def call(key):
+            try:
+                results.append(flights.do(key, lambda: slow(key), runs=4))
+            except ValueError as e:
+                results.append(str(e))
+        
+        threads = [threading.Thread(target=call, args=(key,)) for key in ["فكرة"] * 3 + ["سيئة"] * 2]
+        for thread in threads:
+            thread.start()
+        deadline = time.time() + 5
+        while flights.counts()["followers"] < 3 and time.time() < deadline:
+            time.sleep(0.01)
+        release.set()
+        for thread in threads:
+            thread.join()
+        
+        self.assertEqual(sorted(calls), ["سيئة", "فكرة"])
+        self.assertEqual(sorted(results), ["bad json"] * 2 + ["فكرة"] * 3)
+        self.assertEqual(flights.counts(), {
+            "leaders": 2, "followers": 3, "remote_waits": 0, "remote_results": 0, "agent_runs_saved": 12,
+        })
+        self.assertEqual(flights.stats()["in_flight"], 0)
+        # بعد انتهاء التشغيل يبدأ الطلب التالي تشغيلاً جديداً
+        self.assertEqual(flights.do("فكرة", lambda: "ثانية"), "ثانية")
+    
+    @unittest.skipIf(sys.platform == "win32", "fcntl غير متاح")
+    def test_other_process_holding_the_idea_is_waited_for(self):
+        with tempfile.TemporaryDirectory() as lock_dir:
+            holder = subprocess.Popen(
+                [sys.executable, "-c",
+                 "import sys, time; from singleflight import SingleFlight; "
+                 "flight = SingleFlight(sys.argv[1]).join('فكرة'); flight.acquire_process_lock(); "
+                 "print('locked', flush=True); time.sleep(0.5); flight.finish('done')",
+                 lock_dir],
+                stdout=subprocess.PIPE, text=True, cwd=os.path.dirname(os.path.abspath(__file__)),
+            )
+            try:
+                self.assertEqual(holder.stdout.readline().strip(), "locked")
+                flights = SingleFlight(lock_dir)
+                started = time.monotonic()
+                waited = flights.do("فكرة", lambda: time.monotonic() - started)
+            finally:
+                holder.wait(5)
+                holder.stdout.close()
+        
+        self.assertGreater(waited, 0.2)
+        self.assertEqual(flights.counts()["remote_waits"], 1)
+    
+    @unittest.skipIf(sys.platform == "win32", "fcntl غير متاح")
+    def test_waiting_process_reuses_the_published_result(self):
+        client = Mock()
+        stage = DivergenceStage(
+            MarketLogicAgent(client), FinancialSustainabilityAgent(client), CompetitiveDurabilityAgent(client)
+        )
+        pipeline = AnalysisPipeline(stage, StrategicSynthesizerAgent(client))
+        result = make_result("مخبز منزلي")
+        self.assertEqual(pipeline.decode_shared(pipeline.encode_shared(result)), result)
+        
+        with tempfile.TemporaryDirectory() as lock_dir:
+            holder = subprocess.Popen(
+                [sys.executable, "-c",
+                 "import sys, time; from singleflight import SingleFlight; "
+                 "flight = SingleFlight(sys.argv[1]).join('فكرة'); flight.acquire_process_lock(); "
+                 "print('locked', flush=True); time.sleep(0.3); flight.finish('done', published=b'\"done\"')",
+                 lock_dir],
+                stdout=subprocess.PIPE, text=True, cwd=os.path.dirname(os.path.abspath(__file__)),
+            )
+            try:
+                self.assertEqual(holder.stdout.readline().strip(), "locked")
+                flights = SingleFlight(lock_dir)
+                shared = flights.do("فكرة", lambda: "rerun", runs=4, decode=json.loads)
+            finally:
+                holder.wait(5)
+                holder.stdout.close()
+            # نتيجة منشورة قبل بدء الانتظار لا تُستخدم
+            self.assertEqual(flights.do("فكرة", lambda: "rerun", runs=4, decode=json.loads), "rerun")
+        
+        pipeline.scheduler.shutdown()
+        self.assertEqual(shared, "done")
+        self.assertEqual(client.chat.completions.create.call_count, 0)
+        counts = flights.counts()
+        self.assertEqual((counts["remote_results"], counts["agent_runs_saved"]), (1, 4))
+
+
+class TestAdmission(unittest.TestCase):
+    
+    def test_interactive_lane_is_admitted_before_earlier_bulk_requests(self):
+        controller = AdmissionController(max_concurrency=1, min_concurrency=1, initial_latency=0.1)
+        first = controller.acquire("bulk")
+        admitted = []
+        
+        def wait_for(lane):
+            ticket = controller.acquire(lane)
+            admitted.append(lane)
+            ticket.release()
+        
+        bulk = threading.Thread(target=wait_for, args=("bulk",))
+        bulk.start()
+        while controller.counts()["queued_bulk"] < 1:
+            time.sleep(0.01)
+        interactive = threading.Thread(target=wait_for, args=("interactive",))
+        interactive.start()
+        while controller.counts()["queued_interactive"] < 1:
+            time.sleep(0.01)
+        first.release()
+        bulk.join(5)
+        interactive.join(5)
+        
+        self.assertEqual(admitted, ["interactive", "bulk"])
+        self.assertEqual(controller.snapshot()["admitted"], {"interactive": 1, "bulk": 2})
+        self.assertIn('admission_queue_wait_seconds_count{lane="interactive"}', metrics.render())
+    
+    def test_requests_that_cannot_meet_their_deadline_are_rejected_fast(self):
+        controller = AdmissionController(
+            max_concurrency=2, min_concurrency=2, queue_size=1, initial_latency=4.0,
+            deadlines={"interactive": 20.0, "bulk": 6.0},
+        )
+        # bulk لا يتجاوز نصف الحد، فالمكان الثاني يبقى للواجهة
+        held = [controller.acquire("bulk"), controller.acquire("interactive")]
+        started = time.monotonic()
+        with self.assertRaises(Rejected) as rejected:
+            controller.acquire("bulk")
+        self.assertLess(time.monotonic() - started, 0.5)
+        self.assertEqual((rejected.exception.reason, rejected.exception.retry_after), ("deadline", 4.0))
+        
+        waiting = threading.Thread(target=lambda: controller.acquire("interactive").release())
+        waiting.start()
+        while controller.counts()["queued_interactive"] < 1:
+            time.sleep(0.01)
+        with self.assertRaises(Rejected) as full:
+            controller.acquire("interactive")
+        self.assertEqual(full.exception.reason, "queue_full")
+        for ticket in held:
+            ticket.release()
+        waiting.join(5)
+        self.assertEqual(controller.snapshot()["rejected"], {"bulk:deadline": 1, "interactive:queue_full": 1})
+        self.assertIn('admission_rejected_total{lane="bulk",reason="deadline"}', metrics.render())
+    
+    def test_limit_shrinks_when_latency_rises_and_recovers(self):
+        controller = AdmissionController(max_concurrency=8, min_concurrency=2)
+        for seconds in [1.0] * 20 + [5.0] * 10:
+            controller._release(controller.acquire("interactive"), seconds)
+        shrunk = controller.counts()["limit"]
+        self.assertLess(shrunk, 8)
+        self.assertGreaterEqual(shrunk, 2)
+        for _ in range(200):
+            controller._release(controller.acquire("interactive"), 1.0)
+        self.assertGreater(controller.counts()["limit"], shrunk)
+    
+    def test_runs_without_model_calls_do_not_lower_the_baseline(self):
+        controller = AdmissionController(max_concurrency=8, min_concurrency=2)
+        for _ in range(20):
+            controller._release(controller.acquire("interactive"), 1.0)
+        # إصابات الذاكرة المؤقتة تكتمل فوراً؛ لو قيست لصار كل تحليل حقيقي "بطيئاً"
+        for _ in range(50):
+            controller.acquire("interactive").release(observe=False)
+        for _ in range(10):
+            controller._release(controller.acquire("interactive"), 1.0)
+        self.assertEqual(controller.counts()["limit"], 8)
+        self.assertEqual(controller.snapshot()["latency_seconds"], 1.0)
+
+
+class TestJobQueue(unittest.TestCase):
+    
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmpdir.name, "jobs.sqlite3")
+    
+    def tearDown(self):
+        self.tmpdir.cleanup()
+    
+    def test_workers_run_jobs_and_report_stage_progress(self):
+        pipeline = Mock()
+        
+        # عقدة مسجلة إضافية (risk) تظهر مرحلةً في حالة المهمة
+        pipeline.registry.outputs.return_value = ["market", "financial", "competitive", "risk", "synthesis"]
+        request_ids, synthesis_states = [], []
+        
+        def run(idea, on_complete, request_id=None, admit=None):
+            request_ids.append(request_id)
+            if idea == "سيئة":
+                raise ValueError("bad json")
+            for name in ("market", "financial", "competitive", "risk", "synthesis"):
+                on_complete(name, None)
+                synthesis_states.append(queue.store.get(request_id)["stages"]["synthesis"])
+            return make_result(idea)
+        
+        pipeline.run.side_effect = run
+        history = AnalysisStore(None)
+        queue = JobQueue(JobStore(self.path), pipeline, history=history, workers=2, poll_interval=0.01)
+        ok, bad = queue.submit("فكرة"), queue.submit("سيئة")
+        self.assertEqual(queue.stats()["queue_depth"], 2)
+        
+        queue.start()
+        deadline = time.time() + 5
+        while queue.stats()["succeeded"] + queue.stats()["failed"] < 2 and time.time() < deadline:
+            time.sleep(0.01)
+        queue.stop()
+        
+        job = queue.store.get(ok)
+        self.assertEqual(job["status"], "succeeded")
+        self.assertEqual(list(job["stages"]), ["market", "financial", "competitive", "risk", "synthesis"])
+        self.assertEqual(set(job["stages"].values()), {"done"})
+        # التوليف يبدأ بعد آخر تحليل، ولا يعود إلى running بعد اكتماله
+        self.assertEqual(synthesis_states, ["pending", "pending", "pending", "running", "done"])
+        self.assertEqual(job["result"]["strategic_memo"]["final_recommendation"], "المضي بحذر")
+        self.assertEqual(history.get(job["history_id"])["business_idea"], "فكرة")
+        self.assertEqual(queue.store.get(bad)["error"], "bad json")
+        # معرف المهمة معرف نقاط الحفظ، فالمهمة المستعادة تكمل من حيث توقفت
+        self.assertEqual(sorted(request_ids), sorted([ok, bad]))
+    
+    def test_job_of_a_dead_worker_is_reclaimed_after_restart(self):
+        store = JobStore(self.path, lease_seconds=60)
+        job_id = store.create("فكرة")
+        self.assertEqual(store.claim()["id"], job_id)
+        self.assertIsNone(store.claim())
+        
+        # عملية جديدة على نفس الملف بعد انتهاء مهلة العامل الأول
+        with patch('jobs.time.time', return_value=time.time() + 120):
+            restarted = JobStore(self.path, lease_seconds=60)
+            self.assertEqual(restarted.claim()["id"], job_id)
+        self.assertEqual(restarted.get(job_id)["attempts"], 2)
+
+
+class TestFlaskApp(unittest.TestCase):
+    
+    def setUp(self):
+        with patch.dict('os.environ', {'OPENAI_API_KEY': 'test_key', 'RESULT_CACHE_PATH': '', 'HISTORY_DB_PATH': '', 'JOBS_DB_PATH': '', 'CHECKPOINT_DB_PATH': '', 'SINGLE_FLIGHT_LOCK_DIR': ''}):
+            import app as app_module
+            # المكونات تُبنى عند أول وصول، فتُبنى هنا ضمن متغيرات البيئة الاختبارية
+            app_module.services.analysis_history = app_module.services.job_queue.history = AnalysisStore(None)
+        app_module.result_cache.clear()
+        app_module.similar_ideas.clear()
+        self.app_module = app_module
+        self.client = app_module.app.test_client()
+    
+    def test_analyze_requires_idea(self):
+        response = self.client.post('/analyze', json={})
+        self.assertEqual(response.status_code, 400)
+    
+    def test_analyze_returns_all_sections(self):
+        checkpoints = self.app_module.services.checkpoints.stats()
+        similar_hits = self.client.get('/cache/stats').get_json()["similar_ideas"]["hits"]
+        async_client = Mock()
+        async_client.chat.completions.create = AsyncMock(side_effect=payload_for_prompt)
+        agents = [
+            self.app_module.market_agent,
+            self.app_module.financial_agent,
+            self.app_module.competitive_agent,
+            self.app_module.synthesizer,
+        ]
+        with patch.multiple(agents[0], async_client=async_client), \
+             patch.multiple(agents[1], async_client=async_client), \
+             patch.multiple(agents[2], async_client=async_client), \
+             patch.multiple(agents[3], async_client=async_client):
+            response = self.client.post('/analyze', json={"idea": "فكرة"})
+        
+        self.assertEqual(response.status_code, 200)
+        body = response.get_json()
+        self.assertEqual(body["status"], "success")
+        self.assertEqual(body["market_analysis"]["market_demand"], "طلب مرتفع")
+        self.assertEqual(body["strategic_memo"]["final_recommendation"], "المضي بحذر")
+        self.assertEqual(async_client.chat.completions.create.await_count, 4)
+        shared = self.client.get(body["result_url"]).get_json()
+        self.assertEqual(shared["business_idea"], "فكرة")
+        self.assertEqual(shared["strategic_memo"], body["strategic_memo"])
+        
+        with patch.multiple(agents[0], async_client=async_client), \
+             patch.multiple(agents[1], async_client=async_client), \
+             patch.multiple(agents[2], async_client=async_client), \
+             patch.multiple(agents[3], async_client=async_client):
+            cached = self.client.post('/analyze', json={"idea": "  فكرة "})
+        
+        cached_body = cached.get_json()
+        self.assertEqual(cached_body.pop("history_id"), body.pop("history_id") + 1)
+        # نص الفكرة جزء من الوثيقة، فإعادة الصياغة تأخذ عنواناً خاصاً بها
+        self.assertNotEqual(cached_body.pop("result_url"), body.pop("result_url"))
+        # بلا request_id ولا Idempotency-Key لا معرف ولا نقاط حفظ
+        self.assertIsNone(body.pop("request_id"))
+        self.assertIsNone(cached_body.pop("request_id"))
+        self.assertEqual(self.app_module.services.checkpoints.stats(), checkpoints)
+        self.assertEqual(cached_body, body)
+        self.assertEqual(async_client.chat.completions.create.await_count, 4)
+        # إعادة الصياغة تُخدم من فهرس الأفكار شبه المطابقة قبل الذاكرة المؤقتة
+        self.assertEqual(self.client.get('/cache/stats').get_json()["similar_ideas"]["hits"] - similar_hits, 1)
+
+    def test_failed_synthesis_retry_reruns_only_synthesis(self):
+        memo_replies = iter(["ليس JSON", json.dumps(MEMO_PAYLOAD, ensure_ascii=False)])
+        
+        def reply(**kwargs):
+            response = payload_for_prompt(**kwargs)
+            if "General Partner" in kwargs["messages"][0]["content"]:
+                response.choices[0].message.content = next(memo_replies)
+            return response
+        
+        async_client = Mock()
+        async_client.chat.completions.create = AsyncMock(side_effect=reply)
+        agents = [
+            self.app_module.market_agent,
+            self.app_module.financial_agent,
+            self.app_module.competitive_agent,
+            self.app_module.synthesizer,
+        ]
+        request = {"idea": "مطعم صحي", "include_metrics": True}
+        headers = {"Idempotency-Key": "retry-1"}
+        with patch.multiple(agents[0], async_client=async_client), \
+             patch.multiple(agents[1], async_client=async_client), \
+             patch.multiple(agents[2], async_client=async_client), \
+             patch.multiple(agents[3], async_client=async_client):
+            failed = self.client.post('/analyze', json=request, headers=headers)
+            # الذاكرة المؤقتة للنتائج لا تخفي الاستعادة: التحليلات الثلاثة تأتي من نقاط الحفظ
+            self.app_module.result_cache.clear()
+            retried = self.client.post('/analyze', json=request, headers=headers)
+        
+        self.assertEqual(failed.status_code, 500)
+        self.assertEqual(failed.get_json()["request_id"], "retry-1")
+        self.assertEqual(failed.get_json()["completed_stages"], ["competitive", "financial", "market"])
+        self.assertEqual(retried.status_code, 200)
+        body = retried.get_json()
+        self.assertEqual(body["strategic_memo"]["final_recommendation"], "المضي بحذر")
+        self.assertEqual(body["market_analysis"], MARKET_PAYLOAD)
+        self.assertEqual(async_client.chat.completions.create.await_count, 5)
+        self.assertEqual(sorted(body["metrics"]["restored_stages"]), ["competitive", "financial", "market"])
+        self.assertEqual(body["metrics"]["reexecuted_stages"], ["synthesis"])
+        self.assertIn('pipeline_stages_reexecuted_total{node="synthesis"}', metrics.render())
+        # الطلب اكتمل: نقاطه لم تعد لازمة
+        self.assertEqual(self.app_module.services.checkpoints.attempts("retry-1"), 0)
+    
+    def test_concurrent_identical_requests_share_one_pipeline_run(self):
+        async def slow_reply(**kwargs):
+            await asyncio.sleep(0.2)
+            return payload_for_prompt(**kwargs)
+        
+        async_client = Mock()
+        async_client.chat.completions.create = AsyncMock(side_effect=slow_reply)
+        agents = [
+            self.app_module.market_agent,
+            self.app_module.financial_agent,
+            self.app_module.competitive_agent,
+            self.app_module.synthesizer,
+        ]
+        before = self.app_module.single_flight.counts()
+        admitted = self.app_module.services.admission.snapshot()["admitted"]["bulk"]
+        responses = []
+        
+        def post(idea):
+            responses.append(self.app_module.app.test_client().post('/analyze', json={"idea": idea}))
+        
+        with patch.multiple(agents[0], async_client=async_client), \
+             patch.multiple(agents[1], async_client=async_client), \
+             patch.multiple(agents[2], async_client=async_client), \
+             patch.multiple(agents[3], async_client=async_client):
+            threads = [threading.Thread(target=post, args=(idea,)) for idea in ["مقهى متنقل", "مقهى  متنقل ", "مقهى متنقل"]]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+        
+        self.assertEqual([response.status_code for response in responses], [200] * 3)
+        bodies = [response.get_json() for response in responses]
+        self.assertEqual(len({json.dumps(body["strategic_memo"]) for body in bodies}), 1)
+        self.assertEqual(async_client.chat.completions.create.await_count, 4)
+        after = self.client.get('/cache/stats').get_json()["single_flight"]
+        self.assertEqual(after["leaders"] - before["leaders"], 1)
+        self.assertEqual(after["followers"] - before["followers"], 2)
+        self.assertEqual(after["agent_runs_saved"] - before["agent_runs_saved"], 8)
+        # القائد وحده حجز مكان قبول، والتابعان لم يحجزا
+        self.assertEqual(self.app_module.services.admission.snapshot()["admitted"]["bulk"] - admitted, 1)
+    
+    def test_analyze_is_rejected_with_retry_after_when_saturated(self):
+        original = self.app_module.services.admission
+        self.app_module.services.admission = AdmissionController(
+            max_concurrency=1, min_concurrency=1, initial_latency=30.0, deadlines={"bulk": 10.0, "interactive": 10.0},
+        )
+        self.addCleanup(setattr, self.app_module.services, "admission", original)
+        held = self.app_module.services.admission.acquire("interactive")
+        known = make_result("مخبز منزلي في جدة يبيع الخبز الطازج")
+        self.app_module.similar_ideas.add(known.business_idea, known)
+        try:
+            response = self.client.post('/analyze', json={"idea": "فكرة في الذروة"})
+            stream = self.client.post('/analyze/stream', json={"idea": "فكرة في الذروة"})
+            # فكرة شبه مطابقة لا تستدعي النماذج فلا تحتاج مكاناً
+            similar = self.client.post('/analyze', json={"idea": known.business_idea})
+            similar_stream = self.client.post('/analyze/stream', json={"idea": known.business_idea})
+            similar_events = similar_stream.get_data(as_text=True)
+        finally:
+            held.release()
+        
+        self.assertEqual(response.status_code, 429)
+        self.assertEqual(response.headers["Retry-After"], "30")
+        self.assertEqual(response.get_json()["reason"], "deadline")
+        self.assertEqual(stream.status_code, 429)
+        self.assertEqual(similar.status_code, 200)
+        self.assertEqual(similar.get_json()["strategic_memo"]["final_recommendation"], "المضي بحذر")
+        self.assertIn('"similar": true', similar_events)
+        state = self.client.get('/admission').get_json()
+        self.assertEqual(state["rejected"], {"bulk:deadline": 1, "interactive:deadline": 1})
+        self.assertEqual(state["running"], {"interactive": 0, "bulk": 0})
+    
+    def test_results_are_immutable_and_conditional(self):
+        result = make_result("مخبز في جدة")
+        # جسم أكبر من MIN_SIZE حتى يُضغط عند الطلب
+        result.strategic_memo.executive_summary *= 40
+        self.app_module.services.analysis_history.add(result)
+        url = f"/results/{result.content_hash}"
+        self.assertEqual(result.url, url)
+        
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data, result.document())
+        self.assertEqual(response.headers["ETag"], f'"{result.content_hash}"')
+        self.assertIn("immutable", response.headers["Cache-Control"])
+        
+        revalidated = self.client.get(url, headers={"If-None-Match": response.headers["ETag"]})
+        self.assertEqual(revalidated.status_code, 304)
+        self.assertEqual(revalidated.data, b"")
+        compressed = self.client.get(url, headers={"Accept-Encoding": "gzip"})
+        self.assertEqual(compressed.headers["ETag"], f'"{result.content_hash}-gzip"')
+        self.assertEqual(self.client.get(url, headers={"If-None-Match": compressed.headers["ETag"]}).status_code, 304)
+        
+        self.assertEqual(self.client.get("/results/0123456789abcdef").status_code, 404)
+        # بصمة غير مخزنة (أو بشكل خاطئ) لا تعطي 304 يُخزن سنة حتى لو طابقها If-None-Match
+        for missing in ("f" * 32, "not-a-hash"):
+            response = self.client.get(f"/results/{missing}", headers={"If-None-Match": f'"{missing}"'})
+            self.assertEqual(response.status_code, 404)
+            self.assertNotIn("immutable", response.headers.get("Cache-Control", ""))
+        # نفس الأقسام لفكرة أخرى وثيقة أخرى بعنوان آخر
+        self.assertNotEqual(result.for_idea("مخبز في مكة").content_hash, result.content_hash)
+        self.assertEqual(self.client.get('/history').get_json()["items"][0]["result_url"], url)
+    
+    def test_json_responses_are_compressed_on_request(self):
+        history = self.app_module.services.analysis_history
+        history.add_many(make_result(f"مخبز رقم {i}", "متوسط") for i in range(3))
+        plain_response = self.client.get('/history')
+        self.assertNotIn("Content-Encoding", plain_response.headers)
+        self.assertIn("مخبز", plain_response.get_data(as_text=True))
+        
+        compressed = self.client.get('/history', headers={"Accept-Encoding": "gzip, deflate"})
+        self.assertEqual(compressed.headers["Content-Encoding"], "gzip")
+        self.assertEqual(compressed.headers["Vary"], "Accept-Encoding")
+        self.assertEqual(json.loads(gzip.decompress(compressed.data)), plain_response.get_json())
+        self.assertLess(len(compressed.data), len(plain_response.data))
+        
+        self.assertIsNone(negotiate("gzip;q=0, identity"))
+        self.assertEqual(negotiate("*"), negotiate("br, gzip"))
+    
+    def test_jobs_return_immediately_and_expose_result(self):
+        async_client = Mock()
+        async_client.chat.completions.create = AsyncMock(side_effect=payload_for_prompt)
+        agents = [
+            self.app_module.market_agent,
+            self.app_module.financial_agent,
+            self.app_module.competitive_agent,
+            self.app_module.synthesizer,
+        ]
+        with patch.multiple(agents[0], async_client=async_client), \
+             patch.multiple(agents[1], async_client=async_client), \
+             patch.multiple(agents[2], async_client=async_client), \
+             patch.multiple(agents[3], async_client=async_client):
+            response = self.client.post('/jobs', json={"idea": "فكرة في الطابور"})
+            self.assertEqual(response.status_code, 202)
+            location = response.headers["Location"]
+            deadline = time.time() + 5
+            while self.client.get(location).get_json()["status"] in ("queued", "running") and time.time() < deadline:
+                time.sleep(0.01)
+        
+        job = self.client.get(location).get_json()
+        self.assertEqual(job["status"], "succeeded")
+        self.assertEqual(job["result"]["market_analysis"]["market_demand"], "طلب مرتفع")
+        self.assertEqual(self.client.get('/history').get_json()["items"][0]["id"], job["history_id"])
+        self.assertEqual(self.client.get('/jobs/missing').status_code, 404)
+        self.assertIn('# TYPE job_workers gauge', self.client.get('/metrics').get_data(as_text=True))
+
+    def test_history_lists_and_searches_saved_analyses(self):
+        self.app_module.services.analysis_history.add_many([make_result("منصة لتوصيل القهوة"), make_result("متجر كتب")])
+        
+        page = self.client.get('/history?limit=1').get_json()
+        self.assertEqual(page["items"][0]["business_idea"], "متجر كتب")
+        older = self.client.get(f'/history?limit=1&before={page["next_before"]}').get_json()
+        self.assertEqual(older["items"][0]["business_idea"], "منصة لتوصيل القهوة")
+        
+        found = self.client.get('/history/search', query_string={"q": "مِنصّة"}).get_json()
+        self.assertEqual([item["business_idea"] for item in found["items"]], ["منصة لتوصيل القهوة"])
+        self.assertEqual(self.client.get('/history/search').status_code, 400)
+
+    def test_analyze_attaches_request_metrics_and_exports_prometheus(self):
+        def with_usage(**kwargs):
+            response = payload_for_prompt(**kwargs)
+            response.usage = Mock(prompt_tokens=100, completion_tokens=50, total_tokens=150,
+                                  prompt_tokens_details=Mock(cached_tokens=0))
+            return response
+
+        async_client = Mock()
+        async_client.chat.completions.create = AsyncMock(side_effect=with_usage)
+        agents = [
+            self.app_module.market_agent,
+            self.app_module.financial_agent,
+            self.app_module.competitive_agent,
+            self.app_module.synthesizer,
+        ]
+        with patch.multiple(agents[0], async_client=async_client), \
+             patch.multiple(agents[1], async_client=async_client), \
+             patch.multiple(agents[2], async_client=async_client), \
+             patch.multiple(agents[3], async_client=async_client):
+            body = self.client.post('/analyze', json={"idea": "فكرة للقياس", "include_metrics": True}).get_json()
+
+        request_metrics = body["metrics"]
+        self.assertEqual(set(request_metrics["phases_seconds"]), {"similar_lookup", "divergence", "synthesis"})
+        self.assertEqual(len(request_metrics["agents_seconds"]), 4)
+        self.assertEqual(request_metrics["tokens"]["gpt-4o-mini"], {"prompt": 300, "completion": 150, "cached": 0})
+        self.assertEqual(request_metrics["tokens"]["gpt-4o"]["prompt"], 100)
+        self.assertGreater(request_metrics["cost_usd"], 0)
+
+        exported = self.client.get('/metrics').get_data(as_text=True)
+        self.assertIn('# TYPE pipeline_phase_seconds histogram', exported)
+        self.assertIn('pipeline_phase_seconds_count{phase="synthesis"}', exported)
+        self.assertIn('llm_tokens_total{model="gpt-4o-mini",kind="completion"}', exported)
+
+    
+    def test_analyze_stream_emits_agent_events_then_memo(self):
+        def create(**kwargs):
+            if kwargs.get("stream"):
+                return fake_stream(MEMO_PAYLOAD)
+            return payload_for_prompt(**kwargs)
+        
+        sync_client = Mock()
+        sync_client.chat.completions.create.side_effect = create
+        agents = [
+            self.app_module.market_agent,
+            self.app_module.financial_agent,
+            self.app_module.competitive_agent,
+            self.app_module.synthesizer,
+        ]
+        with patch.multiple(agents[0], client=sync_client), \
+             patch.multiple(agents[1], client=sync_client), \
+             patch.multiple(agents[2], client=sync_client), \
+             patch.multiple(agents[3], client=sync_client):
+            response = self.client.post('/analyze/stream', json={"idea": "فكرة للبث"})
+            body = response.get_data(as_text=True)
+        
+        self.assertEqual(response.mimetype, "text/event-stream")
+        events = [
+            block.split("\n")[0][len("event: "):]
+            for block in body.split("\n\n")
+            if block.startswith("event: ")
+        ]
+        self.assertEqual(
+            sorted(events[:3]),
+            ["competitive_analysis", "financial_analysis", "market_analysis"],
+        )
+        self.assertIn("memo_token", events)
+        self.assertEqual(events[-2:], ["strategic_memo", "done"])
+
+
+
+class TestBulkAnalysis(unittest.TestCase):
+    
+    def setUp(self):
+        with patch.dict('os.environ', {'OPENAI_API_KEY': 'test_key'}):
+            self.orchestrator = AIConsultantOrchestrator(cache=ResultCache(path=None), history=AnalysisStore(None))
+        self.active = 0
+        self.peak = 0
+        
+        async def fake_run_async(idea, on_complete=None):
+            self.active += 1
+            self.peak = max(self.peak, self.active)
+            await asyncio.sleep(float(idea))
+            self.active -= 1
+            if idea == "0.03":
+                raise ValueError("bad json")
+            return f"memo-{idea}"
+        
+        self.orchestrator.pipeline.run_async = fake_run_async
+    
+    def test_analyze_many_yields_in_completion_order_with_bounded_concurrency(self):
+        ideas = ["0.2", "0.01", "0.1", "0.02"]
+        results = list(self.orchestrator.analyze_many(ideas, max_concurrency=2))
+        
+        self.assertEqual([index for index, _ in results], [1, 2, 3, 0])
+        self.assertEqual(results[0][1], "memo-0.01")
+        self.assertEqual(self.peak, 2)
+    
+    def test_analyze_many_return_exceptions(self):
+        results = dict(self.orchestrator.analyze_many(["0.01", "0.03"], return_exceptions=True))
+        self.assertEqual(results[0], "memo-0.01")
+        self.assertIsInstance(results[1], ValueError)
+        
+        with self.assertRaises(ValueError):
+            list(self.orchestrator.analyze_many(["0.03"]))
+
+
+class TestCli(unittest.TestCase):
+    
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.input_path = os.path.join(self.tmpdir.name, "ideas.jsonl")
+        self.output_path = os.path.join(self.tmpdir.name, "memos.jsonl")
+        with open(self.input_path, "w", encoding="utf-8") as f:
+            f.write(json.dumps({"id": "a", "idea": "فكرة أ"}, ensure_ascii=False) + "\n")
+            f.write(json.dumps("فكرة ب", ensure_ascii=False) + "\n")
+            f.write("\n")
+            f.write("فكرة ج\n")
+    
+    def tearDown(self):
+        self.tmpdir.cleanup()
+    
+    def test_read_ideas_accepts_objects_strings_and_plain_lines(self):
+        with open(self.input_path, encoding="utf-8") as f:
+            records = list(cli.read_ideas(f))
+        self.assertEqual([r["id"] for r in records], ["a", "2", "4"])
+        self.assertEqual(records[2]["idea"], "فكرة ج")
+    
+    def test_invalid_lines_get_error_records_without_stopping_the_run(self):
+        with open(self.input_path, "a", encoding="utf-8") as f:
+            f.write("2024\n")
+            f.write('["a"]\n')
+            f.write(json.dumps({"id": "x", "text": "بلا فكرة"}, ensure_ascii=False) + "\n")
+            f.write("فكرة د\n")
+        
+        def fake_analyze_many(ideas, max_concurrency, return_exceptions):
+            for index, idea in enumerate(ideas):
+                yield index, Mock(to_dict=lambda: {"strategic_memo": {}})
+        
+        with patch('orchestrator.AIConsultantOrchestrator') as orchestrator_cls, \
+             patch.dict('os.environ', {'HISTORY_DB_PATH': ''}):
+            orchestrator_cls.return_value.analyze_many.side_effect = fake_analyze_many
+            exit_code = cli.main(["analyze", self.input_path, "-o", self.output_path])
+        
+        self.assertEqual(exit_code, 1)
+        with open(self.output_path, encoding="utf-8") as f:
+            lines = {line["id"]: line for line in map(json.loads, f)}
+        # JSON ليس كائناً يُحلل كنص السطر
+        self.assertEqual((lines["5"]["idea"], lines["5"]["status"]), ("2024", "success"))
+        self.assertEqual((lines["6"]["idea"], lines["6"]["status"]), ('["a"]', "success"))
+        self.assertEqual(lines["x"]["status"], "error")
+        self.assertEqual((lines["8"]["idea"], lines["8"]["status"]), ("فكرة د", "success"))
+    
+    def test_resume_skips_completed_and_drops_partial_line(self):
+        with open(self.output_path, "w", encoding="utf-8") as f:
+            f.write(json.dumps({"id": "a", "status": "success"}) + "\n")
+            f.write(json.dumps({"id": "2", "status": "error"}) + "\n")
+            f.write('{"id": "4", "status": "succ')
+        
+        submitted = []
+        
+        def fake_analyze_many(ideas, max_concurrency, return_exceptions):
+            for index, idea in enumerate(ideas):
+                submitted.append(idea)
+                yield index, Mock(to_dict=lambda: {"strategic_memo": {}})
+        
+        with patch('orchestrator.AIConsultantOrchestrator') as orchestrator_cls, \
+             patch.dict('os.environ', {'HISTORY_DB_PATH': ''}):
+            orchestrator_cls.return_value.analyze_many.side_effect = fake_analyze_many
+            exit_code = cli.main(["analyze", self.input_path, "-o", self.output_path])
+        
+        self.assertEqual(exit_code, 0)
+        self.assertEqual(submitted, ["فكرة ب", "فكرة ج"])
+        with open(self.output_path, encoding="utf-8") as f:
+            lines = [json.loads(line) for line in f]
+        self.assertEqual([line["id"] for line in lines], ["a", "2", "2", "4"])
+        self.assertEqual(cli.load_completed_ids(self.output_path), {"a", "2", "4"})
+        # نتائج الدفعة تُحفظ في السجل بإدراج واحد مجمع
+        self.assertEqual(orchestrator_cls.return_value.history.add_many.call_count, 1)
+
+    
+    def _answer_batch(self, requests_path, output_path, fail=()):
+        """محاكاة المزود: تحويل ملف طلبات الدفعة إلى ملف نتائج"""
+        with open(requests_path, encoding="utf-8") as src, open(output_path, "w", encoding="utf-8") as dst:
+            for line in src:
+                request = json.loads(line)
+                if request["custom_id"] in fail:
+                    result = {"custom_id": request["custom_id"], "response": None,
+                              "error": {"code": "server_error", "message": "boom"}}
+                else:
+                    content = payload_for_prompt(**request["body"]).choices[0].message.content
+                    body = {"choices": [{"message": {"role": "assistant", "content": content}}]}
+                    result = {"custom_id": request["custom_id"],
+                              "response": {"status_code": 200, "body": body}, "error": None}
+                dst.write(json.dumps(result, ensure_ascii=False) + "\n")
+    
+    def test_batch_mode_end_to_end_with_local_files(self):
+        paths = {name: os.path.join(self.tmpdir.name, f"{name}.jsonl")
+                 for name in ("div_req", "div_out", "syn_req", "syn_out")}
+        
+        with patch.dict('os.environ', {'RESULT_CACHE_PATH': '', 'HISTORY_DB_PATH': ''}):
+            cli.main(["batch-compile", self.input_path, "-o", paths["div_req"]])
+            with open(paths["div_req"], encoding="utf-8") as f:
+                requests = [json.loads(line) for line in f]
+            self.assertEqual(len(requests), 9)
+            self.assertEqual(requests[0]["url"], "/v1/chat/completions")
+            self.assertEqual(requests[0]["body"]["model"], "gpt-4o-mini")
+            
+            self._answer_batch(paths["div_req"], paths["div_out"], fail={"4:financial"})
+            cli.main(["batch-synthesize", self.input_path, paths["div_out"], "-o", paths["syn_req"]])
+            with open(paths["syn_req"], encoding="utf-8") as f:
+                synthesis_requests = [json.loads(line) for line in f]
+            self.assertEqual([r["custom_id"] for r in synthesis_requests], ["a:synthesis", "2:synthesis"])
+            self.assertEqual(synthesis_requests[0]["body"]["model"], "gpt-4o")
+            
+            self._answer_batch(paths["syn_req"], paths["syn_out"])
+            exit_code = cli.main([
+                "batch-ingest", self.input_path, paths["div_out"], paths["syn_out"], "-o", self.output_path
+            ])
+        
+        self.assertEqual(exit_code, 1)
+        with open(self.output_path, encoding="utf-8") as f:
+            lines = [json.loads(line) for line in f]
+        self.assertEqual([line["status"] for line in lines], ["success", "success", "error"])
+        self.assertEqual(lines[0]["strategic_memo"]["final_recommendation"], "المضي بحذر")
+        self.assertEqual(lines[1]["competitive_analysis"]["risk_level"], "عالي")
+        self.assertIn("boom", lines[2]["message"])
 
 
 if __name__ == '__main__':